@@ -0,0 +1,127 @@
+# activity_log.py - Fixed-capacity activity log with a virtualized Kivy view
+#
+# Entries live in a ring buffer so memory stays bounded during long monitoring
+# sessions, and optionally spill to a rotating log file. ActivityLogView renders
+# them through a RecycleView so only the visible rows get a texture.
+import logging
+import logging.handlers
+import threading
+import time
+from collections import deque
+
+from kivy.clock import Clock
+from kivy.metrics import dp, sp
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+
+# CONFIG - Defaults for the in-memory buffer and the optional spill file
+DEFAULT_CAPACITY = 1000
+LOG_FILE_MAX_BYTES = 512 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+class ActivityLog:
+    """Ring buffer of timestamped log lines with listener callbacks"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, log_file=None):
+        self.entries = deque(maxlen=capacity)
+        self.total = 0                  # Entries ever added (including evicted ones)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._file_logger = None
+        if log_file:
+            self._file_logger = logging.getLogger(f"activity_log.{id(self)}")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._file_logger.addHandler(handler)
+
+    @property
+    def capacity(self):
+        return self.entries.maxlen
+
+    def add(self, message):
+        """Append a timestamped entry; O(1) regardless of how many were added before"""
+        entry = f"[{time.strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            self.entries.append(entry)
+            self.total += 1
+            listeners = list(self._listeners)
+        if self._file_logger:
+            self._file_logger.info(message)
+        for listener in listeners:
+            listener(entry)
+        return entry
+
+    def bind(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.entries)
+
+
+class LogRow(Label):
+    """Single log line; wraps to the row width and aligns left"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = 'left'
+        self.valign = 'middle'
+        self.bind(size=self._update_text_size)
+
+    def _update_text_size(self, *args):
+        self.text_size = (self.width, None)
+
+
+class ActivityLogView(RecycleView):
+    """RecycleView over an ActivityLog; new entries are flushed once per frame"""
+
+    def __init__(self, activity_log, color=(0.7, 0.7, 0.7, 1), font_size=sp(14), **kwargs):
+        super().__init__(**kwargs)
+        self.activity_log = activity_log
+        self.row_color = color
+        self.row_font_size = font_size
+        self.viewclass = LogRow
+
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, dp(22)),
+            default_size_hint=(1, None),
+            size_hint_y=None
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_trigger = Clock.create_trigger(self._flush, -1)
+
+        self.data = [self._row(entry) for entry in activity_log.snapshot()]
+        activity_log.bind(self._on_entry)
+
+    def _row(self, entry):
+        return {'text': entry, 'color': self.row_color, 'font_size': self.row_font_size}
+
+    def _on_entry(self, entry):
+        with self._pending_lock:
+            self._pending.append(entry)
+        self._flush_trigger()
+
+    def _flush(self, dt):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        follow = self.scroll_y <= 0.01 or len(self.data) == 0
+        self.data.extend(self._row(entry) for entry in pending)
+        overflow = len(self.data) - self.activity_log.capacity
+        if overflow > 0:
+            del self.data[:overflow]
+        if follow:
+            self.scroll_y = 0
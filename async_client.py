@@ -0,0 +1,335 @@
+# async_client.py - asyncio HTTP/1.1 client core for the Kivy front-ends
+#
+# The threaded path gives every in-flight request a worker thread and then
+# hops back to the UI with Clock.schedule_once. Here requests are coroutines on
+# the app's own event loop (see kivy_async.py), so a handler can simply
+# `await` a probe and touch widgets afterwards, and thousands of concurrent
+# /status probes cost sockets, not threads. Built on asyncio streams (no
+# extra dependency for the Android build). It shares the transport's
+# RTT-derived timeouts and the health monitor's circuit breakers, and it
+# raises the same requests exceptions, so existing error handling still applies.
+import asyncio
+import datetime
+import json as jsonlib
+import ssl
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import commands
+import health
+import multipath
+import netcache
+import retry
+import transport
+
+# CONFIG - Connection limits
+MAX_PER_HOST = 256          # Concurrent requests (and pooled connections) per host
+MAX_IDLE_PER_HOST = 32      # Keep-alive connections kept for reuse per host
+USER_AGENT = "Mozilla/5.0 (Android) Mobile Controller"
+
+
+class AsyncResponse:
+    """The parts of a requests.Response the controllers use"""
+
+    def __init__(self, url, status_code, reason, headers, content, elapsed):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.elapsed = datetime.timedelta(seconds=elapsed)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return jsonlib.loads(self.content)
+
+
+class _Origin:
+    """Per-host limit and idle keep-alive connections"""
+
+    def __init__(self):
+        self.limit = asyncio.Semaphore(MAX_PER_HOST)
+        self.idle = []
+
+
+class AsyncClient:
+    """Keep-alive HTTP/1.1 client bound to the event loop it is used on"""
+
+    def __init__(self, verify=False):
+        self.verify = verify
+        self.connections_opened = 0
+        self._origins = {}
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def request(self, method, url, headers=None, json=None, data=None, timeout=None, deadline=None):
+        """Send one request; timeout is (connect, read) or one number, default RTT-derived
+
+        Raises requests' ConnectTimeout / ReadTimeout / ConnectionError, and
+        health.CircuitOpenError while the target's circuit is open. Cancelling
+        the awaiting task closes the connection.
+        """
+        if timeout is None:
+            timeout = transport.adaptive_timeout(url)
+        if deadline is not None:
+            timeout = deadline.clamp(timeout)
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        if json is not None:
+            data = jsonlib.dumps(json).encode("utf-8")
+            headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        elif isinstance(data, str):
+            data = data.encode("utf-8")
+
+        monitor = health.get_monitor()
+        monitor.check(url)
+        parts = urlsplit(url)
+        origin = self._origins.setdefault((parts.scheme, parts.netloc), _Origin())
+        start = time.perf_counter()
+        try:
+            async with origin.limit:
+                response = await self._send(origin, parts, method, url, headers, data,
+                                            connect_timeout, read_timeout)
+        except requests.exceptions.Timeout:
+            transport.record_timeout(url)
+            monitor.record(url, False)
+            raise
+        except requests.exceptions.ConnectionError:
+            monitor.record(url, False)
+            raise
+        except BaseException:
+            monitor.record(url, None)       # Cancelled: says nothing about the target
+            raise
+        response.elapsed = datetime.timedelta(seconds=time.perf_counter() - start)
+        monitor.record_response(url, response)
+        transport.record_rtt(url, response.elapsed.total_seconds())
+        return response
+
+    async def _send(self, origin, parts, method, url, headers, data, connect_timeout, read_timeout):
+        payload = self._encode(method, parts, headers, data)
+        # A pooled connection may have been closed by the server while idle; retry those once on a new one
+        while origin.idle:
+            reader, writer = origin.idle.pop()
+            if reader.at_eof() or writer.is_closing():
+                writer.close()
+                continue
+            try:
+                return await self._exchange(origin, reader, writer, method, url, payload, read_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                continue
+        reader, writer = await self._connect(parts, connect_timeout)
+        try:
+            return await self._exchange(origin, reader, writer, method, url, payload, read_timeout)
+        except requests.exceptions.RequestException:
+            raise
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            raise requests.exceptions.ConnectionError(f"{url}: {e.__class__.__name__}: {e}") from e
+
+    async def _connect(self, parts, connect_timeout):
+        secure = parts.scheme == "https"
+        host = parts.hostname
+        port = parts.port or (443 if secure else 80)
+        dns = netcache.get_dns()
+        try:
+            addresses = await asyncio.wait_for(dns.resolve_async(host, port), connect_timeout)
+        except asyncio.TimeoutError:
+            raise requests.exceptions.ConnectTimeout(f"Resolving {host} timed out ({connect_timeout:.1f}s)")
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(f"Resolving {host} failed: {e}") from e
+        error = None
+        for address in addresses:       # Every record in turn, like urllib3's create_connection
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(address, port, ssl=netcache.tls_context(self.verify) if secure else None,
+                                            server_hostname=host if secure else None),
+                    connect_timeout)
+            except (asyncio.TimeoutError, OSError, ssl.SSLError) as e:
+                error = e
+                continue
+            dns.prefer(host, address)
+            self.connections_opened += 1
+            return reader, writer
+        dns.forget(host)
+        if isinstance(error, asyncio.TimeoutError):
+            raise requests.exceptions.ConnectTimeout(f"Connect to {host}:{port} timed out ({connect_timeout:.1f}s)")
+        raise requests.exceptions.ConnectionError(f"Connect to {host}:{port} failed: {error}") from error
+
+    def _encode(self, method, parts, headers, data):
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}"]
+        merged = CaseInsensitiveDict({"User-Agent": USER_AGENT, "Accept": "*/*", "Connection": "keep-alive"})
+        merged.update(headers or {})
+        if data is not None or method not in ("GET", "HEAD"):
+            merged["Content-Length"] = str(len(data or b""))
+        lines += [f"{name}: {value}" for name, value in merged.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (data or b"")
+
+    async def _exchange(self, origin, reader, writer, method, url, payload, read_timeout):
+        start = time.perf_counter()
+        reusable = False
+        try:
+            writer.write(payload)
+            await writer.drain()
+            try:
+                status_code, reason, headers, content, reusable = await asyncio.wait_for(
+                    self._read_response(reader, method), read_timeout)
+            except asyncio.TimeoutError:
+                raise requests.exceptions.ReadTimeout(f"{url}: no response within {read_timeout:.1f}s")
+        finally:
+            tls = writer.get_extra_info("ssl_object")
+            if tls is not None:
+                netcache.save_session(tls)      # Lets the next connection to this host resume
+            if reusable and len(origin.idle) < MAX_IDLE_PER_HOST:
+                origin.idle.append((reader, writer))
+            else:
+                writer.close()
+        return AsyncResponse(url, status_code, reason, headers, content, time.perf_counter() - start)
+
+    async def _read_response(self, reader, method):
+        status_line = await reader.readuntil(b"\r\n")
+        version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        headers = CaseInsensitiveDict()
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+
+        status_code = int(status)
+        keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+        if method == "HEAD" or status_code in (204, 304) or 100 <= status_code < 200:
+            return status_code, reason, headers, b"", keep_alive
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass                # Trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            return status_code, reason, headers, b"".join(chunks), keep_alive
+        if "Content-Length" in headers:
+            return status_code, reason, headers, await reader.readexactly(int(headers["Content-Length"])), keep_alive
+        return status_code, reason, headers, await reader.read(), False
+
+    async def aclose(self):
+        for origin in self._origins.values():
+            for _, writer in origin.idle:
+                writer.close()
+            origin.idle.clear()
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(verify=False):
+    """Return the running event loop's client for this verify setting, creating it on first use"""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    if verify not in clients:
+        clients[verify] = AsyncClient(verify)
+    return clients[verify]
+
+
+async def send_command(url, token, command="shutdown", user_agent=commands.USER_AGENT, policy=None,
+                       timeout=None, deadline=None):
+    """Async counterpart of commands.send_command: retries under one Idempotency-Key, never raises
+
+    Cancellation still propagates so a UI can abandon the command.
+    """
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "User-Agent": user_agent,
+        "Content-Type": "application/json",
+        retry.IDEMPOTENCY_HEADER: retry.new_key(),
+    }
+    policy = policy or retry.RetryPolicy()
+    deadline = deadline or transport.Deadline(retry.OPERATION_DEADLINE)
+    client = get_client()
+    target = commands.base_url(url)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        response, error = None, None
+        try:
+            response = await client.post(commands.command_url(url, command), headers=headers,
+                                         timeout=timeout, deadline=deadline)
+        except requests.exceptions.RequestException as e:
+            error = e
+        if not policy.retryable(response, error) or attempt >= policy.attempts:
+            break
+        wait = policy.delay(attempt, response)
+        if wait >= deadline.remaining():
+            break
+        await asyncio.sleep(wait)
+
+    elapsed = time.perf_counter() - start
+    if error is not None:
+        return commands.CommandResult(target, command, elapsed=elapsed, error=error, attempts=attempt)
+    return commands.CommandResult(target, command, response.status_code, response.text[:200], elapsed,
+                                  attempts=attempt)
+
+
+async def probe(url, token=None, timeout=None, deadline=None):
+    """GET /status (or / without a token) and return a CommandResult; never raises except on cancel"""
+    target = commands.base_url(url)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    start = time.perf_counter()
+    try:
+        response = await get_client().get(f"{target}/status" if token else f"{target}/",
+                                          headers=headers, timeout=timeout, deadline=deadline)
+    except requests.exceptions.RequestException as e:
+        return commands.CommandResult(target, "status", elapsed=time.perf_counter() - start, error=e)
+    return commands.CommandResult(target, "status", response.status_code, response.text[:200],
+                                  time.perf_counter() - start)
+
+
+async def probe_all(urls, token=None, timeout=None):
+    """Probe every URL concurrently on the current loop; results are in input order"""
+    return await asyncio.gather(*(probe(url, token, timeout) for url in urls))
+
+
+async def request_any(endpoint_list, method, path, **kwargs):
+    """Async happy eyeballs for idempotent requests: the cached winner (or first endpoint) starts
+    first, the next one after RACE_STAGGER or as soon as one fails, and the first response wins"""
+    racer = multipath.get_racer()
+    cached = racer.cached(endpoint_list)
+    order = [cached] + [e for e in endpoint_list if e != cached] if cached else list(endpoint_list)
+    client = get_client()
+    pending = {}
+    error = None
+    try:
+        while order or pending:
+            if order:
+                endpoint = order.pop(0)
+                pending[asyncio.ensure_future(client.request(method, endpoint + path, **kwargs))] = endpoint
+            done, _ = await asyncio.wait(pending, timeout=multipath.RACE_STAGGER if order else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                endpoint = pending.pop(task)
+                if task.exception() is None:
+                    if len(endpoint_list) > 1:
+                        racer.remember(endpoint_list, endpoint)
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise error or requests.exceptions.ConnectionError("No endpoints to try")
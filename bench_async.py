@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent status probes: worker threads + requests vs asyncio
+
+Fires N concurrent GET /status probes at a local stand_in_agent (with added
+latency, like a tunnel round trip) for several N, once with a thread per
+in-flight probe over the pooled transport and once as coroutines on one
+event loop with async_client. Reports wall time, probes/s, errors and the
+peak number of client threads.
+
+    python bench_async.py --levels 10,100,500,1000 --latency 50
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import async_client
+import commands
+import transport
+from stand_in_agent import StandInAgent
+
+TOKEN = "admin-shutdown-2024-token-secure"
+MAX_THREADS = 1024          # Thread model cap; beyond this probes queue for a worker
+
+
+class ThreadSampler:
+    """Samples the client-side thread count in the background and keeps the peak"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = self.count()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+    @staticmethod
+    def count():
+        # The stand-in runs in this process too; leave out its per-connection handler threads
+        return sum(1 for thread in threading.enumerate() if "process_request" not in thread.name)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.count())
+            self._stop.wait(self.interval)
+
+
+def probe_sync(url):
+    start = time.perf_counter()
+    try:
+        response = transport.get(f"{url}/status", headers={"Authorization": f"Bearer {TOKEN}"}, verify=False)
+        return commands.CommandResult(url, "status", response.status_code, "", time.perf_counter() - start)
+    except Exception as e:
+        return commands.CommandResult(url, "status", elapsed=time.perf_counter() - start, error=e)
+
+
+def run_threads(url, count):
+    with ThreadPoolExecutor(max_workers=min(count, MAX_THREADS)) as pool:
+        return list(pool.map(probe_sync, [url] * count))
+
+
+def run_async(url, count):
+    async def probes():
+        return await async_client.probe_all([url] * count, TOKEN)
+    return asyncio.run(probes())
+
+
+def measure(run, url, count):
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        results = run(url, count)
+        elapsed = time.perf_counter() - start
+    return {
+        "probes": count,
+        "wall_ms": round(elapsed * 1000, 1),
+        "probes_per_s": round(count / elapsed, 1),
+        "errors": sum(1 for r in results if not r.ok),
+        "peak_threads": sampler.peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent status probes: threads vs asyncio")
+    parser.add_argument("--levels", default="10,100,500,1000", help="Comma separated concurrency levels")
+    parser.add_argument("--latency", type=float, default=50, help="Latency (ms) the stand-in adds per request")
+    args = parser.parse_args()
+
+    agent = StandInAgent(latency=args.latency / 1000)
+    url = agent.start()
+    results = {"threads": [], "asyncio": []}
+    for count in [int(level) for level in args.levels.split(",")]:
+        transport.reset_session()
+        results["threads"].append(measure(run_threads, url, count))
+        results["asyncio"].append(measure(run_async, url, count))
+    agent.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shared transport over HTTP/1.1 vs HTTP/2
+
+Fires N concurrent GET /status requests (plus a few POST /shutdown, which the
+stand-in only counts) through transport.request at a local stand_in_h2 agent.
+The HTTP/1.1 run uses the pooled requests session; the HTTP/2 run turns on
+transport's h2 mode; the fallback run has h2 on but the agent only offers
+http/1.1. Reports connections the server accepted, the negotiated protocols
+and latency percentiles.
+
+    python bench_http2.py --requests 100 --latency 50
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stats
+import transport
+from stand_in_h2 import H2StandInAgent
+
+TOKEN = "admin-shutdown-2024-token-secure"
+COMMAND_EVERY = 10          # Every Nth request is a POST /shutdown instead of a status probe
+
+
+def one_request(url, index):
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    start = time.perf_counter()
+    try:
+        if index % COMMAND_EVERY == COMMAND_EVERY - 1:
+            response = transport.post(f"{url}/shutdown", headers=headers, json={}, verify=False)
+        else:
+            response = transport.get(f"{url}/status", headers=headers, verify=False)
+        ok = response.status_code == 200
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def run(name, count, latency, http2, agent_http2=True):
+    transport.reset_session()
+    transport.set_http2(http2)
+    agent = H2StandInAgent(latency=latency, http2=agent_http2)
+    url = agent.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        results = list(pool.map(lambda index: one_request(url, index), range(count)))
+    elapsed = time.perf_counter() - start
+    agent.stop()
+    latencies = [seconds * 1000 for _, seconds in results]
+    return {
+        "mode": name,
+        "requests": count,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "connections": agent.stats.connections,
+        "protocols": agent.protocols,
+        "wall_ms": round(elapsed * 1000, 1),
+        "p50_ms": round(stats.percentile(latencies, 0.50), 1),
+        "p95_ms": round(stats.percentile(latencies, 0.95), 1),
+        "max_ms": round(max(latencies), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared transport over HTTP/1.1 vs HTTP/2")
+    parser.add_argument("--requests", type=int, default=100, help="Concurrent requests per run")
+    parser.add_argument("--latency", type=float, default=50, help="Latency (ms) the stand-in adds per request")
+    args = parser.parse_args()
+
+    if not transport.http2_available():
+        raise SystemExit('HTTP/2 mode needs httpx with h2: pip install "httpx[http2]"')
+    latency = args.latency / 1000
+    results = [
+        run("http/1.1", args.requests, latency, http2=False),
+        run("http/2", args.requests, latency, http2=True),
+        run("http/2 -> http/1.1 fallback", args.requests, latency, http2=True, agent_http2=False),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
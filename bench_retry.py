@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark command success rate and time-to-success under injected faults
+
+Sends POST /shutdown to a local stand_in_agent that answers a fraction of
+requests with 502/503/524/429 (503/429 with Retry-After) and "loses" the reply
+of some commands it did run. Compares a single attempt with retry.request,
+with and without the agent honouring Idempotency-Key, and counts commands the
+agent executed more than once.
+
+    python bench_retry.py --commands 200 --error-rate 0.3 --lost-reply-rate 0.1
+"""
+import argparse
+import json
+import time
+
+import retry
+import stats
+import transport
+from stand_in_agent import StandInAgent
+
+TOKEN = "admin-shutdown-2024-token-secure"
+FAULT_CODES = (502, 503, 524, 429)
+
+
+def run(agent, base_url, count, attempts):
+    """Send count shutdown commands one after another; returns per-scenario stats"""
+    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
+    policy = retry.RetryPolicy(attempts=attempts)
+    times, tries = [], []
+    succeeded = duplicates = 0
+    for _ in range(count):
+        before = agent.shutdown_requests
+        start = time.perf_counter()
+        try:
+            response = retry.request("POST", base_url, "/shutdown", policy=policy,
+                                     headers=headers, verify=False)
+            ok = response.status_code == 200
+            tries.append(response.attempts)
+        except Exception:
+            ok = False
+            tries.append(attempts)
+        if ok:
+            succeeded += 1
+            times.append((time.perf_counter() - start) * 1000)
+        duplicates += max(0, agent.shutdown_requests - before - 1)
+
+    return {
+        "commands": count,
+        "success_rate": round(succeeded / count, 4),
+        "mean_attempts": round(sum(tries) / len(tries), 2),
+        "time_to_success_p50_ms": round(stats.percentile(times, 0.50), 1) if times else None,
+        "time_to_success_p90_ms": round(stats.percentile(times, 0.90), 1) if times else None,
+        "time_to_success_max_ms": round(max(times), 1) if times else None,
+        "duplicate_executions": duplicates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retry success rate and time-to-success under faults")
+    parser.add_argument("--commands", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.3, help="Fraction answered with a fault code")
+    parser.add_argument("--lost-reply-rate", type=float, default=0.1,
+                        help="Fraction of executed commands whose reply becomes a 524")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--attempts", type=int, default=retry.MAX_ATTEMPTS)
+    args = parser.parse_args()
+
+    results = {}
+    for name, attempts, idempotency in (("single_attempt", 1, True),
+                                        ("retry_no_idempotency", args.attempts, False),
+                                        ("retry_idempotent", args.attempts, True)):
+        agent = StandInAgent(error_rate=args.error_rate, fault_codes=FAULT_CODES, retry_after=args.retry_after,
+                             lost_reply_rate=args.lost_reply_rate, idempotency=idempotency)
+        base_url = agent.start()
+        transport.reset_session()
+        results[name] = run(agent, base_url, args.commands, attempts)
+        results[name]["replayed"] = agent.replays
+        agent.stop()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-command latency of bare requests calls vs the pooled transport
+
+Runs against a local stand_in_agent by default, which adds a delay to every new
+TCP connection to mimic the handshake cost through the Cloudflare edge.
+
+    python bench_transport.py --commands 50 --handshake-delay 150
+    python bench_transport.py --target https://xxxx.trycloudflare.com   # GET /status only
+    python bench_transport.py --confirm-delay 800   # YES-to-ack with/without warm-up
+"""
+import argparse
+import json
+import statistics
+import time
+
+import requests
+import urllib3
+
+import stats
+import transport
+from stand_in_agent import StandInAgent
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+TOKEN = "admin-shutdown-2024-token-secure"
+
+# A real --target is never sent /shutdown: the command slot is timed with this
+# authorized, non-destructive request instead
+STAND_IN_COMMAND = ("POST", "/shutdown")
+TARGET_COMMAND = ("GET", "/status")
+
+
+def run_commands(send, base_url, count, command=STAND_IN_COMMAND):
+    """Alternate Test Connection (GET /) and a command (POST /shutdown by default) like a user would"""
+    method, path = command
+    headers = {
+        "Authorization": f"Bearer {TOKEN}",
+        "Content-Type": "application/json"
+    }
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        if i % 2 == 0:
+            response = send("GET", f"{base_url}/", headers=headers, verify=False, timeout=10)
+        else:
+            response = send(method, f"{base_url}{path}", headers=headers, verify=False, timeout=10)
+        response.content
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run_confirmations(base_url, count, confirm_delay, warm_up, command=STAND_IN_COMMAND):
+    """Simulate confirm dialog -> YES -> command (POST /shutdown by default) from a cold pool each time
+
+    With warm_up the connection is opened as the dialog appears (like the
+    controllers do); the latency recorded is from the YES tap to the response.
+    """
+    headers = {
+        "Authorization": f"Bearer {TOKEN}",
+        "Content-Type": "application/json"
+    }
+    method, path = command
+    url = f"{base_url}{path}"
+    latencies = []
+    for _ in range(count):
+        transport.reset_session()
+        if warm_up:
+            transport.warm(url)
+        time.sleep(confirm_delay)
+        start = time.perf_counter()
+        transport.request(method, url, headers=headers, verify=False, timeout=10).content
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    return {
+        "commands": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(stats.percentile(latencies, 0.50), 2),
+        "p90_ms": round(stats.percentile(latencies, 0.90), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bare requests vs pooled transport latency")
+    parser.add_argument("--target", help="Base URL of a real agent, timed with GET /status instead of "
+                                         "POST /shutdown (default: local stand-in)")
+    parser.add_argument("--commands", type=int, default=40)
+    parser.add_argument("--handshake-delay", type=float, default=100,
+                        help="Delay (ms) the stand-in adds to each new connection")
+    parser.add_argument("--confirm-delay", type=float, default=0,
+                        help="Benchmark YES-to-ack instead, with this much (ms) time in the dialog")
+    args = parser.parse_args()
+
+    agent = None
+    base_url = args.target
+    if not base_url:
+        agent = StandInAgent(handshake_delay=args.handshake_delay / 1000)
+        base_url = agent.start()
+    base_url = base_url.rstrip("/")
+    command = TARGET_COMMAND if args.target else STAND_IN_COMMAND
+
+    results = {}
+    if args.confirm_delay:
+        for name, warm_up in (("yes_to_ack_cold", False), ("yes_to_ack_warm", True)):
+            if agent:
+                agent.stats.reset()
+            results[name] = summarize(run_confirmations(base_url, args.commands, args.confirm_delay / 1000, warm_up,
+                                                         command))
+            results[name]["connections"] = agent.stats.connections if agent else None
+    else:
+        for name, send in (("bare_requests", requests.request), ("pooled_transport", transport.request)):
+            transport.reset_session()
+            if agent:
+                agent.stats.reset()
+            results[name] = summarize(run_commands(send, base_url, args.commands, command))
+            results[name]["connections"] = agent.stats.connections if agent else None
+
+    print(json.dumps(results, indent=2))
+
+    if agent:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
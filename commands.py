@@ -0,0 +1,121 @@
+# commands.py - Agent command helpers shared by the controllers and fleet tools
+#
+# Mirrors the request/response handling of ShutdownController._shutdown_thread:
+# 200 means the command was accepted, 401 means a wrong token, anything else
+# is reported as an error with the response code.
+import time
+
+import requests
+
+import health
+import retry
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+class CommandResult:
+    """Outcome of one command sent to one target"""
+
+    def __init__(self, target, command, status_code=None, message="", elapsed=0.0, error=None, attempts=1):
+        self.target = target
+        self.command = command
+        self.status_code = status_code
+        self.message = message
+        self.elapsed = elapsed
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    @property
+    def status(self):
+        """Short status keyword: ok / unauthorized / http_error / timeout / circuit_open / connection_error / error"""
+        if self.ok:
+            return "ok"
+        if self.status_code == 401:
+            return "unauthorized"
+        if self.status_code is not None:
+            return "http_error"
+        if isinstance(self.error, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(self.error, health.CircuitOpenError):
+            return "circuit_open"
+        if isinstance(self.error, requests.exceptions.ConnectionError):
+            return "connection_error"
+        return "error"
+
+    def describe(self):
+        """Human readable status line, same wording as the single-target UI"""
+        if self.ok:
+            return f"✅ {self.command.capitalize()} command sent successfully!"
+        if self.status_code == 401:
+            return "❌ Unauthorized - wrong token"
+        if self.status_code is not None:
+            return f"❌ Error {self.status_code}"
+        if isinstance(self.error, requests.exceptions.Timeout):
+            return "❌ Timed out"
+        if isinstance(self.error, health.CircuitOpenError):
+            return "⛔ Target down (skipped)"
+        if isinstance(self.error, requests.exceptions.ConnectionError):
+            return "❌ Connection failed"
+        return f"❌ Error: {str(self.error)[:30]}"
+
+    def to_dict(self):
+        return {
+            "target": self.target,
+            "command": self.command,
+            "status": self.status,
+            "status_code": self.status_code,
+            "message": self.message,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "attempts": self.attempts,
+        }
+
+
+def base_url(url):
+    """Strip a trailing command endpoint so the tunnel root remains"""
+    url = url.strip().rstrip("/")
+    for endpoint in ("/shutdown", "/status", "/restart-tunnel", "/reboot"):
+        if url.endswith(endpoint):
+            return url[:-len(endpoint)]
+    return url
+
+
+def command_url(url, command):
+    """Build the endpoint URL for a command from a base or /shutdown URL"""
+    return f"{base_url(url)}/{command}"
+
+
+def send_command(url, token, command="shutdown", user_agent=USER_AGENT, timeout=None, deadline=None):
+    """POST a command to a target and return a CommandResult (never raises)
+
+    Transient failures are retried under one Idempotency-Key. timeout=None
+    uses the transport's RTT-derived timeouts; deadline (a transport.Deadline)
+    caps the whole call, retries included.
+    """
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "User-Agent": user_agent,
+        "Content-Type": "application/json"
+    }
+    target = base_url(url)
+    start = time.perf_counter()
+    try:
+        response = retry.request("POST", command_url(url, command), headers=headers, verify=False,
+                                 timeout=timeout, deadline=deadline)
+        return CommandResult(target, command, response.status_code, response.text[:200],
+                             time.perf_counter() - start, attempts=response.attempts)
+    except Exception as e:
+        return CommandResult(target, command, elapsed=time.perf_counter() - start, error=e)
+
+
+def parse_targets(text):
+    """Parse a newline/comma separated list of target URLs, ignoring blanks and # comments"""
+    targets = []
+    for line in text.replace(",", "\n").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line and base_url(line) not in targets:
+            targets.append(base_url(line))
+    return targets
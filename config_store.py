@@ -0,0 +1,185 @@
+# config_store.py - Debounced, atomic JSON config with named target profiles
+#
+# Writes go to a temp file in the same directory followed by os.replace(), so
+# a crash mid-write never leaves a truncated config.json. Saves run on a
+# background timer and are debounced, so a burst of edits produces one write.
+# Writes are serialized and numbered, so a slow older flush can never replace
+# the file after a newer one.
+# The file is only parsed on first access (or by preload() off the UI thread).
+import json
+import os
+import tempfile
+import threading
+
+# CONFIG
+DEFAULT_PATH = "config.json"
+DEFAULT_PROFILE = "default"
+SAVE_DEBOUNCE = 0.5     # Seconds to wait for more edits before writing
+CONFIG_VERSION = 2
+
+
+class ConfigStore:
+    """Named target profiles ({target_url, admin_token, ...}) persisted to JSON"""
+
+    def __init__(self, path=DEFAULT_PATH, debounce=SAVE_DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self.load_error = None          # Last load problem, for the UI to report
+        self.save_error = None          # Last write problem, for the UI to report
+        self.writes = 0
+        self._data = None
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()     # One temp-file write + rename at a time
+        self._timer = None
+        self._generation = 0            # Snapshots taken for writing
+        self._written = 0               # Newest snapshot on disk
+
+    # Loading -----------------------------------------------------------------
+
+    def _empty(self):
+        return {"version": CONFIG_VERSION, "active": DEFAULT_PROFILE, "profiles": {}}
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return self._empty()
+        except (OSError, ValueError) as e:
+            self.load_error = f"Could not read {self.path}: {e}"
+            print(self.load_error)
+            self._backup_bad_file()
+            return self._empty()
+
+        if "profiles" not in raw:
+            # Legacy single-target format: {"target_url": ..., "admin_token": ...}
+            data = self._empty()
+            legacy = {k: raw[k] for k in ("target_url", "admin_token") if k in raw}
+            if legacy:
+                data["profiles"][DEFAULT_PROFILE] = legacy
+            return data
+
+        raw.setdefault("active", DEFAULT_PROFILE)
+        raw["version"] = CONFIG_VERSION
+        return raw
+
+    def _backup_bad_file(self):
+        try:
+            os.replace(self.path, self.path + ".bad")
+        except OSError:
+            pass
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._data is None:
+                self._data = self._load()
+            return self._data
+
+    def preload(self, callback=None):
+        """Parse the file on a background thread; callback(store) runs on that thread"""
+        def worker():
+            self._ensure_loaded()
+            if callback:
+                callback(self)
+        threading.Thread(target=worker, daemon=True).start()
+
+    # Profiles ----------------------------------------------------------------
+
+    @property
+    def active(self):
+        return self._ensure_loaded()["active"]
+
+    def set_active(self, name):
+        with self._lock:
+            self._ensure_loaded()["active"] = name
+        self.save()
+
+    def profile_names(self):
+        with self._lock:
+            return sorted(self._ensure_loaded()["profiles"])
+
+    def get_profile(self, name=None):
+        """Return a copy of a profile (the active one by default)"""
+        with self._lock:
+            data = self._ensure_loaded()
+            return dict(data["profiles"].get(name or data["active"], {}))
+
+    def set_profile(self, name=None, **fields):
+        """Create or update a profile and schedule a debounced save"""
+        with self._lock:
+            data = self._ensure_loaded()
+            data["profiles"].setdefault(name or data["active"], {}).update(fields)
+        self.save()
+
+    def delete_profile(self, name):
+        with self._lock:
+            data = self._ensure_loaded()
+            data["profiles"].pop(name, None)
+            if data["active"] == name:
+                data["active"] = next(iter(sorted(data["profiles"])), DEFAULT_PROFILE)
+        self.save()
+
+    # Saving ------------------------------------------------------------------
+
+    def save(self):
+        """Schedule a write; further calls within the debounce window are merged"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write now (temp file + rename); returns False if the write failed"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._data is None:
+                return True
+            payload = json.dumps(self._data, indent=2)
+            self._generation += 1
+            generation = self._generation
+
+        with self._write_lock:
+            if generation < self._written:
+                return True             # A newer snapshot is already on disk
+            return self._write(payload, generation)
+
+    def _write(self, payload, generation):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._written = generation
+            self.writes += 1
+            self.save_error = None
+            return True
+        except OSError as e:
+            self.save_error = f"Failed to save config: {e}"
+            print(self.save_error)
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(path=DEFAULT_PATH):
+    """Return the process-wide store for path, creating it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = ConfigStore(path)
+        return _store
@@ -3,8 +3,20 @@ import tkinter as tk
 from tkinter import messagebox, simpledialog
 import requests
 import urllib3
-import threading
+import executor
+import health
+from tk_dispatch import TkDispatcher
+import fleet
+import commands
+import multipath
+import retry
+import shutdown_tracker
+import discovery
+import registry
+import status_stream
+import waves
 import time
+from collections import deque
 
 # Disable SSL warnings when using verify=False
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -16,8 +28,10 @@ ADMIN_TOKEN = "admin-shutdown-2024-token-secure"
 class ShutdownController:
     def __init__(self):
         self.root = tk.Tk()
+        # Worker threads post UI changes here; drained once per frame on the Tk thread
+        self.dispatcher = TkDispatcher(self.root)
         self.root.title("Remote Shutdown Controller (Cloudflare)")
-        self.root.geometry("450x200")
+        self.root.geometry("560x350")
         
         # URL input frame
         url_frame = tk.Frame(self.root)
@@ -29,6 +43,32 @@ class ShutdownController:
         self.url_entry = tk.Entry(url_frame, textvariable=self.url_var, width=60)
         self.url_entry.pack(pady=5)
         
+        # Optional direct address; commands race it against the tunnel and use whichever connects first
+        tk.Label(url_frame, text="LAN address (optional, e.g. 192.168.1.20:5000):").pack()
+        self.lan_var = tk.StringVar()
+        tk.Entry(url_frame, textvariable=self.lan_var, width=60).pack(pady=5)
+        
+        # Agents announcing themselves on the LAN; selecting one fills both fields
+        tk.Label(url_frame, text="Discovered on LAN:").pack()
+        self.discovered = []
+        self.discovered_list = tk.Listbox(url_frame, height=3, width=60)
+        self.discovered_list.pack(pady=5)
+        self.discovered_list.bind("<<ListboxSelect>>", self.on_discovered_selected)
+        self.discovery = discovery.Discovery(
+            on_change=lambda agents: self.dispatcher.post("discovered", self.show_discovered, agents)
+        )
+        self.discovery.start()
+        
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.status_stream = None
+        self.current_target = self.url_var.get()
+        health.get_monitor().add_listener(self._on_circuit_change)
+        self.url_var.trace_add("write", self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(lambda record: self.dispatcher.call(self.on_tunnel_moved, record))
+        
         tk.Button(url_frame, text="Update URL", command=self.update_url, bg="blue", fg="white").pack(pady=5)
         
         # Status frame
@@ -48,6 +88,9 @@ class ShutdownController:
         tk.Button(button_frame, text="SHUTDOWN TARGET", command=self.shutdown_remote, 
                  bg="red", fg="white", width=20, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
         
+        tk.Button(button_frame, text="Fleet Mode", command=self.open_fleet_window, 
+                 bg="purple", fg="white", width=12).pack(side=tk.LEFT, padx=5)
+        
         # Instructions
         instructions = tk.Text(self.root, height=4, width=55, wrap=tk.WORD)
         instructions.pack(pady=10)
@@ -55,14 +98,15 @@ class ShutdownController:
             "Instructions:\n"
             "1. Run start_cloudflare.bat on the target machine\n"
             "2. Copy the Cloudflare URL from the terminal output\n"
-            "3. Paste it above and add '/shutdown' to the end\n"
+            "3. Paste it above and add '/shutdown' (or pick it under Discovered on LAN)\n"
             "4. Click 'Test Connection' to verify, then 'SHUTDOWN TARGET'"
         )
         instructions.config(state=tk.DISABLED)
     
     def update_status(self, message, color="black"):
-        self.status_label.config(text=message, fg=color)
-        self.root.update()
+        if executor.current_job_cancelled():
+            return
+        self.dispatcher.post("status", self.status_label.config, text=message, fg=color)
     
     def update_url(self):
         new_url = simpledialog.askstring("Update URL", "Enter the new Cloudflare tunnel URL:", 
@@ -76,26 +120,101 @@ class ShutdownController:
             self.url_var.set(new_url)
             self.update_status("URL updated", "blue")
     
+    def on_url_changed(self, *args):
+        new_target = self.url_var.get()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.current_target = new_target
+            if self.status_stream and self.status_stream.url != commands.base_url(new_target):
+                self.status_stream.stop()
+                self.status_stream = None
+    
+    def watch_status(self, url):
+        """Keep the status live over the agent's /events stream instead of a one-shot probe"""
+        if self.status_stream:
+            self.status_stream.stop()
+        self.status_stream = status_stream.StatusStream(
+            url, ADMIN_TOKEN, on_event=self._on_stream_event, on_state=self._on_stream_state
+        ).start()
+    
+    def _on_stream_state(self, state, detail):
+        if state == "live":
+            self.update_status("🟢 Live: agent online", "green")
+        elif state == "reconnecting":
+            self.update_status(f"🟠 Reconnecting status stream ({detail})", "orange")
+    
+    def _on_circuit_change(self, key, breaker):
+        """Show the current target's circuit breaker state (called from whichever thread saw the change)"""
+        if key != health.target_key(self.current_target):
+            return
+        colors = {health.OPEN: "red", health.HALF_OPEN: "orange", health.CLOSED: "green"}
+        self.update_status(f"⛔ {health.describe(breaker)}" if breaker.state != health.CLOSED
+                           else f"🟢 {health.describe(breaker)}", colors[breaker.state])
+    
+    def _on_stream_event(self, event, data):
+        if event == "shutdown":
+            self.update_status("⏻ Agent accepted shutdown", "red")
+        elif event == "tunnel":
+            # The stream already follows the agent; move the URL field along with it
+            self.dispatcher.call(self.url_var.set, commands.command_url(data["tunnel_url"], "shutdown"))
+    
+    def on_tunnel_moved(self, record):
+        new_url = registry.follow(self.url_var.get(), record)
+        if not new_url:
+            return
+        self.url_var.set(new_url)
+        self.update_status(f"🔄 {registry.describe_move(record)}", "blue")
+        self.executor.submit("reconnect", new_url, self.measure_reconnect, new_url, record["restarted_at"])
+    
+    def measure_reconnect(self, url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("❌ New tunnel URL is not answering", "red")
+        else:
+            print(f"Reconnected to {url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"✅ Reconnected {reconnect_ms:.0f} ms after tunnel restart", "green")
+    
+    def show_discovered(self, agents):
+        self.discovered = agents
+        self.discovered_list.delete(0, tk.END)
+        for agent in agents:
+            self.discovered_list.insert(tk.END, agent.label())
+    
+    def on_discovered_selected(self, event):
+        selection = self.discovered_list.curselection()
+        if not selection:
+            return
+        agent = self.discovered[selection[0]]
+        self.url_var.set(commands.command_url(agent.tunnel_url or agent.lan_url, "shutdown"))
+        self.lan_var.set(agent.lan_url)
+        self.update_status(f"Selected {agent.name}", "blue")
+    
+    def target_endpoints(self, url):
+        """LAN address first (preferred), then the tunnel"""
+        return multipath.endpoints(self.lan_var.get(), url)
+    
     def test_connection(self):
         self.update_status("Testing connection...", "orange")
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        url = self.url_var.get()
+        self.executor.submit("test", url, self._test_connection_thread, url, self.target_endpoints(url))
     
-    def _test_connection_thread(self):
+    def _test_connection_thread(self, url, endpoint_list):
         try:
-            url = self.url_var.get()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "red")
                 return
             
-            # Test basic connection to root
-            base_url = url.replace('/shutdown', '/')
+            # Test basic connection to root over the fastest path
             headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
             
-            print(f"Testing connection to: {base_url}")
-            response = requests.get(base_url, headers=headers, verify=False, timeout=10)
+            print(f"Testing connection to: {', '.join(endpoint_list)}")
+            response = multipath.request(endpoint_list, "GET", "/", headers=headers, verify=False)
             
             if response.status_code == 200:
-                self.update_status("✅ Connection successful! Ready to shutdown.", "green")
+                self.update_status(f"✅ Connection successful via {response.url}", "green")
+                if not executor.current_job_cancelled():
+                    self.watch_status(response.url)
                 print(f"Connection test passed: {response.status_code}")
                 print(f"Response: {response.text[:100]}")
             else:
@@ -110,21 +229,25 @@ class ShutdownController:
             print(f"Test error: {e}")
     
     def shutdown_remote(self):
+        url = self.url_var.get()
+        # Open a pooled connection while the dialog is up so YES goes out on a warm socket
+        if url and url != TARGET_URL:
+            self.executor.submit("warm", url, multipath.warm, self.target_endpoints(url))
         result = messagebox.askyesno("Confirm Shutdown", 
                                    "Are you sure you want to shutdown the target machine?",
                                    icon="warning")
         if not result:
             return
         
+        pressed_at = time.perf_counter()
         self.update_status("Sending shutdown command...", "orange")
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        self.executor.submit("shutdown", url, self._shutdown_thread, url, self.target_endpoints(url), pressed_at)
     
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, url, endpoint_list, pressed_at):
         try:
-            url = self.url_var.get()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "red")
-                messagebox.showerror("Error", "Please update the tunnel URL first!")
+                self.dispatcher.dialog(messagebox.showerror, "Error", "Please update the tunnel URL first!")
                 return
             
             headers = {
@@ -133,33 +256,183 @@ class ShutdownController:
                 "Content-Type": "application/json"
             }
             
-            print(f"Sending shutdown command to: {url}")
+            print(f"Sending shutdown command to: {', '.join(endpoint_list)}")
             print(f"Headers: {headers}")
             
-            response = requests.post(url, headers=headers, verify=False, timeout=10)
+            def on_retry(attempt, wait, reason):
+                self.update_status(f"Retrying after {reason} ({attempt + 1}/{retry.MAX_ATTEMPTS})...", "orange")
+
+            response = retry.request("POST", endpoint_list, "/shutdown", headers=headers, verify=False, on_retry=on_retry)
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
+            print(f"Shutdown acknowledged {ack_ms:.0f} ms after YES via {response.url}")
             
             print(f"Response Status Code: {response.status_code}")
             print(f"Response Text: {response.text}")
             
             if response.status_code == 200:
-                self.update_status("✅ Shutdown command sent successfully!", "green")
-                messagebox.showinfo("Success", "Shutdown command accepted!")
+                self.update_status(f"✅ Shutdown command sent successfully! ({ack_ms:.0f} ms) Confirming...", "green")
+                self.dispatcher.dialog(messagebox.showinfo, "Success", "Shutdown command accepted!")
+                shutdown_tracker.get_tracker().track(response.url, ADMIN_TOKEN, on_done=self._on_offline)
             elif response.status_code == 401:
                 self.update_status("❌ Unauthorized - wrong token", "red")
-                messagebox.showerror("Unauthorized", "Invalid token.")
+                self.dispatcher.dialog(messagebox.showerror, "Unauthorized", "Invalid token.")
             else:
                 self.update_status(f"❌ Error {response.status_code}", "red")
-                messagebox.showerror("Failed", f"Error {response.status_code}: {response.text[:100]}")
+                self.dispatcher.dialog(messagebox.showerror, "Failed", f"Error {response.status_code}: {response.text[:100]}")
                 
         except requests.exceptions.ConnectionError:
             self.update_status("❌ Connection failed", "red")
-            messagebox.showerror("Connection Error", "Could not connect to target. Check if tunnel is running.")
+            self.dispatcher.dialog(messagebox.showerror, "Connection Error", "Could not connect to target. Check if tunnel is running.")
         except Exception as e:
             self.update_status("❌ Error occurred", "red")
-            messagebox.showerror("Error", str(e))
+            self.dispatcher.dialog(messagebox.showerror, "Error", str(e))
+    
+    def _on_offline(self, host):
+        """The shutdown tracker saw the target go offline, or gave up waiting"""
+        print(f"{host.url}: {host.describe()} ({host.checks} checks)")
+        self.update_status(host.describe(), "green" if host.state == shutdown_tracker.OFFLINE else "orange")
+    
+    def open_fleet_window(self):
+        """Open a window for sending /shutdown to many tunnel URLs at once"""
+        window = tk.Toplevel(self.root)
+        window.title("Fleet Shutdown")
+        window.geometry("600x500")
+        
+        tk.Label(window, text="Tunnel URLs (one per line):", font=("Arial", 10, "bold")).pack(pady=5)
+        targets_text = tk.Text(window, height=8, width=70)
+        targets_text.pack(pady=5)
+        
+        options_frame = tk.Frame(window)
+        options_frame.pack(pady=5)
+        tk.Label(options_frame, text="Max parallel:").pack(side=tk.LEFT)
+        concurrency_var = tk.IntVar(value=fleet.DEFAULT_CONCURRENCY)
+        tk.Spinbox(options_frame, from_=1, to=fleet.MAX_CONCURRENCY, textvariable=concurrency_var, 
+                  width=5).pack(side=tk.LEFT, padx=5)
+        
+        def add_discovered():
+            """Append discovered agents (direct LAN URLs) that aren't listed yet"""
+            targets = commands.parse_targets(targets_text.get("1.0", tk.END))
+            new = [agent.url for agent in self.discovered if agent.url not in targets]
+            existing = targets_text.get("1.0", "end-1c")
+            if new:
+                prefix = "\n" if existing and not existing.endswith("\n") else ""
+                targets_text.insert("end-1c", prefix + "\n".join(new))
+            fleet_status.config(text=f"Added {len(new)} discovered agent(s)", fg="blue")
+        
+        tk.Button(options_frame, text="Add LAN agents", command=add_discovered).pack(side=tk.LEFT, padx=5)
+        waves_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(options_frame, text="In waves (5% / 25% / rest)", variable=waves_var).pack(side=tk.LEFT, padx=5)
+        
+        fleet_status = tk.Label(window, text="Ready", fg="green", font=("Arial", 9))
+        fleet_status.pack(pady=5)
+        
+        offline_status = tk.Label(window, text="", fg="gray", font=("Arial", 9))
+        offline_status.pack()
+        
+        results_list = tk.Listbox(window, height=12, width=90)
+        results_list.pack(pady=5, fill=tk.BOTH, expand=True)
+        
+        state = {"runner": None, "tracked": [], "results": deque()}
+        
+        def show_offline():
+            """Confirmed-offline count for the hosts that accepted the shutdown"""
+            hosts = state["tracked"]
+            summary = shutdown_tracker.get_tracker().summary(hosts)
+            text = f"Offline: {summary['offline']}/{len(hosts)}"
+            if summary["straggler"]:
+                text += f", {summary['straggler']} still online"
+            if summary["p95_time_to_offline_s"] is not None:
+                text += f" (p95 {summary['p95_time_to_offline_s']:.1f}s)"
+            offline_status.config(text=text, fg="orange" if summary["tracking"] or summary["straggler"] else "green")
+        
+        def offline_done(host):
+            if host.state == shutdown_tracker.STRAGGLER:
+                results_list.insert(tk.END, f"{host.describe()} {host.url}")
+                results_list.itemconfig(tk.END, fg="orange")
+            self.dispatcher.post("fleet-offline", show_offline)
+        
+        def add_results():
+            """Insert every result that arrived since the last frame (one post per frame, not one call per host)"""
+            pending = state["results"]
+            tracked = False
+            while pending:
+                result = pending.popleft()
+                results_list.insert(tk.END, f"{result.describe()} {result.target} ({result.elapsed * 1000:.0f} ms)")
+                results_list.itemconfig(tk.END, fg="green" if result.ok else "red")
+                if result.ok:
+                    state["tracked"].append(shutdown_tracker.get_tracker().track(
+                        result.target, ADMIN_TOKEN, on_done=lambda host: self.dispatcher.call(offline_done, host)))
+                    tracked = True
+            results_list.see(tk.END)
+            if tracked:
+                self.dispatcher.post("fleet-offline", show_offline)
+        
+        def queue_result(result):
+            state["results"].append(result)     # deque.append is safe from the fleet threads
+            self.dispatcher.post("fleet-results", add_results)
+        
+        def fleet_done(summary):
+            state["runner"] = None
+            shutdown_button.config(state=tk.NORMAL)
+            failed = not summary.ok if isinstance(summary, waves.RolloutReport) else summary.failed
+            fleet_status.config(text=summary.describe(), fg="red" if failed else "green")
+        
+        def wave_done(stats):
+            fleet_status.config(text=stats.describe(), fg="orange")
+        
+        def start():
+            if state["runner"]:
+                return                  # One run at a time; the button is disabled until it finishes
+            targets = commands.parse_targets(targets_text.get("1.0", tk.END))
+            if not targets:
+                fleet_status.config(text="Enter at least one URL", fg="red")
+                return
+            try:
+                concurrency = concurrency_var.get()
+            except tk.TclError:
+                fleet_status.config(text="Max parallel must be a number", fg="red")
+                return
+            if not messagebox.askyesno("Confirm Fleet Shutdown", 
+                                       f"Are you sure you want to shutdown {len(targets)} target machines?",
+                                       icon="warning", parent=window):
+                return
+            
+            results_list.delete(0, tk.END)
+            state["tracked"] = []
+            state["results"].clear()
+            fleet_status.config(text=f"Sending shutdown to {len(targets)} targets...", fg="orange")
+            on_result = queue_result
+            on_done = lambda summary: self.dispatcher.call(fleet_done, summary)
+            if waves_var.get():
+                runner = waves.WaveRollout(ADMIN_TOKEN, command="shutdown", concurrency=concurrency)
+                runner.run_in_background(targets, on_result,
+                                         on_wave=lambda stats: self.dispatcher.call(wave_done, stats),
+                                         on_done=on_done)
+            else:
+                runner = fleet.FleetRunner(ADMIN_TOKEN, concurrency=concurrency)
+                runner.run_in_background(targets, on_result=on_result, on_done=on_done)
+            state["runner"] = runner
+            shutdown_button.config(state=tk.DISABLED)
+        
+        def cancel():
+            if state["runner"]:
+                state["runner"].cancel()
+                fleet_status.config(text="Cancelling...", fg="orange")
+        
+        buttons = tk.Frame(window)
+        buttons.pack(pady=5)
+        shutdown_button = tk.Button(buttons, text="SHUTDOWN FLEET", command=start, 
+                                    bg="red", fg="white", width=20, font=("Arial", 10, "bold"))
+        shutdown_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancel", command=cancel, width=10).pack(side=tk.LEFT, padx=5)
     
     def run(self):
         self.root.mainloop()
+        self.discovery.stop()
+        if self.status_stream:
+            self.status_stream.stop()
+        if self.registry_watcher:
+            self.registry_watcher.stop()
 
 if __name__ == "__main__":
     app = ShutdownController()
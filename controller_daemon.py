@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Headless controller daemon with warm connections and a local command socket
+
+Keeps the shared transport's pooled connections, RTT estimates and circuit
+breakers warm for every configured target, and accepts commands over
+localhost HTTP or a Unix domain socket. Scripts and cron jobs talk to it with
+controllerctl.py, which only needs the standard library, so a command is
+dispatched on an already-open connection instead of cold-starting requests and
+urllib3 and handshaking with the tunnel each time.
+
+    python controller_daemon.py --config config.json --targets hosts.txt
+    python controller_daemon.py --socket /tmp/rsc.sock      # Unix socket instead of TCP
+    python controller_daemon.py --stand-in                   # Adds a local stand-in agent as "stand-in"
+
+Targets are the profiles in config.json (name -> target_url, admin_token)
+plus the URLs in --targets files (named by host, using --agent-token).
+
+Over TCP every request needs a Bearer token. Without --token / RSC_DAEMON_TOKEN
+a random one is generated at start and written to TOKEN_FILE (mode 0600), where
+controllerctl.py picks it up. Requests carrying an Origin header (browsers) are
+refused, and POST bodies must be Content-Type: application/json, so a web page
+can't drive the daemon. On the 0600 Unix socket the token is optional.
+
+Endpoints (JSON):
+    GET  /status               daemon uptime and per-target health, RTT, heartbeat and
+                               shutdown confirmation (offline / still online), plus stragglers
+    GET  /targets              configured target names and URLs
+    POST /command              {"target": "lab-01", "command": "shutdown"}
+                               {"targets": ["lab-01", "lab-02"]} or {"all": true} for several
+    POST /reload               re-read the config and target files
+
+Command results use the same statuses as the controllers (commands.py):
+200 is ok, 401 is unauthorized, any other code is http_error.
+"""
+import argparse
+import json
+import os
+import secrets
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import commands
+import config_store
+import executor
+import fleet
+import health
+import shutdown_tracker
+import transport
+
+# CONFIG - Daemon defaults
+DEFAULT_PORT = 5060
+DEFAULT_SOCKET = os.environ.get("RSC_DAEMON_SOCKET", "")
+DAEMON_TOKEN = os.environ.get("RSC_DAEMON_TOKEN", "")   # Bearer token clients must send (generated for TCP if empty)
+TOKEN_FILE = os.environ.get("RSC_DAEMON_TOKEN_FILE", os.path.join(os.path.expanduser("~"), ".rsc_daemon_token"))
+DEFAULT_AGENT_TOKEN = "admin-shutdown-2024-token-secure"
+HEARTBEAT_INTERVAL = 20     # Seconds between keep-alive GET / per target (under the edge's idle timeout)
+HEARTBEAT_WORKERS = 16
+MAX_BODY = 1 << 20
+
+
+def write_token_file(token, path=TOKEN_FILE):
+    """Store the daemon token where only this user can read it"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.chmod(path, 0o600)              # The file may have existed with wider permissions
+
+
+def load_targets(config_path=None, target_files=(), agent_token=DEFAULT_AGENT_TOKEN):
+    """Return {name: {"url": ..., "token": ...}} from config.json profiles and target list files"""
+    targets = {}
+    if config_path and os.path.exists(config_path):
+        store = config_store.ConfigStore(config_path)
+        for name in store.profile_names():
+            profile = store.get_profile(name)
+            if profile.get("target_url"):
+                targets[name] = {"url": commands.base_url(profile["target_url"]),
+                                 "token": profile.get("admin_token") or agent_token}
+    for path in target_files:
+        with open(path, "r", encoding="utf-8") as f:
+            for url in commands.parse_targets(f.read()):
+                targets.setdefault(urlsplit(url).hostname or url, {"url": url, "token": agent_token})
+    return targets
+
+
+class ControllerDaemon:
+    """Target registry, heartbeat thread and command dispatch behind the IPC server"""
+
+    def __init__(self, targets=None, reload=None):
+        self.targets = dict(targets or {})
+        self.reload = reload                # Callable returning a fresh targets dict
+        self.started_at = time.time()
+        self.commands = 0
+        self.heartbeats = {}                # name -> {"ok", "ms", "at"}
+        self.executor = executor.CommandExecutor(max_workers=fleet.DEFAULT_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._heartbeat_loop, name="daemon-heartbeat", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def reload_targets(self):
+        if self.reload is not None:
+            targets = self.reload()
+            with self._lock:
+                self.targets = targets
+        return self.list_targets()
+
+    def list_targets(self):
+        with self._lock:
+            return {name: target["url"] for name, target in self.targets.items()}
+
+    def resolve(self, name):
+        """Look a target up by name or by URL; returns (name, target) or (None, None)"""
+        with self._lock:
+            if name in self.targets:
+                return name, self.targets[name]
+            url = commands.base_url(name)
+            for key, target in self.targets.items():
+                if target["url"] == url:
+                    return key, target
+        return None, None
+
+    # Commands ------------------------------------------------------------------
+
+    def command(self, names, command):
+        """Send command to each named target concurrently; returns result dicts in input order"""
+        futures = []
+        for name in names:
+            key, target = self.resolve(name)
+            if target is None:
+                futures.append((name, None, None))
+                continue
+            futures.append((key, target, self.executor.submit(
+                command, target["url"], commands.send_command, target["url"], target["token"], command,
+                deadline=transport.Deadline(fleet.TARGET_DEADLINE))))
+        results = []
+        for name, target, future in futures:
+            if future is None:
+                results.append({"name": name, "command": command, "status": "unknown_target",
+                                "describe": "❌ Unknown target"})
+                continue
+            result = future.result()
+            if result.ok and command == "shutdown":
+                shutdown_tracker.get_tracker().track(target["url"], target["token"], name=name)
+            results.append(dict(result.to_dict(), name=name, describe=result.describe()))
+        with self._lock:
+            self.commands += len(results)
+        return results
+
+    # Warm connections ------------------------------------------------------------
+
+    def _heartbeat(self, name, url):
+        start = time.perf_counter()
+        try:
+            transport.get(url + "/", verify=False)
+            ok = True
+        except health.CircuitOpenError:
+            return                          # The health monitor is already probing it
+        except Exception:
+            ok = False
+        self.heartbeats[name] = {"ok": ok, "ms": round((time.perf_counter() - start) * 1000, 1),
+                                 "at": round(time.time(), 1)}
+
+    def _heartbeat_loop(self):
+        pending = {}                    # name -> future of its last heartbeat
+        with ThreadPoolExecutor(max_workers=HEARTBEAT_WORKERS, thread_name_prefix="heartbeat") as pool:
+            while not self._stop.is_set():
+                targets = self.list_targets()
+                for name in [name for name in pending if name not in targets]:
+                    del pending[name]
+                for name, url in targets.items():
+                    if name in pending and not pending[name].done():
+                        continue        # Previous one still queued or running; don't pile up a backlog
+                    pending[name] = pool.submit(self._heartbeat, name, url)
+                self._stop.wait(HEARTBEAT_INTERVAL)
+
+    def status(self):
+        breakers = health.get_monitor().states()
+        rtts = transport.rtt_stats()
+        tracker = shutdown_tracker.get_tracker()
+        targets = {}
+        for name, url in self.list_targets().items():
+            key = health.target_key(url)
+            shutdown = tracker.get(url)
+            targets[name] = {
+                "url": url,
+                "health": breakers.get(key, {"state": health.CLOSED}),
+                "rtt": rtts.get(key),
+                "heartbeat": self.heartbeats.get(name),
+                "shutdown": shutdown.to_dict() if shutdown else None,
+            }
+        return {"uptime": round(time.time() - self.started_at, 1), "commands": self.commands, "targets": targets,
+                "stragglers": [host.name for host in tracker.stragglers()]}
+
+
+class _DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    daemon = None               # Set on the per-server subclass
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not self.token:
+            return True
+        return secrets.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.token}")
+
+    def _refused(self):
+        """Send an error and return True if the request must not be served"""
+        if self.headers.get("Origin") is not None:
+            self._send_json(403, {"error": "Browser requests are not accepted"})
+        elif not self._authorized():
+            self._send_json(401, {"error": "Unauthorized"})
+        else:
+            return False
+        return True
+
+    def do_GET(self):
+        if self._refused():
+            return
+        if self.path == "/status":
+            return self._send_json(200, self.daemon.status())
+        if self.path == "/targets":
+            return self._send_json(200, self.daemon.list_targets())
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self._refused():
+            return
+        if self.headers.get_content_type() != "application/json":
+            return self._send_json(415, {"error": "Content-Type must be application/json"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY:
+                return self._send_json(413, {"error": "Request too large"})
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "Body must be JSON"})
+        if not isinstance(body, dict):
+            return self._send_json(400, {"error": "Body must be a JSON object"})
+        if self.path == "/reload":
+            return self._send_json(200, self.daemon.reload_targets())
+        if self.path != "/command":
+            return self._send_json(404, {"error": "Not found"})
+
+        if body.get("all"):
+            names = list(self.daemon.list_targets())
+        else:
+            names = body.get("targets") or ([body["target"]] if body.get("target") else [])
+        if not names or not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return self._send_json(400, {"error": "target, targets or all is required"})
+        command = body.get("command") or "shutdown"
+        if not isinstance(command, str):
+            return self._send_json(400, {"error": "command must be a string"})
+        results = self.daemon.command(names, command)
+        self._send_json(200, {"results": results})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)       # BaseHTTPRequestHandler expects a (host, port) address
+
+
+class DaemonServer:
+    """Serves a ControllerDaemon over localhost TCP, or over a Unix socket when socket_path is set"""
+
+    def __init__(self, daemon, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, token=DAEMON_TOKEN):
+        self.daemon = daemon
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.token = token
+        self._server = None
+
+    @property
+    def address(self):
+        if self._server is None:
+            return None
+        if self.socket_path:
+            return f"unix:{self.socket_path}"
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def start(self):
+        if not self.socket_path and not self.token:
+            self.token = secrets.token_urlsafe(32)
+            write_token_file(self.token)
+            print(f"Generated a daemon token in {TOKEN_FILE}")
+        handler = type("DaemonHandler", (_DaemonHandler,), {
+            "daemon": self.daemon, "token": self.token,
+            "disable_nagle_algorithm": not self.socket_path,    # TCP_NODELAY fails on AF_UNIX
+        })
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)     # Left over from a daemon that didn't exit cleanly
+            self._server = _UnixHTTPServer(self.socket_path, handler)
+            os.chmod(self.socket_path, 0o600)   # Only this user may send commands
+        else:
+            self._server = ThreadingHTTPServer((self.host, self.port), handler)
+            self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        self.daemon.start()
+        return self.address
+
+    def stop(self):
+        self.daemon.stop()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless controller daemon (use controllerctl.py to talk to it)")
+    parser.add_argument("--config", default=config_store.DEFAULT_PATH, help="config.json with target profiles")
+    parser.add_argument("--targets", action="append", default=[], help="File with one target URL per line")
+    parser.add_argument("--agent-token", default=DEFAULT_AGENT_TOKEN, help="Token for --targets URLs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--token", default=DAEMON_TOKEN,
+                        help=f"Require this Bearer token from clients (TCP default: generated into {TOKEN_FILE})")
+    parser.add_argument("--stand-in", action="store_true", help="Start a local stand-in agent as target 'stand-in'")
+    args = parser.parse_args()
+
+    extra = {}
+    if args.stand_in:
+        from stand_in_agent import StandInAgent
+        extra["stand-in"] = {"url": StandInAgent(token=args.agent_token).start(), "token": args.agent_token}
+
+    def reload():
+        return dict(load_targets(args.config, args.targets, args.agent_token), **extra)
+
+    daemon = ControllerDaemon(reload(), reload)
+    server = DaemonServer(daemon, args.host, args.port, args.socket or None, args.token)
+    print(f"Controller daemon running at: {server.start()} ({len(daemon.targets)} targets)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
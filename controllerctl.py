@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Thin client for controller_daemon.py
+
+Only uses the standard library (no requests/urllib3 import), so a cron job or
+script pays for starting Python and one local round trip, and the daemon
+sends the command over its warm connection.
+
+    python controllerctl.py shutdown lab-01              # by profile name or URL
+    python controllerctl.py reboot lab-01 lab-02
+    python controllerctl.py shutdown --all
+    python controllerctl.py status
+    python controllerctl.py targets
+    python controllerctl.py --socket /tmp/rsc.sock shutdown lab-01 --json
+
+Exit codes: 0 every command was accepted (200), 1 at least one target
+failed, 2 the daemon could not be reached or refused the request.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+
+# CONFIG - Where the daemon listens (same defaults as controller_daemon.py)
+DAEMON_URL = os.environ.get("RSC_DAEMON_URL", "http://127.0.0.1:5060")
+DAEMON_SOCKET = os.environ.get("RSC_DAEMON_SOCKET", "")
+DAEMON_TOKEN = os.environ.get("RSC_DAEMON_TOKEN", "")
+TOKEN_FILE = os.environ.get("RSC_DAEMON_TOKEN_FILE", os.path.join(os.path.expanduser("~"), ".rsc_daemon_token"))
+TIMEOUT = 60                # The daemon bounds commands itself; this only guards against a hung daemon
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_DAEMON = 2
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def read_token(path=TOKEN_FILE):
+    """The token a TCP daemon generated at start, or "" if there is none"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def call(method, path, body=None, url=DAEMON_URL, socket_path=DAEMON_SOCKET, token=DAEMON_TOKEN):
+    """Send one request to the daemon; returns (status_code, payload)"""
+    if socket_path:
+        conn = _UnixConnection(socket_path)
+    else:
+        parts = url.split("://", 1)[-1].rstrip("/")
+        conn = http.client.HTTPConnection(parts, timeout=TIMEOUT)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send commands through the controller daemon")
+    parser.add_argument("--url", default=DAEMON_URL, help="Daemon address (TCP)")
+    parser.add_argument("--socket", default=DAEMON_SOCKET, help="Daemon Unix socket (overrides --url)")
+    parser.add_argument("--token", default=DAEMON_TOKEN, help=f"Daemon token (default: read from {TOKEN_FILE})")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON reply")
+    parser.add_argument("command", help="shutdown, reboot, restart-tunnel, ... or status / targets / reload")
+    parser.add_argument("targets", nargs="*", help="Target names or URLs")
+    parser.add_argument("--all", action="store_true", help="Every target the daemon knows")
+    args = parser.parse_args(argv)
+
+    if args.command in ("status", "targets"):
+        request = ("GET", f"/{args.command}", None)
+    elif args.command == "reload":
+        request = ("POST", "/reload", {})
+    elif args.all or args.targets:
+        request = ("POST", "/command", {"command": args.command, "all": args.all, "targets": args.targets})
+    else:
+        parser.error("give target names/URLs or --all")
+
+    token = args.token or ("" if args.socket else read_token())
+    try:
+        code, payload = call(*request, url=args.url, socket_path=args.socket, token=token)
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print(f"❌ Controller daemon not reachable: {e}", file=sys.stderr)
+        return EXIT_DAEMON
+    if code != 200:
+        print(f"❌ Daemon error {code}: {payload.get('error', '')}", file=sys.stderr)
+        return EXIT_DAEMON
+
+    if args.json or request[1] != "/command":
+        print(json.dumps(payload, indent=2, ensure_ascii=False))
+    if request[1] != "/command":
+        return EXIT_OK
+    results = payload["results"]
+    if not args.json:
+        for result in results:
+            print(f"{result['name']}: {result['describe']} ({result.get('elapsed_ms', 0)} ms)")
+    return EXIT_OK if all(result["status"] == "ok" for result in results) else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,68 +1,332 @@
-import requests
+#!/usr/bin/env python3
+"""
+Batch and benchmark tool for the controller request paths
+
+    python debug_controller.py status https://a.trycloudflare.com https://b.trycloudflare.com
+    python debug_controller.py dry-run shutdown -f hosts.txt --parallel 128
+    cat hosts.txt | python debug_controller.py run reboot --yes
+    python debug_controller.py bench --target http://127.0.0.1:5000 -n 200 --output run.json
+    python debug_controller.py bench --stand-in -n 200 --concurrency 8
+
+status, dry-run and run read targets from the arguments, from -f files ('-'
+is stdin) or from piped stdin. They run concurrently on the asyncio client
+(--parallel at a time) and print one JSON object per target as it finishes
+(NDJSON). A summary goes to stderr. dry-run only checks that the target is
+reachable and accepts the token; run really sends the command and needs --yes.
+Exit codes: 0 every target ok, 1 at least one failed, 2 usage error or no targets.
+
+bench issues N requests per endpoint and writes JSON with p50/p90/p99/max
+latency, throughput, error rate and a DNS / connect / TLS / time-to-first-byte
+breakdown per request.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import socket
+import ssl
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 import urllib3
 
+import async_client
+import commands
+import netcache
+import stats
+import transport
+
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Current tunnel URL from your system
-TUNNEL_URL = "https://bias-shoot-then-stickers.trycloudflare.com"
-SHUTDOWN_URL = f"{TUNNEL_URL}/shutdown"
-TOKEN = "admin-shutdown-2024-token-secure"
-
-def test_connection():
-    """Test basic connection to the tunnel"""
-    print("="*50)
-    print("TESTING CONTROLLER CONNECTION")
-    print("="*50)
-    
-    try:
-        print(f"1. Testing root URL: {TUNNEL_URL}")
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(TUNNEL_URL, headers=headers, verify=False, timeout=10)
-        
-        print(f"   Status Code: {response.status_code}")
-        print(f"   Response: {response.text[:200]}")
-        
-        if response.status_code == 200:
-            print("   ✅ Root connection successful!")
+TOKEN = os.environ.get("RSC_AGENT_TOKEN", "admin-shutdown-2024-token-secure")
+USER_AGENT = commands.USER_AGENT
+
+# CONFIG - Batch runs
+DEFAULT_PARALLEL = 64
+MAX_PARALLEL = 1024
+TARGET_DEADLINE = 30        # Seconds per target, retries included; starts when the target gets a slot
+
+EXIT_OK = 0
+EXIT_FAILED = 1             # At least one target failed
+EXIT_USAGE = 2              # Bad arguments or no targets
+
+DEFAULT_ENDPOINTS = ["GET /", "GET /status"]
+
+
+def read_targets(urls=(), files=()):
+    """Targets from the command line and from files ('-' is stdin); stdin is read when piped and nothing else is given"""
+    text = "\n".join(urls)
+    for path in files:
+        if path == "-":
+            text += "\n" + sys.stdin.read()
         else:
-            print("   ❌ Root connection failed!")
-            
+            with open(path, "r", encoding="utf-8") as f:
+                text += "\n" + f.read()
+    if not urls and not files and not sys.stdin.isatty():
+        text = sys.stdin.read()
+    return commands.parse_targets(text)
+
+
+async def run_batch(action, targets, token=TOKEN, command="shutdown", parallel=DEFAULT_PARALLEL,
+                    timeout=None, emit=None):
+    """Run one action against every target, at most `parallel` at a time; returns the records
+
+    action is "status" (GET /status), "dry-run" (the same authorized check,
+    reported as whether `command` would be accepted, nothing is sent) or
+    "run" (POST /<command> with retries). emit(record) is called as each
+    target finishes, so results stream out in completion order. Every target
+    gets its own TARGET_DEADLINE once it has a slot, so targets waiting behind
+    slow ones are never failed without being contacted.
+    """
+    limit = asyncio.Semaphore(max(1, min(parallel, MAX_PARALLEL)))
+
+    async def one(url):
+        async with limit:
+            deadline = transport.Deadline(TARGET_DEADLINE)
+            if action == "run":
+                result = await async_client.send_command(url, token, command, USER_AGENT, timeout=timeout,
+                                                         deadline=deadline)
+            else:
+                result = await async_client.probe(url, token, timeout, deadline)
+        record = dict(result.to_dict(), action=action)
+        if action == "dry-run":
+            record.update(command=command, would_send=result.ok)
+        return record
+
+    records = []
+    for finished in asyncio.as_completed([one(url) for url in targets]):
+        record = await finished
+        records.append(record)
+        if emit:
+            emit(record)
+    return records
+
+
+def _emit_ndjson(record):
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def timed_request(method, url, headers, timeout=10):
+    """Send one request on a fresh connection, timing each phase separately"""
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+    host = parts.hostname
+    port = parts.port or (443 if https else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    phases = {"dns_ms": 0.0, "connect_ms": 0.0, "tls_ms": 0.0, "ttfb_ms": 0.0, "total_ms": 0.0}
+    result = {"status_code": None, "error": None, "phases": phases}
+    start = time.perf_counter()
+    sock = None
+    try:
+        t0 = time.perf_counter()
+        family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        t1 = time.perf_counter()
+        phases["dns_ms"] = _ms(t1 - t0)
+
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect(address)
+        t2 = time.perf_counter()
+        phases["connect_ms"] = _ms(t2 - t1)
+
+        if https:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=host)
+        t3 = time.perf_counter()
+        phases["tls_ms"] = _ms(t3 - t2)
+
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.sock = sock
+        conn.request(method, path, headers=headers)
+        response = conn.getresponse()
+        t4 = time.perf_counter()
+        phases["ttfb_ms"] = _ms(t4 - t3)
+
+        response.read()
+        result["status_code"] = response.status
     except Exception as e:
-        print(f"   ❌ Error: {e}")
-    
-    print("\n" + "-"*50)
-    
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if sock is not None:
+            sock.close()
+        phases["total_ms"] = _ms(time.perf_counter() - start)
+    return result
+
+
+def pooled_request(method, url, headers, timeout=10):
+    """Send one request through the shared keep-alive transport (total time only)"""
+    result = {"status_code": None, "error": None, "phases": {"total_ms": 0.0}}
+    start = time.perf_counter()
     try:
-        print(f"2. Testing shutdown endpoint: {SHUTDOWN_URL}")
-        headers = {
-            "Authorization": f"Bearer {TOKEN}",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Content-Type": "application/json"
-        }
-        
-        print(f"   Headers: {headers}")
-        response = requests.post(SHUTDOWN_URL, headers=headers, verify=False, timeout=10)
-        
-        print(f"   Status Code: {response.status_code}")
-        print(f"   Response: {response.text}")
-        
-        if response.status_code == 200:
-            print("   ✅ Shutdown endpoint works! (BUT DON'T ACTUALLY SHUTDOWN)")
-        elif response.status_code == 401:
-            print("   ❌ Unauthorized - token mismatch")
-        elif response.status_code == 404:
-            print("   ❌ Endpoint not found - Flask may not be running")
-        else:
-            print(f"   ❌ Unexpected status code: {response.status_code}")
-            
-    except requests.exceptions.ConnectionError as e:
-        print(f"   ❌ Connection error: {e}")
-        print("   💡 Check if tunnel is still running")
+        response = transport.request(method, url, headers=headers, verify=False, timeout=timeout)
+        response.content
+        result["status_code"] = response.status_code
     except Exception as e:
-        print(f"   ❌ Error: {e}")
-    
-    print("="*50)
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["phases"]["total_ms"] = _ms(time.perf_counter() - start)
+    return result
+
+
+def summarize(samples, wall_time):
+    totals = sorted(s["phases"]["total_ms"] for s in samples)
+    errors = sum(1 for s in samples if s["error"] or not (200 <= (s["status_code"] or 0) < 300))
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / wall_time, 2) if wall_time else None,
+        "latency_ms": {
+            "p50": stats.percentile(totals, 0.50),
+            "p90": stats.percentile(totals, 0.90),
+            "p99": stats.percentile(totals, 0.99),
+            "max": totals[-1] if totals else None,
+        },
+        "phases_p50_ms": {},
+        "status_codes": {},
+    }
+    for phase in samples[0]["phases"] if samples else []:
+        summary["phases_p50_ms"][phase] = stats.percentile([s["phases"][phase] for s in samples], 0.50)
+    for s in samples:
+        key = str(s["status_code"]) if s["status_code"] else "error"
+        summary["status_codes"][key] = summary["status_codes"].get(key, 0) + 1
+    return summary
+
+
+def run_benchmark(target, endpoints, count, concurrency=1, mode="cold", token=TOKEN, timeout=10):
+    """Benchmark every endpoint and return the JSON-ready report"""
+    send = timed_request if mode == "cold" else pooled_request
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "User-Agent": USER_AGENT,
+        "Content-Type": "application/json",
+        "Content-Length": "0"
+    }
+    report = {
+        "target": target,
+        "mode": mode,
+        "requests_per_endpoint": count,
+        "concurrency": concurrency,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "endpoints": {},
+    }
+    for endpoint in endpoints:
+        method, path = endpoint.split(" ", 1)
+        url = f"{target.rstrip('/')}{path}"
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda _: send(method, url, headers, timeout), range(count)))
+        report["endpoints"][endpoint] = summarize(samples, time.perf_counter() - start)
+    if mode == "pooled":
+        report["connection_cache"] = netcache.stats()
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Remote shutdown controller debug/benchmark tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = argparse.ArgumentParser(add_help=False)
+    batch.add_argument("targets", nargs="*", help="Target URLs")
+    batch.add_argument("-f", "--file", action="append", default=[], dest="files",
+                       help="File with one target per line ('-' for stdin), repeatable")
+    batch.add_argument("--token", default=TOKEN, help="Agent token (default: $RSC_AGENT_TOKEN)")
+    batch.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL, help="Targets in flight at once")
+    batch.add_argument("--timeout", type=float, help="Per-request timeout (default: from measured RTT)")
+
+    sub.add_parser("status", parents=[batch], help="GET /status on every target")
+    dry = sub.add_parser("dry-run", parents=[batch], help="Check a command would be accepted, without sending it")
+    dry.add_argument("action", metavar="COMMAND", help="shutdown, reboot, restart-tunnel, ...")
+    run = sub.add_parser("run", parents=[batch], help="Send a command to every target")
+    run.add_argument("action", metavar="COMMAND", help="shutdown, reboot, restart-tunnel, ...")
+    run.add_argument("--yes", action="store_true", help="Really send it (required)")
+
+    bench = sub.add_parser("bench", help="Latency benchmark, JSON output")
+    bench.add_argument("--target", help="Base URL of the agent")
+    bench.add_argument("--stand-in", action="store_true", help="Benchmark a local stand_in_agent")
+    bench.add_argument("--token", default=TOKEN)
+    bench.add_argument("-n", "--requests", type=int, default=100, help="Requests per endpoint")
+    bench.add_argument("--concurrency", type=int, default=1)
+    bench.add_argument("--endpoint", action="append", dest="endpoints",
+                       help="'METHOD /path', repeatable (default: GET / and GET /status)")
+    bench.add_argument("--mode", choices=["cold", "pooled"], default="cold",
+                       help="cold: new connection per request with phase timings; "
+                            "pooled: shared keep-alive transport")
+    bench.add_argument("--timeout", type=float, default=10)
+    bench.add_argument("--output", help="Write JSON here instead of stdout")
+    return parser
+
+
+def run_batch_command(args):
+    if args.command == "run" and not args.yes:
+        print(f"Refusing to send {args.action} without --yes (try dry-run first)", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        targets = read_targets(args.targets, args.files)
+    except OSError as e:
+        print(f"Could not read targets: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not targets:
+        print("No targets given (arguments, -f file or stdin)", file=sys.stderr)
+        return EXIT_USAGE
+
+    start = time.perf_counter()
+    records = asyncio.run(run_batch(args.command, targets, args.token, getattr(args, "action", "status"),
+                                    args.parallel, args.timeout, emit=_emit_ndjson))
+    failed = sum(1 for record in records if record["status"] != "ok")
+    print(f"{len(records) - failed}/{len(records)} ok in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command != "bench":
+        return run_batch_command(args)
+
+    agent = None
+    target = args.target
+    if args.stand_in:
+        from stand_in_agent import StandInAgent
+        agent = StandInAgent(token=args.token)
+        target = agent.start()
+    if not target:
+        print("bench needs --target or --stand-in", file=sys.stderr)
+        return EXIT_USAGE
+
+    endpoints = args.endpoints or DEFAULT_ENDPOINTS
+    if any("shutdown" in e for e in endpoints) and not agent:
+        print("⚠️ Benchmarking /shutdown against a real agent will power it off!", file=sys.stderr)
+
+    report = run_benchmark(target, endpoints, args.requests, args.concurrency, args.mode,
+                           args.token, args.timeout)
+    if agent:
+        report["stand_in_stats"] = agent.stats.to_dict()
+        agent.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(output)
+    return EXIT_OK
+
 
 if __name__ == "__main__":
-    test_connection()
\ No newline at end of file
+    sys.exit(main())
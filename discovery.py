@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+LAN auto-discovery of shutdown agents via UDP broadcast
+
+Agents (or a helper running next to them) periodically broadcast a small JSON
+announcement; controllers listen on a background thread and keep a cache of
+live agents that expires entries which stop announcing. The announcement
+carries the agent's HTTP port (the LAN URL is built from the sender address)
+and its current tunnel URL, so discovered targets can use the direct path.
+
+    python discovery.py announce --port 5000 --tunnel-url https://xxxx.trycloudflare.com
+    python discovery.py listen
+
+Announcements are not authenticated; commands still need the admin token.
+On a single machine use --address 127.0.0.1 (loopback has no broadcast).
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+import uuid
+
+# CONFIG - Discovery protocol
+DISCOVERY_PORT = 50505
+BROADCAST_ADDRESS = "<broadcast>"
+ANNOUNCE_INTERVAL = 5.0     # Seconds between announcements
+SERVICE = "remote-shutdown"
+PROTOCOL_VERSION = 1
+
+
+class DiscoveredAgent:
+    """One agent seen on the LAN"""
+
+    def __init__(self, agent_id, name, lan_url, tunnel_url, expires_at):
+        self.agent_id = agent_id
+        self.name = name
+        self.lan_url = lan_url
+        self.tunnel_url = tunnel_url
+        self.last_seen = time.time()
+        self.expires_at = expires_at
+
+    @property
+    def url(self):
+        """Preferred URL: the direct LAN address, else the tunnel"""
+        return self.lan_url or self.tunnel_url
+
+    def label(self):
+        return f"{self.name} ({self.lan_url})"
+
+    def to_dict(self):
+        return {
+            "id": self.agent_id,
+            "name": self.name,
+            "lan_url": self.lan_url,
+            "tunnel_url": self.tunnel_url,
+            "last_seen": round(self.last_seen, 1),
+        }
+
+
+class Announcer:
+    """Periodically broadcasts this agent's presence"""
+
+    def __init__(self, port, name=None, tunnel_url=None, scheme="http", address=BROADCAST_ADDRESS,
+                 discovery_port=DISCOVERY_PORT, interval=ANNOUNCE_INTERVAL, agent_id=None):
+        self.port = port
+        self.name = name or socket.gethostname()
+        self.tunnel_url = tunnel_url
+        self.scheme = scheme
+        self.address = address
+        self.discovery_port = discovery_port
+        self.interval = interval
+        self.agent_id = agent_id or uuid.uuid4().hex
+        self.sent = 0
+        self._stop = threading.Event()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def message(self, ttl=None):
+        return {
+            "service": SERVICE,
+            "version": PROTOCOL_VERSION,
+            "id": self.agent_id,
+            "name": self.name,
+            "scheme": self.scheme,
+            "port": self.port,
+            "tunnel_url": self.tunnel_url,
+            "ttl": self.interval * 3 if ttl is None else ttl,
+        }
+
+    def announce(self, ttl=None):
+        payload = json.dumps(self.message(ttl)).encode("utf-8")
+        try:
+            self._sock.sendto(payload, (self.address, self.discovery_port))
+            self.sent += 1
+        except OSError as e:
+            print(f"Announcement failed: {e}")
+
+    def update(self, port=None, tunnel_url=None):
+        """Change the advertised port / tunnel URL and announce it right away"""
+        if port is not None:
+            self.port = port
+        if tunnel_url is not None:
+            self.tunnel_url = tunnel_url
+        self.announce()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.announce()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop announcing and tell listeners to drop this agent now"""
+        self._stop.set()
+        self.announce(ttl=0)
+        self._sock.close()
+
+
+class Discovery:
+    """Background listener keeping a cache of live agents
+
+    on_change(agents) runs on the listener thread whenever an agent appears,
+    changes or expires; UI code must hand it over to its own thread.
+    """
+
+    def __init__(self, port=DISCOVERY_PORT, bind="", on_change=None):
+        self.port = port
+        self.bind = bind
+        self.on_change = on_change
+        self.received = 0
+        self.error = None
+        self._agents = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sock = None
+
+    def start(self):
+        """Start listening; returns False (and sets .error) if the port can't be bound"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind((self.bind, self.port))
+        except OSError as e:
+            self.error = f"Discovery disabled: {e}"
+            print(self.error)
+            sock.close()
+            return False
+        sock.settimeout(0.5)
+        self._sock = sock
+        threading.Thread(target=self._run, daemon=True).start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def agents(self):
+        """Live agents sorted by name"""
+        with self._lock:
+            return sorted(self._agents.values(), key=lambda agent: (agent.name, agent.lan_url))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data, (host, _) = self._sock.recvfrom(4096)
+            except socket.timeout:
+                data = None
+            except OSError:
+                break
+            changed = self._handle(data, host) if data else False
+            if self._expire() or changed:
+                self._notify()
+        self._sock.close()
+
+    def _handle(self, data, host):
+        try:
+            message = json.loads(data.decode("utf-8"))
+            if message.get("service") != SERVICE:
+                return False
+            agent_id = str(message["id"])
+            lan_url = f"{message.get('scheme', 'http')}://{host}:{int(message['port'])}"
+            ttl = float(message.get("ttl", ANNOUNCE_INTERVAL * 3))
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+            return False
+
+        self.received += 1
+        with self._lock:
+            existing = self._agents.get(agent_id)
+            if ttl <= 0:
+                return self._agents.pop(agent_id, None) is not None
+            agent = DiscoveredAgent(agent_id, str(message.get("name") or host), lan_url,
+                                    message.get("tunnel_url"), time.time() + ttl)
+            self._agents[agent_id] = agent
+        return existing is None or (existing.name, existing.lan_url, existing.tunnel_url) != \
+            (agent.name, agent.lan_url, agent.tunnel_url)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [agent_id for agent_id, agent in self._agents.items() if agent.expires_at <= now]
+            for agent_id in expired:
+                del self._agents[agent_id]
+        return bool(expired)
+
+    def _notify(self):
+        if self.on_change:
+            try:
+                self.on_change(self.agents())
+            except Exception as e:
+                print(f"Discovery callback failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Announce or discover shutdown agents on the LAN")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    announce = sub.add_parser("announce", help="Broadcast this machine's agent")
+    announce.add_argument("--port", type=int, default=5000, help="Agent HTTP port")
+    announce.add_argument("--name", help="Display name (default: hostname)")
+    announce.add_argument("--tunnel-url", help="Current Cloudflare tunnel URL")
+    announce.add_argument("--address", default=BROADCAST_ADDRESS, help="Destination (127.0.0.1 on loopback)")
+    listen = sub.add_parser("listen", help="Print agents as they appear and expire")
+    listen.add_argument("--port", type=int, default=DISCOVERY_PORT)
+    args = parser.parse_args()
+
+    if args.mode == "announce":
+        announcer = Announcer(args.port, name=args.name, tunnel_url=args.tunnel_url, address=args.address).start()
+        print(f"Announcing {announcer.name} on UDP {DISCOVERY_PORT}. Press Ctrl+C to stop.")
+        stopper = announcer
+    else:
+        def show(agents):
+            print(json.dumps([agent.to_dict() for agent in agents], indent=2))
+        stopper = Discovery(args.port, on_change=show)
+        if not stopper.start():
+            return
+        print(f"Listening for agents on UDP {args.port}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stopper.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# executor.py - Shared bounded executor for button-triggered network work
+#
+# Button handlers submit work here instead of starting a raw thread per press.
+# Jobs are keyed by (action, target): pressing Test Connection again while one
+# is still in flight joins the existing future instead of queueing a duplicate,
+# and all work for a target can be cancelled when the user changes the URL.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# CONFIG - Worker threads shared by every button in the app
+MAX_WORKERS = 4
+
+_local = threading.local()
+
+
+class _Job:
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.cancelled = False
+
+
+class CommandExecutor:
+    """Bounded thread pool with per-(action, target) request coalescing"""
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="command")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0          # Submissions that joined an in-flight job
+
+    def submit(self, action, target, fn, *args, **kwargs):
+        """Run fn(*args) for (action, target), or return the future already in flight"""
+        key = (action, target)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled and not job.future.done():
+                self.coalesced += 1
+                return job.future
+            job = _Job(key)
+            self._jobs[key] = job
+            job.future = self._pool.submit(self._run, job, fn, args, kwargs)
+            return job.future
+
+    def _run(self, job, fn, args, kwargs):
+        _local.job = job
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.job = None
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+
+    def cancel(self, target):
+        """Cancel queued work for target and mark running work as stale"""
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if key[1] == target:
+                    job.cancelled = True
+                    job.future.cancel()
+                    del self._jobs[key]
+
+    def in_flight(self, action, target):
+        with self._lock:
+            return (action, target) in self._jobs
+
+
+def current_job_cancelled():
+    """True when called from a job whose target was cancelled (its results are stale)"""
+    job = getattr(_local, "job", None)
+    return job is not None and job.cancelled
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide executor, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = CommandExecutor()
+    return _executor
@@ -0,0 +1,95 @@
+# fleet.py - Concurrent fleet commands across many tunnel URLs
+#
+# Sends a command to a list of targets with a bounded worker pool. Results are
+# delivered to a callback as soon as each host answers so front-ends can stream
+# them into the UI, followed by a summary with the total wall-clock time.
+#
+# Each target gets its own deadline, started when a worker picks it up, so
+# hosts queued behind the concurrency limit are never failed without being
+# contacted. Per-request timeouts come from measured RTTs. An optional
+# run_timeout stops dispatching new targets once it passes; those are left out
+# of the results like cancelled ones.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import commands
+import transport
+
+# CONFIG - Keep this modest so a fleet run doesn't overwhelm the tunnel edge
+DEFAULT_CONCURRENCY = 16
+MAX_CONCURRENCY = 128
+TARGET_DEADLINE = 30        # Seconds per target, covering its retries
+
+
+class FleetSummary:
+    """Aggregate result of a fleet run"""
+
+    def __init__(self, results, elapsed, cancelled=False):
+        self.results = results
+        self.elapsed = elapsed
+        self.cancelled = cancelled
+
+    @property
+    def succeeded(self):
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self):
+        return len(self.results) - self.succeeded
+
+    def describe(self):
+        text = f"{self.succeeded}/{len(self.results)} succeeded in {self.elapsed:.1f}s"
+        if self.cancelled:
+            text += " (cancelled)"
+        return text
+
+
+class FleetRunner:
+    """Run one command against many targets with bounded concurrency"""
+
+    def __init__(self, token, concurrency=DEFAULT_CONCURRENCY, command="shutdown",
+                 user_agent=commands.USER_AGENT, timeout=None, deadline=TARGET_DEADLINE, run_timeout=None):
+        self.token = token
+        self.concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+        self.command = command
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.deadline = deadline
+        self.run_timeout = run_timeout
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop dispatching targets that have not started yet"""
+        self._cancel.set()
+
+    def _send(self, target, run_deadline):
+        if self._cancel.is_set() or (run_deadline is not None and run_deadline.expired):
+            return None
+        deadline = transport.Deadline(self.deadline) if self.deadline else None
+        return commands.send_command(target, self.token, self.command, user_agent=self.user_agent,
+                                     timeout=self.timeout, deadline=deadline)
+
+    def run(self, targets, on_result=None):
+        """Send the command to every target; blocks until done and returns a FleetSummary"""
+        start = time.perf_counter()
+        results = []
+        run_deadline = transport.Deadline(self.run_timeout) if self.run_timeout else None
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fleet") as pool:
+            futures = [pool.submit(self._send, target, run_deadline) for target in targets]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        return FleetSummary(results, time.perf_counter() - start, self._cancel.is_set())
+
+    def run_in_background(self, targets, on_result=None, on_done=None):
+        """Run on a daemon thread; on_done receives the FleetSummary"""
+        def worker():
+            summary = self.run(targets, on_result)
+            if on_done:
+                on_done(summary)
+        threading.Thread(target=worker, daemon=True).start()
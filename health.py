@@ -0,0 +1,254 @@
+# health.py - Per-target circuit breakers and a background health monitor
+#
+# When a tunnel is down, every click used to wait out a full connect timeout
+# before reporting "Connection failed". transport.request now reports every
+# outcome here. After FAILURE_THRESHOLD consecutive failures the target's circuit
+# opens, and requests to it fail at once with CircuitOpenError. The monitor
+# thread probes open targets (half-open) at growing intervals and closes the
+# circuit as soon as one answers. Listeners are told about every state change
+# so the UIs can show it.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+import transport
+
+# CONFIG - Circuit breaker
+FAILURE_THRESHOLD = 3       # Consecutive failures that open a circuit
+OPEN_INTERVAL = 1.0         # Seconds before the first half-open probe
+MAX_OPEN_INTERVAL = 60.0    # Probe interval doubles after each failed probe up to this
+PROBE_TIMEOUT = (2.0, 3.0)  # (connect, read) for the monitor's probes
+PROBE_WORKERS = 4           # Probes in flight at once, whatever the number of open circuits
+IDLE_EXPIRY = 600.0         # Breakers with no request for this long are dropped
+# Cloudflare answers these when the tunnel or the origin behind it is unreachable
+DOWN_STATUSES = frozenset({521, 522, 523, 530})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The target's circuit is open; the request was not sent"""
+
+
+def target_key(url):
+    """Breakers are kept per origin (scheme://host:port)"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed or open again"""
+
+    def __init__(self, key, threshold=FAILURE_THRESHOLD, interval=OPEN_INTERVAL):
+        self.key = key
+        self.threshold = threshold
+        self.base_interval = interval
+        self.interval = interval
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.retry_at = None
+        self.rejected = 0           # Requests failed fast while open
+        self.last_used = time.monotonic()   # Last request (not probe) checked against it
+        self._probing = False
+
+    def retry_in(self):
+        """Seconds until the next half-open probe (0 when not open)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def allow(self):
+        """True if a request may go out now; an open circuit past its wait lets exactly one probe through"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() >= self.retry_at and not self._probing:
+            self.state = HALF_OPEN
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, ok):
+        """Record an outcome; ok=None releases a probe without judging the target. Returns True if the state changed"""
+        before = self.state
+        self._probing = False
+        if ok is None:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+        elif ok:
+            self.state = CLOSED
+            self.failures = 0
+            self.interval = self.base_interval
+        else:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.interval = min(self.interval * 2, MAX_OPEN_INTERVAL)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self._open()
+        return self.state != before
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.retry_at = self.opened_at + self.interval
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "rejected": self.rejected,
+        }
+
+
+class HealthMonitor:
+    """Breakers for every target seen, plus a thread that probes open ones"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, interval=OPEN_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.probes = 0
+        self._breakers = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def breaker(self, url, touch=False):
+        key = target_key(url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, self.threshold, self.interval)
+            if touch:
+                breaker.last_used = time.monotonic()
+            return breaker
+
+    def state(self, url):
+        return self.breaker(url).state
+
+    def add_listener(self, callback):
+        """callback(key, breaker) runs on the reporting thread after every state change"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def check(self, url):
+        """Raise CircuitOpenError unless a request to url may be sent now"""
+        breaker = self.breaker(url, touch=True)
+        if not self._allow(breaker):
+            raise CircuitOpenError(f"{breaker.key} is down (circuit open, next probe in {breaker.retry_in():.0f}s)")
+
+    def _allow(self, breaker):
+        with self._lock:
+            allowed = breaker.allow()
+            moved = allowed and breaker.state == HALF_OPEN
+        if moved:
+            self._notify(breaker)
+        return allowed
+
+    def record(self, url, ok):
+        breaker = self.breaker(url)
+        with self._lock:
+            changed = breaker.record(ok)
+        if changed:
+            if breaker.state == OPEN:
+                self._ensure_thread()
+                self._wake.set()
+            self._notify(breaker)
+
+    def record_response(self, url, response):
+        self.record(url, response.status_code not in DOWN_STATUSES)
+
+    def reset(self, url=None):
+        """Forget one target's breaker (or all of them)"""
+        with self._lock:
+            if url is None:
+                self._breakers.clear()
+            else:
+                self._breakers.pop(target_key(url), None)
+
+    def states(self):
+        with self._lock:
+            return {key: breaker.to_dict() for key, breaker in self._breakers.items()}
+
+    def _notify(self, breaker):
+        for callback in list(self._listeners):
+            try:
+                callback(breaker.key, breaker)
+            except Exception as e:
+                print(f"Health listener failed: {e}")
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="health-probe")
+                self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+                self._thread.start()
+
+    def _expire(self):
+        """Drop breakers no request has used for IDLE_EXPIRY seconds (unless a probe is out)"""
+        cutoff = time.monotonic() - IDLE_EXPIRY
+        with self._lock:
+            idle = [key for key, b in self._breakers.items() if b.last_used < cutoff and b.state != HALF_OPEN]
+            for key in idle:
+                del self._breakers[key]
+
+    def _run(self):
+        while True:
+            self._expire()
+            with self._lock:
+                waits = [b.retry_in() for b in self._breakers.values() if b.state == OPEN]
+            self._wake.wait(min(waits + [IDLE_EXPIRY]))
+            self._wake.clear()
+            with self._lock:
+                due = [b for b in self._breakers.values() if b.state == OPEN and b.retry_in() <= 0]
+            for breaker in due:
+                if not self._allow(breaker):
+                    continue                # A user request is already acting as the probe
+                # A blackholed target holds one worker for PROBE_TIMEOUT, not the loop;
+                # a breaker stays half-open until its probe reports, so it is never queued twice
+                self._pool.submit(self._probe, breaker)
+
+    def _probe(self, breaker):
+        with self._lock:
+            self.probes += 1
+        try:
+            response = transport.get_session().get(breaker.key + "/", timeout=PROBE_TIMEOUT, verify=False)
+            ok = response.status_code not in DOWN_STATUSES
+        except requests.exceptions.RequestException:
+            ok = False
+        self.record(breaker.key, ok)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """Return the process-wide monitor, creating it on first use"""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = HealthMonitor()
+    return _monitor
+
+
+def describe(breaker):
+    """Short status text for a breaker state change"""
+    if breaker.state == OPEN:
+        return f"Target down - next check in {breaker.retry_in():.0f}s"
+    if breaker.state == HALF_OPEN:
+        return "Target down - checking again..."
+    return "Target reachable again"
@@ -0,0 +1,66 @@
+# kivy_async.py - Run the Kivy apps on asyncio and start UI coroutines from handlers
+#
+# run_app() starts an app through App.async_run on an asyncio loop, so button
+# handlers run on that loop and can start coroutines that await async_client
+# calls and update widgets directly: no worker threads, no Clock hops. Tasks
+# are keyed by (action, target) like executor.py. Pressing a button again
+# joins the task already running, and changing the URL really cancels that
+# target's tasks instead of just marking their results stale.
+import asyncio
+
+
+class AsyncTasks:
+    """Coroutine tasks on the app's loop with per-(action, target) coalescing"""
+
+    def __init__(self):
+        self._tasks = {}
+        self.coalesced = 0
+
+    def spawn(self, action, target, coro_fn, *args, **kwargs):
+        """Start coro_fn(*args) for (action, target), or return the task already running
+
+        Must be called on the app's loop (i.e. from a Kivy handler of an app
+        started with run_app).
+        """
+        key = (action, target)
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            self.coalesced += 1
+            return task
+        task = asyncio.get_running_loop().create_task(coro_fn(*args, **kwargs))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return task
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Task {key[0]} for {key[1]} failed: {task.exception()}")
+
+    def cancel(self, target):
+        """Cancel every task for target; their awaits raise CancelledError and their connections close"""
+        for key, task in list(self._tasks.items()):
+            if key[1] == target:
+                task.cancel()
+                del self._tasks[key]
+
+    def in_flight(self, action, target):
+        task = self._tasks.get((action, target))
+        return task is not None and not task.done()
+
+
+_tasks = None
+
+
+def get_tasks():
+    """Return the process-wide task registry (only touched from the UI loop, so no lock)"""
+    global _tasks
+    if _tasks is None:
+        _tasks = AsyncTasks()
+    return _tasks
+
+
+def run_app(app):
+    """Run a Kivy App on an asyncio event loop until it closes"""
+    asyncio.run(app.async_run(async_lib="asyncio"))
@@ -0,0 +1,121 @@
+# kivy_status.py - Coalesced status updates and frame-time measurement for the Kivy apps
+#
+# Worker threads used to schedule a separate Clock closure per status message.
+# StatusModel instead keeps only the latest pending state and applies it once
+# per frame through a single Clock trigger, so polling bursts cost one redraw.
+import os
+import threading
+import time
+
+from kivy.clock import Clock
+
+import stats
+
+# CONFIG - Set RSC_FRAME_STATS=1 to print frame-time stats every few seconds, and
+# RSC_STATUS_STRESS=<updates per second> to flood the status from a worker thread
+FRAME_STATS_ENABLED = os.environ.get("RSC_FRAME_STATS") == "1"
+STATUS_STRESS_RATE = int(os.environ.get("RSC_STATUS_STRESS", "0"))
+FRAME_STATS_INTERVAL = 5.0
+FRAME_BUDGET_MS = 1000.0 / 60
+
+
+class StatusModel:
+    """Latest-wins status holder applied at most once per frame"""
+
+    def __init__(self, apply):
+        self._apply = apply
+        self._pending = None
+        self._lock = threading.Lock()
+        self._trigger = Clock.create_trigger(self._flush, -1)
+        self.posted = 0         # set() calls from any thread
+        self.merged = 0         # Updates replaced before they were drawn
+        self.applied = 0        # Updates actually applied to widgets
+
+    def set(self, *args):
+        """Record a new status; safe to call from any thread"""
+        with self._lock:
+            self.posted += 1
+            if self._pending is not None:
+                self.merged += 1
+            self._pending = args
+        self._trigger()
+
+    def _flush(self, dt):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        self.applied += 1
+        self._apply(*pending)
+
+    def stats(self):
+        with self._lock:
+            return {"posted": self.posted, "merged": self.merged, "applied": self.applied}
+
+
+class FrameTimer:
+    """Records frame intervals via the Kivy Clock and reports p50/p95/max and budget overruns"""
+
+    def __init__(self, name="app", interval=FRAME_STATS_INTERVAL, models=()):
+        self.name = name
+        self.interval = interval
+        self.models = list(models)
+        self._frames = []
+        self._last = None
+        self._tick_event = None
+        self._report_event = None
+
+    def start(self):
+        self._last = time.perf_counter()
+        self._tick_event = Clock.schedule_interval(self._tick, 0)
+        self._report_event = Clock.schedule_interval(self._report, self.interval)
+
+    def stop(self):
+        for event in (self._tick_event, self._report_event):
+            if event is not None:
+                event.cancel()
+
+    def _tick(self, dt):
+        now = time.perf_counter()
+        self._frames.append((now - self._last) * 1000)
+        self._last = now
+
+    def snapshot(self):
+        frames = sorted(self._frames)
+        if not frames:
+            return {"frames": 0}
+        return {
+            "frames": len(frames),
+            "p50_ms": round(stats.percentile(frames, 0.50), 2),
+            "p95_ms": round(stats.percentile(frames, 0.95), 2),
+            "max_ms": round(frames[-1], 2),
+            "over_budget": sum(1 for f in frames if f > FRAME_BUDGET_MS * 1.5),
+        }
+
+    def _report(self, dt):
+        stats = self.snapshot()
+        for i, model in enumerate(self.models):
+            stats[f"status_{i}"] = model.stats()
+        print(f"[frames:{self.name}] {stats}")
+        self._frames = []
+
+
+def _stress(model, rate):
+    """Post status updates at `rate` per second, like aggressive polling would"""
+    i = 0
+    while True:
+        model.set(f"Stress update {i}")
+        i += 1
+        time.sleep(1.0 / rate)
+
+
+def start_frame_stats(name, *models):
+    """Start a FrameTimer when RSC_FRAME_STATS=1; returns it (or None)"""
+    if not FRAME_STATS_ENABLED:
+        return None
+    timer = FrameTimer(name, models=models)
+    timer.start()
+    if STATUS_STRESS_RATE:
+        for model in models:
+            threading.Thread(target=_stress, args=(model, STATUS_STRESS_RATE), daemon=True).start()
+    return timer
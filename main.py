@@ -7,6 +7,7 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.popup import Popup
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.spinner import Spinner
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.clock import Clock
 from kivy.metrics import dp
@@ -14,7 +15,22 @@ from kivy.core.window import Window
 from kivy.properties import StringProperty
 import requests
 import urllib3
-import threading
+import executor
+import async_client
+import kivy_async
+import health
+import status_stream
+import registry
+from kivy_status import StatusModel, start_frame_stats
+import fleet
+import commands
+import config_store
+import multipath
+import retry
+import shutdown_tracker
+import discovery
+from activity_log import ActivityLog, ActivityLogView
+import time
 
 # Set the app to portrait mode
 Window.orientation = 'portrait'
@@ -25,6 +41,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 # CONFIG - Default values
 DEFAULT_TARGET_URL = "https://your-cloudflare-url.trycloudflare.com/shutdown"
 DEFAULT_ADMIN_TOKEN = "admin-shutdown-2024-token-secure"
+FLEET_RESULT_ROWS = 2000    # Fleet result lines kept on screen (oldest are dropped)
 
 class SettingsPanel(BoxLayout):
     title = StringProperty("Settings")
@@ -152,6 +169,7 @@ class SettingsPanel(BoxLayout):
         new_token = self.token_input.text.strip()
         if new_token:
             self.app_instance.admin_token = new_token
+            self.app_instance.config_store.set_profile(admin_token=new_token)
             self.settings_status.text = "✅ Token saved successfully!"
             self.settings_status.color = (0, 1, 0, 1)
         else:
@@ -162,6 +180,7 @@ class SettingsPanel(BoxLayout):
         """Reset all settings to default values"""
         self.token_input.text = DEFAULT_ADMIN_TOKEN
         self.app_instance.admin_token = DEFAULT_ADMIN_TOKEN
+        self.app_instance.config_store.set_profile(admin_token=DEFAULT_ADMIN_TOKEN)
         self.settings_status.text = "🔄 Settings reset to defaults"
         self.settings_status.color = (0, 0, 1, 1)
 
@@ -171,6 +190,9 @@ class MobileShutdownController(BoxLayout):
     
     def __init__(self, app_instance, **kwargs):
         super().__init__(**kwargs)
+        # Latest-wins status applied once per frame instead of a Clock event per message
+        self.status_model = StatusModel(self._apply_status)
+        self.frame_timer = start_frame_stats(type(self).__module__, self.status_model)
         self.app_instance = app_instance
         self.orientation = 'vertical'
         self.spacing = dp(10)
@@ -187,7 +209,7 @@ class MobileShutdownController(BoxLayout):
         self.add_widget(title)
         
         # URL input section
-        url_section = BoxLayout(orientation='vertical', size_hint_y=None, height=dp(120))
+        url_section = BoxLayout(orientation='vertical', size_hint_y=None, height=dp(210))
         url_section.add_widget(Label(
             text='Cloudflare Tunnel URL:',
             font_size=dp(16),
@@ -205,6 +227,41 @@ class MobileShutdownController(BoxLayout):
         )
         url_section.add_widget(self.url_input)
         
+        # Optional direct address; commands race it against the tunnel and use whichever connects first
+        self.lan_input = TextInput(
+            hint_text='LAN address (optional), e.g. 192.168.1.20:5000',
+            multiline=False,
+            size_hint_y=None,
+            height=dp(40),
+            font_size=dp(14)
+        )
+        url_section.add_widget(self.lan_input)
+        
+        # Agents announcing themselves on the LAN; picking one fills both fields
+        self.discovered = {}
+        self.discovered_spinner = Spinner(
+            text='No agents discovered on LAN',
+            values=[],
+            size_hint_y=None,
+            height=dp(40),
+            font_size=dp(14)
+        )
+        self.discovered_spinner.bind(text=self.on_discovered_selected)
+        url_section.add_widget(self.discovered_spinner)
+        
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.tasks = kivy_async.get_tasks()
+        self.status_stream = None
+        self.current_target = self.url_input.text.strip()
+        health.get_monitor().add_listener(self._on_circuit_change)
+        self.url_input.bind(text=self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(
+            lambda record: Clock.schedule_once(lambda dt: self.on_tunnel_moved(record))
+        )
+        
         update_url_btn = Button(
             text='Update URL',
             size_hint_y=None,
@@ -260,7 +317,8 @@ class MobileShutdownController(BoxLayout):
                 "1. Configure your admin token in the Settings tab\n\n"
                 "2. Run start_cloudflare.bat on the target machine\n\n"
                 "3. Copy the Cloudflare URL from the terminal output\n\n"
-                "4. Paste it above and add '/shutdown' to the end\n\n"
+                "4. Paste it above and add '/shutdown' to the end\n"
+                "   (or pick the agent from the discovered-on-LAN list)\n\n"
                 "5. Click 'Test Connection' to verify connectivity\n\n"
                 "6. Click 'SHUTDOWN TARGET' to send shutdown command\n\n"
                 "Note: Make sure the tunnel is running before attempting connection."
@@ -277,11 +335,15 @@ class MobileShutdownController(BoxLayout):
     
     def update_status(self, message, color=(0, 0, 0, 1)):
         """Update status label with message and color"""
-        def update_ui():
-            self.status_label.text = message
-            self.status_label.color = color
+        if executor.current_job_cancelled():
+            return
         
-        Clock.schedule_once(lambda dt: update_ui())
+        self.status_model.set(message, color)
+    
+    def _apply_status(self, message, color=(0, 0, 0, 1)):
+        """Apply the latest status to the widgets (runs at most once per frame)"""
+        self.status_label.text = message
+        self.status_label.color = color
     
     def update_url(self, instance):
         """Update URL with /shutdown endpoint if needed"""
@@ -293,32 +355,112 @@ class MobileShutdownController(BoxLayout):
                 else:
                     current_url += 'shutdown'
                 self.url_input.text = current_url
+            self.app_instance.config_store.set_profile(target_url=current_url, lan_url=self.lan_input.text.strip())
             self.update_status("URL updated", (0, 0, 1, 1))
         else:
             self.show_popup("Error", "Please enter a URL first!")
     
+    def on_url_changed(self, instance, value):
+        """Cancel in-flight requests for the previous URL when the user edits it"""
+        new_target = value.strip()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.tasks.cancel(self.current_target)
+            self.current_target = new_target
+            if self.status_stream and self.status_stream.url != commands.base_url(new_target):
+                self.status_stream.stop()
+                self.status_stream = None
+    
+    def watch_status(self, url):
+        """Keep the status live over the agent's /events stream instead of a one-shot probe"""
+        if self.status_stream:
+            self.status_stream.stop()
+        self.status_stream = status_stream.StatusStream(
+            url, self.app_instance.admin_token, on_event=self._on_stream_event, on_state=self._on_stream_state
+        ).start()
+    
+    def _on_stream_state(self, state, detail):
+        if state == "live":
+            self.update_status("🟢 Live: agent online", (0, 1, 0, 1))
+        elif state == "reconnecting":
+            self.update_status(f"🟠 Reconnecting status stream ({detail})", (1, 0.6, 0, 1))
+    
+    def _on_circuit_change(self, key, breaker):
+        """Show the current target's circuit breaker state (called from whichever thread saw the change)"""
+        if key != health.target_key(self.current_target):
+            return
+        colors = {health.OPEN: (1, 0, 0, 1), health.HALF_OPEN: (1, 0.6, 0, 1), health.CLOSED: (0, 1, 0, 1)}
+        self.update_status(f"⛔ {health.describe(breaker)}" if breaker.state != health.CLOSED
+                           else f"🟢 {health.describe(breaker)}", colors[breaker.state])
+    
+    def _on_stream_event(self, event, data):
+        if event == "shutdown":
+            self.update_status("⏻ Agent accepted shutdown", (1, 0, 0, 1))
+        elif event == "tunnel":
+            # The stream already follows the agent; move the URL field along with it
+            new_url = commands.command_url(data["tunnel_url"], "shutdown")
+            Clock.schedule_once(lambda dt: setattr(self.url_input, 'text', new_url))
+    
+    def show_discovered(self, agents):
+        """Refresh the discovered-agents list (UI thread)"""
+        self.discovered = {agent.label(): agent for agent in agents}
+        self.discovered_spinner.values = list(self.discovered)
+        if self.discovered_spinner.text not in self.discovered:
+            self.discovered_spinner.text = (f"{len(agents)} agent(s) discovered on LAN" if agents
+                                            else 'No agents discovered on LAN')
+    
+    def on_discovered_selected(self, spinner, text):
+        agent = self.discovered.get(text)
+        if agent is None:
+            return
+        self.url_input.text = commands.command_url(agent.tunnel_url or agent.lan_url, "shutdown")
+        self.lan_input.text = agent.lan_url
+        self.update_status(f"Selected {agent.name}", (0, 0, 1, 1))
+    
+    def target_endpoints(self, url):
+        """LAN address first (preferred), then the tunnel"""
+        return multipath.endpoints(self.lan_input.text, url)
+    
+    def on_tunnel_moved(self, record):
+        """Switch to the agent's new tunnel URL as soon as it is published"""
+        new_url = registry.follow(self.url_input.text, record)
+        if not new_url:
+            return
+        self.url_input.text = new_url
+        self.update_status(f"🔄 {registry.describe_move(record)}", (0, 0, 1, 1))
+        self.executor.submit("reconnect", new_url, self._reconnect_thread, new_url, record["restarted_at"])
+    
+    def _reconnect_thread(self, url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("❌ New tunnel URL is not answering", (1, 0, 0, 1))
+        else:
+            print(f"Reconnected to {url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"✅ Reconnected {reconnect_ms:.0f} ms after tunnel restart", (0, 1, 0, 1))
+    
     def test_connection(self, instance):
         """Test connection to the target URL"""
         self.update_status("Testing connection...", (1, 0.6, 0, 1))
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.tasks.spawn("test", url, self._test_connection_async, url, self.target_endpoints(url))
     
-    def _test_connection_thread(self):
-        """Background thread for testing connection"""
+    async def _test_connection_async(self, url, endpoint_list):
+        """Test the connection on the app's event loop (cancelled if the URL changes)"""
         try:
-            url = self.url_input.text.strip()
             if not url or url == DEFAULT_TARGET_URL:
                 self.update_status("Please update the URL first!", (1, 0, 0, 1))
                 return
             
-            # Test basic connection to root
-            base_url = url.replace('/shutdown', '/')
+            # Test basic connection to root over the fastest path
             headers = {"User-Agent": "Mozilla/5.0 (Android) Mobile Controller"}
             
-            print(f"Testing connection to: {base_url}")
-            response = requests.get(base_url, headers=headers, verify=False, timeout=10)
+            print(f"Testing connection to: {', '.join(endpoint_list)}")
+            response = await async_client.request_any(endpoint_list, "GET", "/", headers=headers)
             
             if response.status_code == 200:
-                self.update_status("✅ Connection successful! Ready to shutdown.", (0, 1, 0, 1))
+                self.update_status(f"✅ Connection successful via {response.url}", (0, 1, 0, 1))
+                self.watch_status(response.url)
                 print(f"Connection test passed: {response.status_code}")
             else:
                 self.update_status(f"⚠️ Got response code {response.status_code}", (1, 0.6, 0, 1))
@@ -331,8 +473,14 @@ class MobileShutdownController(BoxLayout):
             self.update_status(f"❌ Error: {str(e)[:30]}...", (1, 0, 0, 1))
             print(f"Test error: {e}")
     
+    def warm_connection(self, url):
+        """Open a pooled connection to the target while the user is still confirming"""
+        if url and url != DEFAULT_TARGET_URL:
+            self.executor.submit("warm", url, multipath.warm, self.target_endpoints(url))
+    
     def confirm_shutdown(self, instance):
         """Show confirmation popup before shutdown"""
+        self.warm_connection(self.url_input.text.strip())
         content = BoxLayout(orientation='vertical', spacing=dp(10))
         content.add_widget(Label(
             text='Are you sure you want to shutdown the target machine?',
@@ -357,21 +505,21 @@ class MobileShutdownController(BoxLayout):
             auto_dismiss=False
         )
         
-        yes_btn.bind(on_press=lambda x: self.execute_shutdown(popup))
+        yes_btn.bind(on_press=lambda x: self.execute_shutdown(popup, time.perf_counter()))
         no_btn.bind(on_press=popup.dismiss)
         
         popup.open()
     
-    def execute_shutdown(self, popup):
+    def execute_shutdown(self, popup, pressed_at):
         """Execute the shutdown command"""
         popup.dismiss()
         self.update_status("Sending shutdown command...", (1, 0.6, 0, 1))
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.executor.submit("shutdown", url, self._shutdown_thread, url, self.target_endpoints(url), pressed_at)
     
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, url, endpoint_list, pressed_at):
         """Background thread for shutdown operation"""
         try:
-            url = self.url_input.text.strip()
             if not url or url == DEFAULT_TARGET_URL:
                 self.update_status("Please update the URL first!", (1, 0, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Error", "Please update the tunnel URL first!"))
@@ -383,15 +531,21 @@ class MobileShutdownController(BoxLayout):
                 "Content-Type": "application/json"
             }
             
-            print(f"Sending shutdown command to: {url}")
-            response = requests.post(url, headers=headers, verify=False, timeout=10)
+            print(f"Sending shutdown command to: {', '.join(endpoint_list)}")
+            def on_retry(attempt, wait, reason):
+                self.update_status(f"Retrying after {reason} ({attempt + 1}/{retry.MAX_ATTEMPTS})...", (1, 0.6, 0, 1))
+
+            response = retry.request("POST", endpoint_list, "/shutdown", headers=headers, verify=False, on_retry=on_retry)
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
+            print(f"Shutdown acknowledged {ack_ms:.0f} ms after YES via {response.url}")
             
             print(f"Response Status Code: {response.status_code}")
             print(f"Response Text: {response.text}")
             
             if response.status_code == 200:
-                self.update_status("✅ Shutdown command sent successfully!", (0, 1, 0, 1))
+                self.update_status(f"✅ Shutdown command sent successfully! ({ack_ms:.0f} ms) Confirming...", (0, 1, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Success", "Shutdown command accepted!"))
+                shutdown_tracker.get_tracker().track(response.url, self.app_instance.admin_token, on_done=self._on_offline)
             elif response.status_code == 401:
                 self.update_status("❌ Unauthorized - wrong token", (1, 0, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Unauthorized", "Invalid token."))
@@ -407,6 +561,12 @@ class MobileShutdownController(BoxLayout):
             self.update_status("❌ Error occurred", (1, 0, 0, 1))
             Clock.schedule_once(lambda dt: self.show_popup("Error", error_msg))
     
+    def _on_offline(self, host):
+        """The shutdown tracker saw the target go offline, or gave up waiting"""
+        print(f"{host.url}: {host.describe()} ({host.checks} checks)")
+        color = (0, 1, 0, 1) if host.state == shutdown_tracker.OFFLINE else (1, 0.6, 0, 1)
+        self.update_status(host.describe(), color)
+    
     def show_popup(self, title, message):
         """Show a popup message"""
         content = Label(
@@ -424,6 +584,234 @@ class MobileShutdownController(BoxLayout):
         popup.open()
 
 
+class FleetPanel(BoxLayout):
+    title = StringProperty("Fleet")
+    
+    def __init__(self, app_instance, **kwargs):
+        super().__init__(**kwargs)
+        self.app_instance = app_instance
+        self.orientation = 'vertical'
+        self.spacing = dp(10)
+        self.padding = dp(20)
+        self.runner = None
+        self.run_text = ''
+        self.run_failed = False
+        self.tracked = []
+        self._offline_trigger = Clock.create_trigger(lambda dt: self._show_offline())
+        
+        # Title
+        title = Label(
+            text='Fleet Shutdown',
+            font_size=dp(20),
+            size_hint_y=None,
+            height=dp(40),
+            bold=True
+        )
+        self.add_widget(title)
+        
+        # Targets section
+        self.add_widget(Label(
+            text='Tunnel URLs (one per line):',
+            font_size=dp(16),
+            size_hint_y=None,
+            height=dp(30),
+            bold=True
+        ))
+        
+        self.targets_input = TextInput(
+            multiline=True,
+            size_hint_y=None,
+            height=dp(140),
+            font_size=dp(13),
+            hint_text='https://host-1.trycloudflare.com\nhttps://host-2.trycloudflare.com'
+        )
+        self.add_widget(self.targets_input)
+        
+        # Concurrency section
+        concurrency_row = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40), spacing=dp(10))
+        concurrency_row.add_widget(Label(text='Max parallel:', font_size=dp(14)))
+        self.concurrency_input = TextInput(
+            text=str(fleet.DEFAULT_CONCURRENCY),
+            multiline=False,
+            input_filter='int',
+            font_size=dp(14)
+        )
+        concurrency_row.add_widget(self.concurrency_input)
+        self.discovered_agents = []
+        self.add_discovered_btn = Button(
+            text='Add LAN agents (0)',
+            background_color=(0.2, 0.6, 1, 1),
+            font_size=dp(14)
+        )
+        self.add_discovered_btn.bind(on_press=self.add_discovered)
+        concurrency_row.add_widget(self.add_discovered_btn)
+        self.add_widget(concurrency_row)
+        
+        # Control buttons
+        button_row = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(50), spacing=dp(10))
+        
+        self.shutdown_btn = Button(
+            text='SHUTDOWN FLEET',
+            background_color=(1, 0.2, 0.2, 1),
+            font_size=dp(16),
+            bold=True
+        )
+        self.shutdown_btn.bind(on_press=self.confirm_fleet_shutdown)
+        button_row.add_widget(self.shutdown_btn)
+        
+        cancel_btn = Button(
+            text='Cancel',
+            background_color=(0.5, 0.5, 0.5, 1),
+            font_size=dp(16)
+        )
+        cancel_btn.bind(on_press=self.cancel_fleet)
+        button_row.add_widget(cancel_btn)
+        
+        self.add_widget(button_row)
+        
+        # Status section
+        self.fleet_status = Label(
+            text='Ready',
+            font_size=dp(14),
+            color=(0, 1, 0, 1),
+            size_hint_y=None,
+            height=dp(50)
+        )
+        self.add_widget(self.fleet_status)
+        
+        # Per-host results: bounded ring buffer, only the visible rows get a texture
+        self.results_log = ActivityLog(capacity=FLEET_RESULT_ROWS)
+        self.add_widget(ActivityLogView(self.results_log, color=(1, 1, 1, 1), font_size=dp(12)))
+    
+    def show_discovered(self, agents):
+        self.discovered_agents = agents
+        self.add_discovered_btn.text = f'Add LAN agents ({len(agents)})'
+
+    def add_discovered(self, instance):
+        """Append discovered agents (direct LAN URLs) that aren't listed yet"""
+        targets = commands.parse_targets(self.targets_input.text)
+        new = [agent.url for agent in self.discovered_agents if agent.url not in targets]
+        if new:
+            text = self.targets_input.text.rstrip()
+            self.targets_input.text = (text + '\n' if text else '') + '\n'.join(new)
+        self.fleet_status.text = f'Added {len(new)} discovered agent(s)'
+
+    def confirm_fleet_shutdown(self, instance):
+        """Show confirmation popup before shutting down every listed target"""
+        if self.runner:
+            return                      # One run at a time; the button is disabled until it finishes
+        targets = commands.parse_targets(self.targets_input.text)
+        if not targets:
+            self.fleet_status.text = "❌ Enter at least one URL"
+            self.fleet_status.color = (1, 0, 0, 1)
+            return
+        
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        content.add_widget(Label(
+            text=f'Shutdown {len(targets)} target machines?',
+            text_size=(dp(280), None),
+            halign='center',
+            font_size=dp(16)
+        ))
+        
+        buttons = BoxLayout(orientation='horizontal', spacing=dp(10), size_hint_y=None, height=dp(50))
+        yes_btn = Button(text='YES', background_color=(1, 0.2, 0.2, 1))
+        no_btn = Button(text='NO', background_color=(0.5, 0.5, 0.5, 1))
+        buttons.add_widget(yes_btn)
+        buttons.add_widget(no_btn)
+        content.add_widget(buttons)
+        
+        popup = Popup(
+            title='Confirm Fleet Shutdown',
+            content=content,
+            size_hint=(0.8, 0.4),
+            auto_dismiss=False
+        )
+        
+        yes_btn.bind(on_press=lambda x: self.execute_fleet_shutdown(popup, targets))
+        no_btn.bind(on_press=popup.dismiss)
+        
+        popup.open()
+    
+    def execute_fleet_shutdown(self, popup, targets):
+        """Start the fleet run; results stream in as each host answers"""
+        popup.dismiss()
+        if self.runner:
+            return
+        try:
+            concurrency = int(self.concurrency_input.text or fleet.DEFAULT_CONCURRENCY)
+        except ValueError:
+            concurrency = fleet.DEFAULT_CONCURRENCY
+        
+        self.results_log.add(f"--- Fleet shutdown: {len(targets)} targets ---")
+        self.tracked = []
+        self.run_text = f"Sending shutdown to {len(targets)} targets..."
+        self.run_failed = False
+        self.fleet_status.text = self.run_text
+        self.fleet_status.color = (1, 0.6, 0, 1)
+        
+        self.runner = fleet.FleetRunner(
+            self.app_instance.admin_token,
+            concurrency=concurrency,
+            user_agent="Mozilla/5.0 (Android) Mobile Controller"
+        )
+        self.shutdown_btn.disabled = True
+        self.runner.run_in_background(
+            targets,
+            on_result=self._add_result,
+            on_done=lambda summary: Clock.schedule_once(lambda dt: self._fleet_done(summary))
+        )
+    
+    def cancel_fleet(self, instance):
+        """Stop dispatching to targets that haven't been contacted yet"""
+        if self.runner:
+            self.runner.cancel()
+            self.fleet_status.text = "Cancelling..."
+            self.fleet_status.color = (1, 0.6, 0, 1)
+    
+    def _add_result(self, result):
+        # Safe from the fleet threads: the view picks new rows up once per frame
+        self.results_log.add(f"{result.describe()} {result.target} ({result.elapsed * 1000:.0f} ms)")
+        if result.ok:
+            self.tracked.append(shutdown_tracker.get_tracker().track(
+                result.target, self.app_instance.admin_token, on_done=self._offline_done))
+            self._offline_trigger()
+    
+    def _offline_done(self, host):
+        # Runs on a tracker check worker
+        if host.state == shutdown_tracker.STRAGGLER:
+            self.results_log.add(f"{host.describe()} {host.url}")
+        self._offline_trigger()
+    
+    def _show_offline(self):
+        """Run status plus the confirmed-offline count for the hosts that accepted the shutdown"""
+        hosts = list(self.tracked)
+        text = self.run_text
+        pending = False
+        if hosts:
+            summary = shutdown_tracker.get_tracker().summary(hosts)
+            text += f"\nOffline: {summary['offline']}/{len(hosts)}"
+            if summary["straggler"]:
+                text += f", {summary['straggler']} still online"
+            if summary["p95_time_to_offline_s"] is not None:
+                text += f" (p95 {summary['p95_time_to_offline_s']:.1f}s)"
+            pending = summary["tracking"] or summary["straggler"]
+        self.fleet_status.text = text
+        if self.run_failed:
+            self.fleet_status.color = (1, 0, 0, 1)
+        elif self.runner is not None or pending:
+            self.fleet_status.color = (1, 0.6, 0, 1)
+        else:
+            self.fleet_status.color = (0, 1, 0, 1)
+    
+    def _fleet_done(self, summary):
+        self.runner = None
+        self.shutdown_btn.disabled = False
+        self.run_text = summary.describe()
+        self.run_failed = summary.failed > 0
+        self._show_offline()
+
+
 class MainTabbedPanel(TabbedPanel):
     def __init__(self, app_instance, **kwargs):
         super().__init__(**kwargs)
@@ -432,12 +820,20 @@ class MainTabbedPanel(TabbedPanel):
         
         # Controller tab
         controller_tab = TabbedPanelItem(text='Controller')
-        controller_tab.content = MobileShutdownController(app_instance)
+        self.controller = MobileShutdownController(app_instance)
+        controller_tab.content = self.controller
         self.add_widget(controller_tab)
         
+        # Fleet tab
+        fleet_tab = TabbedPanelItem(text='Fleet')
+        self.fleet = FleetPanel(app_instance)
+        fleet_tab.content = self.fleet
+        self.add_widget(fleet_tab)
+        
         # Settings tab
         settings_tab = TabbedPanelItem(text='Settings')
-        settings_tab.content = SettingsPanel(app_instance)
+        self.settings = SettingsPanel(app_instance)
+        settings_tab.content = self.settings
         self.add_widget(settings_tab)
         
         # Set default tab to controller
@@ -448,11 +844,43 @@ class MobileShutdownApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.admin_token = DEFAULT_ADMIN_TOKEN
+        self.config_store = config_store.get_store()
     
     def build(self):
         self.title = 'Remote Shutdown Controller'
-        return MainTabbedPanel(self)
+        self.panel = MainTabbedPanel(self)
+        # Listen for agent announcements; the cache is refreshed on the UI thread
+        self.discovery = discovery.Discovery(
+            on_change=lambda agents: Clock.schedule_once(lambda dt: self.on_agents_changed(agents))
+        )
+        self.discovery.start()
+        # Parse config.json off the UI thread, then apply it on the next frame
+        self.config_store.preload(lambda store: Clock.schedule_once(self.load_config))
+        return self.panel
+    
+    def load_config(self, *args):
+        """Apply the active profile's saved token and URL"""
+        store = self.config_store
+        if store.load_error:
+            self.panel.settings.settings_status.text = f"⚠️ {store.load_error}"
+            self.panel.settings.settings_status.color = (1, 0.5, 0, 1)
+        profile = store.get_profile()
+        if profile.get('admin_token'):
+            self.admin_token = profile['admin_token']
+            self.panel.settings.token_input.text = profile['admin_token']
+        if profile.get('target_url'):
+            self.panel.controller.url_input.text = profile['target_url']
+        if profile.get('lan_url'):
+            self.panel.controller.lan_input.text = profile['lan_url']
+    
+    def on_agents_changed(self, agents):
+        self.panel.controller.show_discovered(agents)
+        self.panel.fleet.show_discovered(agents)
+    
+    def on_stop(self):
+        self.discovery.stop()
+        self.config_store.flush()
 
 
 if __name__ == '__main__':
-    MobileShutdownApp().run()
\ No newline at end of file
+    kivy_async.run_app(MobileShutdownApp())
\ No newline at end of file
@@ -5,15 +5,24 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.spinner import Spinner
 from kivy.uix.widget import Widget
 from kivy.graphics import Color, RoundedRectangle, Line
 from kivy.metrics import dp, sp
 from kivy.clock import Clock
 from kivy.animation import Animation
 import requests
-import threading
-import json
+import transport
+import retry
+import shutdown_tracker
+import executor
+import async_client
+import kivy_async
+import registry
+import status_stream
+from activity_log import ActivityLog, ActivityLogView
+import config_store
+import os
 import time
 
 # Modern Material Design 3 Theme
@@ -29,6 +38,10 @@ THEME = {
     'text_secondary': [0.7, 0.7, 0.7, 1.0] # Secondary text
 }
 
+# Activity log: entries kept in memory, optional rotating file (set RSC_ACTIVITY_LOG=path)
+LOG_CAPACITY = 1000
+LOG_FILE = os.environ.get('RSC_ACTIVITY_LOG')
+
 class ModernCard(Widget):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -129,7 +142,7 @@ class StatusWidget(BoxLayout):
         self.status_indicator.size = (dp(12), dp(12))
         
         with self.status_indicator.canvas:
-            Color(*THEME['warning'])
+            self.indicator_color = Color(*THEME['warning'])
             self.indicator_circle = RoundedRectangle(
                 pos=self.status_indicator.pos,
                 size=self.status_indicator.size,
@@ -153,14 +166,9 @@ class StatusWidget(BoxLayout):
         self.indicator_circle.pos = self.status_indicator.pos
 
     def update_status(self, status, color):
+        # Recolor the existing indicator; live status updates would otherwise pile up canvas instructions
         self.status_label.text = status
-        with self.status_indicator.canvas:
-            Color(*THEME[color])
-            self.indicator_circle = RoundedRectangle(
-                pos=self.status_indicator.pos,
-                size=self.status_indicator.size,
-                radius=[dp(6)]
-            )
+        self.indicator_color.rgba = THEME[color]
 
 class MainApp(App):
     def __init__(self, **kwargs):
@@ -168,9 +176,12 @@ class MainApp(App):
         self.target_url = ""
         self.admin_token = ""
         self.connection_status = "disconnected"
+        self.status_stream = None
+        self.activity_log = ActivityLog(capacity=LOG_CAPACITY, log_file=LOG_FILE)
+        self.activity_log.add("Application started")
         
-        # Load config if exists
-        self.load_config()
+        # Config is parsed lazily, off the UI thread, once the window is built
+        self.config_store = config_store.get_store()
 
     def build(self):
         # Main container
@@ -206,7 +217,7 @@ class MainApp(App):
         # Configuration card
         config_card = ModernCard()
         config_card.size_hint_y = None
-        config_card.height = dp(200)
+        config_card.height = dp(260)
         
         config_layout = BoxLayout(
             orientation='vertical',
@@ -251,6 +262,32 @@ class MainApp(App):
             height=dp(50)
         )
         
+        # Profile selector
+        profile_row = BoxLayout(
+            orientation='horizontal',
+            spacing=dp(10),
+            size_hint_y=None,
+            height=dp(40)
+        )
+        
+        self.profile_spinner = Spinner(
+            text=config_store.DEFAULT_PROFILE,
+            values=[],
+            size_hint=(0.7, 1)
+        )
+        self.profile_spinner.bind(text=self.on_profile_selected)
+        
+        new_profile_btn = ModernButton(
+            text='New Profile',
+            style='primary',
+            size_hint=(0.3, 1)
+        )
+        new_profile_btn.bind(on_press=self.new_profile)
+        
+        profile_row.add_widget(self.profile_spinner)
+        profile_row.add_widget(new_profile_btn)
+        
+        config_layout.add_widget(profile_row)
         config_layout.add_widget(url_label)
         config_layout.add_widget(self.url_input)
         config_layout.add_widget(token_label)
@@ -303,21 +340,15 @@ class MainApp(App):
             halign='left'
         )
         
-        # Scrollable log
-        scroll = ScrollView()
-        self.log_label = Label(
-            text='Application started\n',
+        # Virtualized log: only the visible rows are rendered
+        log_view = ActivityLogView(
+            self.activity_log,
             color=THEME['text_secondary'],
-            font_size=sp(14),
-            text_size=(None, None),
-            halign='left',
-            valign='top'
+            font_size=sp(14)
         )
         
-        scroll.add_widget(self.log_label)
-        
         log_layout.add_widget(log_title)
-        log_layout.add_widget(scroll)
+        log_layout.add_widget(log_view)
         
         log_card.add_widget(log_layout)
         
@@ -328,9 +359,13 @@ class MainApp(App):
         main_layout.add_widget(button_layout)
         main_layout.add_widget(log_card)
         
-        # Auto-test connection if config exists
-        if self.target_url and self.admin_token:
-            Clock.schedule_once(lambda dt: self.test_connection(), 1)
+        # Load profiles in the background, then fill the inputs on the UI thread
+        self.config_store.preload(lambda store: Clock.schedule_once(self.load_config))
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(
+            lambda record: Clock.schedule_once(lambda dt: self.on_tunnel_moved(record))
+        )
         
         return main_layout
 
@@ -338,29 +373,115 @@ class MainApp(App):
         self.bg_rect.pos = instance.pos
         self.bg_rect.size = instance.size
 
-    def load_config(self):
-        try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-                self.target_url = config.get('target_url', '')
-                self.admin_token = config.get('admin_token', '')
-        except:
-            pass
+    def load_config(self, *args):
+        """Fill the inputs from the active profile"""
+        if self.config_store.load_error:
+            self.add_log(self.config_store.load_error)
+        
+        self.apply_profile(self.config_store.active)
+        
+        # Auto-test connection if config exists
+        if self.target_url and self.admin_token:
+            Clock.schedule_once(lambda dt: self.test_connection(), 1)
+
+    def apply_profile(self, name):
+        profile = self.config_store.get_profile(name)
+        self.target_url = profile.get('target_url', '')
+        self.admin_token = profile.get('admin_token', '')
+        self.url_input.text = self.target_url
+        self.token_input.text = self.admin_token
+        self.connection_status = "disconnected"
+        self.profile_spinner.values = self.config_store.profile_names() or [name]
+        self.profile_spinner.text = name
 
     def save_config(self):
-        config = {
-            'target_url': self.target_url,
-            'admin_token': self.admin_token
-        }
-        try:
-            with open('config.json', 'w') as f:
-                json.dump(config, f)
-        except Exception as e:
-            self.add_log(f"Failed to save config: {str(e)}")
+        """Store the current URL/token in the active profile (debounced, written off the UI thread)"""
+        if self.config_store.save_error:
+            self.add_log(self.config_store.save_error)
+        self.config_store.set_profile(
+            target_url=self.target_url,
+            admin_token=self.admin_token
+        )
+
+    def on_profile_selected(self, spinner, name):
+        if name and name != self.config_store.active:
+            self.config_store.set_active(name)
+            self.apply_profile(name)
+            self.status_widget.update_status("Disconnected", "warning")
+            self.add_log(f"Switched to profile '{name}'")
+
+    def new_profile(self, *args):
+        content = BoxLayout(
+            orientation='vertical',
+            spacing=dp(15),
+            padding=dp(20)
+        )
+        
+        name_input = ModernInput(
+            hint_text='Profile name (e.g. Lab PC 3)',
+            size_hint_y=None,
+            height=dp(50)
+        )
+        
+        save_btn = ModernButton(
+            text='Save current URL and token',
+            style='primary',
+            size_hint_y=None,
+            height=dp(50)
+        )
+        
+        content.add_widget(name_input)
+        content.add_widget(save_btn)
+        
+        popup = Popup(
+            title='New Profile',
+            content=content,
+            size_hint=(0.8, 0.4)
+        )
+        
+        def save(*args):
+            name = name_input.text.strip()
+            if not name:
+                return
+            self.config_store.set_profile(
+                name,
+                target_url=self.url_input.text.strip(),
+                admin_token=self.token_input.text.strip()
+            )
+            self.config_store.set_active(name)
+            self.apply_profile(name)
+            self.add_log(f"Saved profile '{name}'")
+            popup.dismiss()
+        
+        save_btn.bind(on_press=save)
+        popup.open()
+
+    def on_stop(self):
+        if self.status_stream:
+            self.status_stream.stop()
+        # Write any pending (debounced) config change before exiting
+        self.config_store.flush()
+
+    def on_tunnel_moved(self, record):
+        new_url = registry.follow(self.url_input.text, record)
+        if not new_url:
+            return
+        self.url_input.text = new_url
+        self.target_url = new_url
+        self.save_config()
+        self.add_log(registry.describe_move(record))
+        executor.get_executor().submit("reconnect", new_url, self._reconnect_thread, new_url, record["restarted_at"])
+
+    def _reconnect_thread(self, url, restarted_at):
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            Clock.schedule_once(lambda dt: self.add_log("New tunnel URL is not answering"), 0)
+        else:
+            Clock.schedule_once(lambda dt: self.add_log(f"Reconnected {reconnect_ms:.0f} ms after tunnel restart"), 0)
+            Clock.schedule_once(lambda dt: self.test_connection(), 0)
 
     def add_log(self, message):
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_label.text += f"[{timestamp}] {message}\n"
+        self.activity_log.add(message)
 
     def test_connection(self, *args):
         # Get current values
@@ -378,45 +499,79 @@ class MainApp(App):
         self.status_widget.update_status("Testing...", "warning")
         self.add_log("Testing connection...")
         
-        # Test in background thread
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        # Test on the app's event loop (joins a test already in flight)
+        kivy_async.get_tasks().spawn("test", self.target_url, self._test_connection_async)
 
-    def _test_connection_thread(self):
+    async def _test_connection_async(self):
         try:
             headers = {'Authorization': f'Bearer {self.admin_token}'}
-            response = requests.get(
+            response = await async_client.get_client(verify=True).get(
                 f"{self.target_url}/status",
-                headers=headers,
-                timeout=10
+                headers=headers
             )
             
             if response.status_code == 200:
-                Clock.schedule_once(lambda dt: self._connection_success(), 0)
+                self._connection_success()
             else:
-                Clock.schedule_once(lambda dt: self._connection_failed(f"HTTP {response.status_code}"), 0)
+                self._connection_failed(f"HTTP {response.status_code}")
                 
         except requests.exceptions.Timeout:
-            Clock.schedule_once(lambda dt: self._connection_failed("Connection timeout"), 0)
+            self._connection_failed("Connection timeout")
         except requests.exceptions.ConnectionError:
-            Clock.schedule_once(lambda dt: self._connection_failed("Connection refused"), 0)
+            self._connection_failed("Connection refused")
         except Exception as e:
-            Clock.schedule_once(lambda dt: self._connection_failed(str(e)), 0)
+            self._connection_failed(str(e))
 
     def _connection_success(self):
         self.connection_status = "connected"
         self.status_widget.update_status("Connected", "success")
         self.add_log("Connection successful!")
+        self.watch_status()
 
     def _connection_failed(self, error):
         self.connection_status = "disconnected"
         self.status_widget.update_status("Connection Failed", "error")
         self.add_log(f"Connection failed: {error}")
 
+    def watch_status(self):
+        """Keep the status live over the agent's /events stream instead of a one-shot probe"""
+        if self.status_stream:
+            if self.status_stream.url == self.target_url and self.status_stream.state != "stopped":
+                return
+            self.status_stream.stop()
+        self.status_stream = status_stream.StatusStream(
+            self.target_url, self.admin_token, verify=True,
+            on_event=lambda event, data: Clock.schedule_once(lambda dt: self._on_stream_event(event, data)),
+            on_state=lambda state, detail: Clock.schedule_once(lambda dt: self._on_stream_state(state, detail))
+        ).start()
+
+    def _on_stream_state(self, state, detail):
+        if state == "live":
+            self.connection_status = "connected"
+            self.status_widget.update_status("Connected (live)", "success")
+        elif state == "reconnecting":
+            self.status_widget.update_status("Reconnecting...", "warning")
+            self.add_log(f"Status stream lost ({detail}), reconnecting")
+
+    def _on_stream_event(self, event, data):
+        if event == "shutdown":
+            self.status_widget.update_status("Shutting down", "error")
+            self.add_log("Agent accepted the shutdown command")
+        elif event == "tunnel":
+            self.add_log(f"Agent moved to {data['tunnel_url']}")
+            self.target_url = self.status_stream.url
+            self.url_input.text = self.target_url
+            self.save_config()
+
     def confirm_shutdown(self, *args):
         if self.connection_status != "connected":
             self.add_log("Please test connection first")
             return
         
+        # Open a pooled connection while the dialog is up so Shutdown goes out on a warm socket
+        shutdown_url = f"{self.target_url}/shutdown"
+        executor.get_executor().submit("warm", self.target_url, transport.warm, shutdown_url, True)
+        
         # Create confirmation popup
         content = BoxLayout(
             orientation='vertical',
@@ -464,25 +619,31 @@ class MainApp(App):
         )
         
         cancel_btn.bind(on_press=popup.dismiss)
-        confirm_btn.bind(on_press=lambda x: (popup.dismiss(), self.execute_shutdown()))
+        confirm_btn.bind(on_press=lambda x: (popup.dismiss(), self.execute_shutdown(time.perf_counter())))
         
         popup.open()
 
-    def execute_shutdown(self):
+    def execute_shutdown(self, pressed_at):
         self.add_log("Initiating shutdown...")
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        executor.get_executor().submit("shutdown", self.target_url, self._shutdown_thread, pressed_at)
 
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, pressed_at):
         try:
             headers = {'Authorization': f'Bearer {self.admin_token}'}
-            response = requests.post(
+            response = retry.request(
+                "POST",
                 f"{self.target_url}/shutdown",
                 headers=headers,
-                timeout=10
+                on_retry=lambda attempt, wait, reason: Clock.schedule_once(
+                    lambda dt: self.add_log(f"Retrying shutdown after {reason}..."), 0)
             )
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
             
             if response.status_code == 200:
-                Clock.schedule_once(lambda dt: self.add_log("Shutdown command sent successfully!"), 0)
+                Clock.schedule_once(lambda dt: self.add_log(f"Shutdown command sent successfully! ({ack_ms:.0f} ms)"), 0)
+                shutdown_tracker.get_tracker().track(
+                    self.target_url, self.admin_token,
+                    on_done=lambda host: Clock.schedule_once(lambda dt: self.add_log(f"Target: {host.describe()}"), 0))
             else:
                 Clock.schedule_once(lambda dt: self.add_log(f"Shutdown failed: HTTP {response.status_code}"), 0)
                 
@@ -490,4 +651,4 @@ class MainApp(App):
             Clock.schedule_once(lambda dt: self.add_log(f"Shutdown error: {str(e)}"), 0)
 
 if __name__ == '__main__':
-    MainApp().run()
\ No newline at end of file
+    kivy_async.run_app(MainApp())
\ No newline at end of file
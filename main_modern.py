@@ -16,7 +16,16 @@ from kivy.metrics import dp
 from kivy.utils import get_color_from_hex
 import requests
 import urllib3
-import threading
+import transport
+import retry
+import shutdown_tracker
+import executor
+import async_client
+import kivy_async
+import health
+import registry
+from kivy_status import StatusModel, start_frame_stats
+import time
 
 # Disable SSL warnings when using verify=False
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -123,6 +132,9 @@ class ModernTextInput(TextInput):
 class MobileShutdownController(FloatLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Latest-wins status applied once per frame instead of a Clock event per message
+        self.status_model = StatusModel(self._apply_status)
+        self.frame_timer = start_frame_stats(type(self).__module__, self.status_model)
         
         # Background
         with self.canvas.before:
@@ -206,6 +218,18 @@ class MobileShutdownController(FloatLayout):
         )
         content.add_widget(self.url_input)
         
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.tasks = kivy_async.get_tasks()
+        self.current_target = self.url_input.text.strip()
+        health.get_monitor().add_listener(self._on_circuit_change)
+        self.url_input.bind(text=self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(
+            lambda record: Clock.schedule_once(lambda dt: self.on_tunnel_moved(record))
+        )
+        
         update_btn = ModernButton(
             text='📝 Update URL', size_hint_y=None, height=dp(35),
             bg_color=COLORS['secondary']
@@ -290,22 +314,26 @@ class MobileShutdownController(FloatLayout):
     
     def update_status(self, message, status_type='info'):
         """Update status with modern styling"""
-        def update_ui():
-            self.status_label.text = message
-            if status_type == 'success':
-                self.status_indicator.color = COLORS['success']
-                self.status_indicator.text = '✓'
-            elif status_type == 'warning':
-                self.status_indicator.color = COLORS['warning']
-                self.status_indicator.text = '⚠'
-            elif status_type == 'error':
-                self.status_indicator.color = COLORS['error']
-                self.status_indicator.text = '✗'
-            else:
-                self.status_indicator.color = COLORS['secondary']
-                self.status_indicator.text = '●'
+        if executor.current_job_cancelled():
+            return
         
-        Clock.schedule_once(lambda dt: update_ui())
+        self.status_model.set(message, status_type)
+    
+    def _apply_status(self, message, status_type='info'):
+        """Apply the latest status to the widgets (runs at most once per frame)"""
+        self.status_label.text = message
+        if status_type == 'success':
+            self.status_indicator.color = COLORS['success']
+            self.status_indicator.text = '✓'
+        elif status_type == 'warning':
+            self.status_indicator.color = COLORS['warning']
+            self.status_indicator.text = '⚠'
+        elif status_type == 'error':
+            self.status_indicator.color = COLORS['error']
+            self.status_indicator.text = '✗'
+        else:
+            self.status_indicator.color = COLORS['secondary']
+            self.status_indicator.text = '●'
     
     def update_url(self, instance):
         current_url = self.url_input.text.strip()
@@ -320,13 +348,46 @@ class MobileShutdownController(FloatLayout):
         else:
             self.show_modern_popup("Error", "Please enter a URL first!", "error")
     
+    def on_url_changed(self, instance, value):
+        """Cancel in-flight requests for the previous URL when the user edits it"""
+        new_target = value.strip()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.tasks.cancel(self.current_target)
+            self.current_target = new_target
+    
+    def _on_circuit_change(self, key, breaker):
+        """Show the current target's circuit breaker state (called from whichever thread saw the change)"""
+        if key != health.target_key(self.current_target):
+            return
+        colors = {health.OPEN: "error", health.HALF_OPEN: "warning", health.CLOSED: "success"}
+        self.update_status(health.describe(breaker), colors[breaker.state])
+    
+    def on_tunnel_moved(self, record):
+        """Switch to the agent's new tunnel URL as soon as it is published"""
+        new_url = registry.follow(self.url_input.text, record)
+        if not new_url:
+            return
+        self.url_input.text = new_url
+        self.update_status(registry.describe_move(record), "info")
+        self.executor.submit("reconnect", new_url, self._reconnect_thread, new_url, record["restarted_at"])
+    
+    def _reconnect_thread(self, url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("New tunnel URL is not answering", "error")
+        else:
+            print(f"Reconnected to {url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"Reconnected {reconnect_ms:.0f} ms after tunnel restart", "success")
+    
     def test_connection(self, instance):
         self.update_status("Testing connection...", "warning")
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.tasks.spawn("test", url, self._test_connection_async, url)
     
-    def _test_connection_thread(self):
+    async def _test_connection_async(self, url):
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "error")
                 return
@@ -334,7 +395,7 @@ class MobileShutdownController(FloatLayout):
             base_url = url.replace('/shutdown', '/')
             headers = {"User-Agent": "Mozilla/5.0 (Android) Mobile Controller"}
             
-            response = requests.get(base_url, headers=headers, verify=False, timeout=10)
+            response = await async_client.get_client().get(base_url, headers=headers)
             
             if response.status_code == 200:
                 self.update_status("Connection successful! Ready to shutdown", "success")
@@ -349,7 +410,13 @@ class MobileShutdownController(FloatLayout):
     def confirm_shutdown(self, instance):
         self.show_confirm_popup()
     
+    def warm_connection(self, url):
+        """Open a pooled connection to the target while the user is still confirming"""
+        if url and url != TARGET_URL:
+            self.executor.submit("warm", url, transport.warm, url)
+    
     def show_confirm_popup(self):
+        self.warm_connection(self.url_input.text.strip())
         content = BoxLayout(orientation='vertical', spacing=dp(20), padding=dp(20))
         
         # Warning section
@@ -383,18 +450,18 @@ class MobileShutdownController(FloatLayout):
         )
         
         cancel_btn.bind(on_press=popup.dismiss)
-        confirm_btn.bind(on_press=lambda x: self.execute_shutdown(popup))
+        confirm_btn.bind(on_press=lambda x: self.execute_shutdown(popup, time.perf_counter()))
         
         popup.open()
     
-    def execute_shutdown(self, popup):
+    def execute_shutdown(self, popup, pressed_at):
         popup.dismiss()
         self.update_status("Sending shutdown command...", "warning")
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.executor.submit("shutdown", url, self._shutdown_thread, url, pressed_at)
     
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, url, pressed_at):
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "error")
                 return
@@ -405,10 +472,16 @@ class MobileShutdownController(FloatLayout):
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, headers=headers, verify=False, timeout=10)
+            def on_retry(attempt, wait, reason):
+                self.update_status(f"Retrying after {reason} ({attempt + 1}/{retry.MAX_ATTEMPTS})...", "warning")
+
+            response = retry.request("POST", url, headers=headers, verify=False, on_retry=on_retry)
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
+            print(f"Shutdown acknowledged {ack_ms:.0f} ms after YES")
             
             if response.status_code == 200:
-                self.update_status("Shutdown command sent successfully!", "success")
+                self.update_status(f"Shutdown command sent successfully! ({ack_ms:.0f} ms) Confirming...", "success")
+                shutdown_tracker.get_tracker().track(url, ADMIN_TOKEN, on_done=self._on_offline)
                 Clock.schedule_once(lambda dt: self.show_modern_popup(
                     "Success", "Shutdown command accepted!", "success"
                 ))
@@ -425,6 +498,11 @@ class MobileShutdownController(FloatLayout):
         except Exception as e:
             self.update_status("Error occurred", "error")
     
+    def _on_offline(self, host):
+        """The shutdown tracker saw the target go offline, or gave up waiting"""
+        print(f"{host.url}: {host.describe()} ({host.checks} checks)")
+        self.update_status(host.describe(), "success" if host.state == shutdown_tracker.OFFLINE else "warning")
+    
     def show_modern_popup(self, title, message, popup_type="info"):
         content = BoxLayout(orientation='vertical', spacing=dp(15), padding=dp(20))
         
@@ -471,4 +549,4 @@ class MobileShutdownApp(App):
 
 
 if __name__ == '__main__':
-    MobileShutdownApp().run()
\ No newline at end of file
+    kivy_async.run_app(MobileShutdownApp())
\ No newline at end of file
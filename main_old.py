@@ -21,7 +21,17 @@ from kivy.core.window import Window
 from kivy.effects.scroll import ScrollEffect
 import requests
 import urllib3
-import threading
+import transport
+import retry
+import shutdown_tracker
+import executor
+import async_client
+import kivy_async
+import health
+import status_stream
+import commands
+import registry
+from kivy_status import StatusModel, start_frame_stats
 import time
 
 # Disable SSL warnings
@@ -321,6 +331,10 @@ class ModernTextInput(TextInput):
 class MobileShutdownController(FloatLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Latest-wins status applied once per frame instead of a Clock event per message
+        self.status_model = StatusModel(self._apply_status)
+        self.frame_timer = start_frame_stats(type(self).__module__, self.status_model)
+        self._bar_events = []
         
         # Set window background color
         Window.clearcolor = COLORS['background']
@@ -469,6 +483,19 @@ class MobileShutdownController(FloatLayout):
         )
         content.add_widget(self.url_input)
         
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.tasks = kivy_async.get_tasks()
+        self.status_stream = None
+        self.current_target = self.url_input.text.strip()
+        health.get_monitor().add_listener(self._on_circuit_change)
+        self.url_input.bind(text=self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(
+            lambda record: Clock.schedule_once(lambda dt: self.on_tunnel_moved(record))
+        )
+        
         # Button row with icons
         button_box = BoxLayout(orientation='horizontal', spacing=dp(10), size_hint_y=None, height=dp(40))
         
@@ -730,45 +757,58 @@ class MobileShutdownController(FloatLayout):
     
     def update_status(self, message, status_type='info', detail=None):
         """Update status with modern styling and animations"""
-        def update_ui():
-            self.status_label.text = message
-            if detail and hasattr(self, 'status_detail'):
-                self.status_detail.text = detail
-            
-            # Animate status indicator
-            if status_type == 'success':
-                self.status_indicator.color = COLORS['success']
-                self.status_indicator.text = '✓'
-                # Update signal bars for successful connection
-                if hasattr(self, 'signal_bars'):
-                    for i, bar in enumerate(self.signal_bars):
-                        Clock.schedule_once(lambda dt, b=bar: setattr(b, 'opacity', 1), i * 0.1)
-                        bar.color = COLORS['success']
-            elif status_type == 'warning':
-                self.status_indicator.color = COLORS['warning']
-                self.status_indicator.text = '⚠'
-                if hasattr(self, 'signal_bars'):
-                    for bar in self.signal_bars[:2]:
-                        bar.opacity = 1
-                        bar.color = COLORS['warning']
-                    for bar in self.signal_bars[2:]:
-                        bar.opacity = 0.3
-            elif status_type == 'error':
-                self.status_indicator.color = COLORS['error']
-                self.status_indicator.text = '✗'
-                if hasattr(self, 'signal_bars'):
-                    for bar in self.signal_bars:
-                        bar.opacity = 0.3
-                        bar.color = COLORS['text_disabled']
-            else:
-                self.status_indicator.color = COLORS['secondary']
-                self.status_indicator.text = '●'
-            
-            # Pulse animation for status indicator
-            pulse = Animation(font_size=dp(28), duration=0.2) + Animation(font_size=dp(24), duration=0.2)
-            pulse.start(self.status_indicator)
+        if executor.current_job_cancelled():
+            return
         
-        Clock.schedule_once(lambda dt: update_ui())
+        self.status_model.set(message, status_type, detail)
+    
+    def _apply_status(self, message, status_type='info', detail=None):
+        """Apply the latest status to the widgets (runs at most once per frame)"""
+        self.status_label.text = message
+        if detail and hasattr(self, 'status_detail'):
+            self.status_detail.text = detail
+        
+        # Drop bar reveals still pending from a previous status
+        for event in self._bar_events:
+            event.cancel()
+        self._bar_events = []
+        
+        # Animate status indicator
+        if status_type == 'success':
+            self.status_indicator.color = COLORS['success']
+            self.status_indicator.text = '✓'
+            # Update signal bars for successful connection
+            if hasattr(self, 'signal_bars'):
+                for i, bar in enumerate(self.signal_bars):
+                    self._bar_events.append(
+                        Clock.schedule_once(lambda dt, b=bar: setattr(b, 'opacity', 1), i * 0.1)
+                    )
+                    bar.color = COLORS['success']
+        elif status_type == 'warning':
+            self.status_indicator.color = COLORS['warning']
+            self.status_indicator.text = '⚠'
+            if hasattr(self, 'signal_bars'):
+                for bar in self.signal_bars[:2]:
+                    bar.opacity = 1
+                    bar.color = COLORS['warning']
+                for bar in self.signal_bars[2:]:
+                    bar.opacity = 0.3
+        elif status_type == 'error':
+            self.status_indicator.color = COLORS['error']
+            self.status_indicator.text = '✗'
+            if hasattr(self, 'signal_bars'):
+                for bar in self.signal_bars:
+                    bar.opacity = 0.3
+                    bar.color = COLORS['text_disabled']
+        else:
+            self.status_indicator.color = COLORS['secondary']
+            self.status_indicator.text = '●'
+        
+        # Pulse animation for status indicator (restart instead of stacking pulses)
+        Animation.cancel_all(self.status_indicator, 'font_size')
+        self.status_indicator.font_size = dp(24)
+        pulse = Animation(font_size=dp(28), duration=0.2) + Animation(font_size=dp(24), duration=0.2)
+        pulse.start(self.status_indicator)
     
     def update_url(self, instance):
         current_url = self.url_input.text.strip()
@@ -783,13 +823,71 @@ class MobileShutdownController(FloatLayout):
         else:
             self.show_modern_popup("Error", "Please enter a URL first!", "error")
     
+    def on_url_changed(self, instance, value):
+        """Cancel in-flight requests for the previous URL when the user edits it"""
+        new_target = value.strip()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.tasks.cancel(self.current_target)
+            self.current_target = new_target
+            if self.status_stream and self.status_stream.url != commands.base_url(new_target):
+                self.status_stream.stop()
+                self.status_stream = None
+    
+    def watch_status(self, url):
+        """Keep the status live over the agent's /events stream instead of a one-shot probe"""
+        if self.status_stream:
+            self.status_stream.stop()
+        self.status_stream = status_stream.StatusStream(
+            url, ADMIN_TOKEN, on_event=self._on_stream_event, on_state=self._on_stream_state
+        ).start()
+    
+    def _on_stream_state(self, state, detail):
+        if state == "live":
+            self.update_status("Live: agent online", "success", "Status is streamed from the agent")
+        elif state == "reconnecting":
+            self.update_status("Reconnecting...", "warning", detail)
+    
+    def _on_circuit_change(self, key, breaker):
+        """Show the current target's circuit breaker state (called from whichever thread saw the change)"""
+        if key != health.target_key(self.current_target):
+            return
+        colors = {health.OPEN: "error", health.HALF_OPEN: "warning", health.CLOSED: "success"}
+        self.update_status(health.describe(breaker), colors[breaker.state])
+    
+    def _on_stream_event(self, event, data):
+        if event == "shutdown":
+            self.update_status("Agent is shutting down", "error", "Shutdown command accepted")
+        elif event == "tunnel":
+            # The stream already follows the agent; move the URL field along with it
+            new_url = commands.command_url(data["tunnel_url"], "shutdown")
+            Clock.schedule_once(lambda dt: setattr(self.url_input, 'text', new_url))
+    
+    def on_tunnel_moved(self, record):
+        """Switch to the agent's new tunnel URL as soon as it is published"""
+        new_url = registry.follow(self.url_input.text, record)
+        if not new_url:
+            return
+        self.url_input.text = new_url
+        self.update_status(registry.describe_move(record), "info")
+        self.executor.submit("reconnect", new_url, self._reconnect_thread, new_url, record["restarted_at"])
+    
+    def _reconnect_thread(self, url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("New tunnel URL is not answering", "error")
+        else:
+            print(f"Reconnected to {url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"Reconnected {reconnect_ms:.0f} ms after tunnel restart", "success")
+    
     def test_connection(self, instance):
         self.update_status("Testing connection...", "warning")
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.tasks.spawn("test", url, self._test_connection_async, url)
     
-    def _test_connection_thread(self):
+    async def _test_connection_async(self, url):
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "error")
                 return
@@ -797,10 +895,11 @@ class MobileShutdownController(FloatLayout):
             base_url = url.replace('/shutdown', '/')
             headers = {"User-Agent": "Mozilla/5.0 (Android) Mobile Controller"}
             
-            response = requests.get(base_url, headers=headers, verify=False, timeout=10)
+            response = await async_client.get_client().get(base_url, headers=headers)
             
             if response.status_code == 200:
                 self.update_status("Connection successful! Ready to shutdown", "success")
+                self.watch_status(url)
             else:
                 self.update_status(f"Response code {response.status_code} received", "warning")
                 
@@ -812,7 +911,13 @@ class MobileShutdownController(FloatLayout):
     def confirm_shutdown(self, instance):
         self.show_confirm_popup()
     
+    def warm_connection(self, url):
+        """Open a pooled connection to the target while the user is still confirming"""
+        if url and url != TARGET_URL:
+            self.executor.submit("warm", url, transport.warm, url)
+    
     def show_confirm_popup(self):
+        self.warm_connection(self.url_input.text.strip())
         # Create modern confirmation dialog
         content = BoxLayout(orientation='vertical', spacing=dp(25), padding=dp(25))
         
@@ -895,34 +1000,19 @@ class MobileShutdownController(FloatLayout):
         fade_out.start(content)
     
     def execute_shutdown_with_animation(self, popup, content):
-        """Execute shutdown with animation"""
-        self.close_popup_with_animation(popup, content)
-        Clock.schedule_once(lambda dt: self.execute_shutdown_real(), 0.3)
-    
-    def execute_shutdown_real(self):
-        """Execute the actual shutdown (renamed from execute_shutdown)"""
-        self.update_status("Sending shutdown command...", "warning", "Please wait...")
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
-    
-    def close_popup_with_animation(self, popup, content):
-        """Close popup with fade animation"""
-        fade_out = Animation(opacity=0, duration=0.2)
-        fade_out.bind(on_complete=lambda *args: popup.dismiss())
-        fade_out.start(content)
-    
-    def execute_shutdown_with_animation(self, popup, content):
-        """Execute shutdown with animation"""
+        """Send the shutdown right away; the popup fades out while it is in flight"""
+        pressed_at = time.perf_counter()
         self.close_popup_with_animation(popup, content)
-        Clock.schedule_once(lambda dt: self.execute_shutdown_real(), 0.3)
+        self.execute_shutdown_real(pressed_at)
     
-    def execute_shutdown_real(self):
+    def execute_shutdown_real(self, pressed_at):
         """Execute the actual shutdown (renamed from execute_shutdown)"""
         self.update_status("Sending shutdown command...", "warning", "Please wait...")
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.executor.submit("shutdown", url, self._shutdown_thread, url, pressed_at)
     
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, url, pressed_at):
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", "error")
                 return
@@ -933,10 +1023,16 @@ class MobileShutdownController(FloatLayout):
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, headers=headers, verify=False, timeout=10)
+            def on_retry(attempt, wait, reason):
+                self.update_status(f"Retrying after {reason} ({attempt + 1}/{retry.MAX_ATTEMPTS})...", "warning")
+
+            response = retry.request("POST", url, headers=headers, verify=False, on_retry=on_retry)
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
+            print(f"Shutdown acknowledged {ack_ms:.0f} ms after YES")
             
             if response.status_code == 200:
-                self.update_status("Shutdown command sent successfully!", "success")
+                self.update_status(f"Shutdown command sent successfully! ({ack_ms:.0f} ms) Confirming...", "success")
+                shutdown_tracker.get_tracker().track(url, ADMIN_TOKEN, on_done=self._on_offline)
                 Clock.schedule_once(lambda dt: self.show_modern_popup(
                     "Success", "Shutdown command accepted!", "success"
                 ))
@@ -953,6 +1049,11 @@ class MobileShutdownController(FloatLayout):
         except Exception as e:
             self.update_status("Error occurred", "error")
     
+    def _on_offline(self, host):
+        """The shutdown tracker saw the target go offline, or gave up waiting"""
+        print(f"{host.url}: {host.describe()} ({host.checks} checks)")
+        self.update_status(host.describe(), "success" if host.state == shutdown_tracker.OFFLINE else "warning")
+    
     def show_modern_popup(self, title, message, popup_type="info"):
         """Enhanced popup with better styling and animations"""
         content = BoxLayout(orientation='vertical', spacing=dp(20), padding=dp(25))
@@ -1033,4 +1134,4 @@ class MobileShutdownApp(App):
 
 
 if __name__ == '__main__':
-    MobileShutdownApp().run()
\ No newline at end of file
+    kivy_async.run_app(MobileShutdownApp())
\ No newline at end of file
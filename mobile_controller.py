@@ -11,7 +11,15 @@ from kivy.clock import Clock
 from kivy.metrics import dp
 import requests
 import urllib3
-import threading
+import transport
+import retry
+import shutdown_tracker
+import executor
+import async_client
+import kivy_async
+import registry
+from kivy_status import StatusModel, start_frame_stats
+import time
 
 # Disable SSL warnings when using verify=False
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -23,6 +31,9 @@ ADMIN_TOKEN = "admin-shutdown-2024-token-secure"
 class MobileShutdownController(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Latest-wins status applied once per frame instead of a Clock event per message
+        self.status_model = StatusModel(self._apply_status)
+        self.frame_timer = start_frame_stats(type(self).__module__, self.status_model)
         self.orientation = 'vertical'
         self.spacing = dp(10)
         self.padding = dp(20)
@@ -56,6 +67,17 @@ class MobileShutdownController(BoxLayout):
         )
         url_section.add_widget(self.url_input)
         
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.tasks = kivy_async.get_tasks()
+        self.current_target = self.url_input.text.strip()
+        self.url_input.bind(text=self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(
+            lambda record: Clock.schedule_once(lambda dt: self.on_tunnel_moved(record))
+        )
+        
         update_url_btn = Button(
             text='Update URL',
             size_hint_y=None,
@@ -125,11 +147,15 @@ class MobileShutdownController(BoxLayout):
     
     def update_status(self, message, color=(0, 0, 0, 1)):
         """Update status label with message and color"""
-        def update_ui():
-            self.status_label.text = message
-            self.status_label.color = color
+        if executor.current_job_cancelled():
+            return
         
-        Clock.schedule_once(lambda dt: update_ui())
+        self.status_model.set(message, color)
+    
+    def _apply_status(self, message, color=(0, 0, 0, 1)):
+        """Apply the latest status to the widgets (runs at most once per frame)"""
+        self.status_label.text = message
+        self.status_label.color = color
     
     def update_url(self, instance):
         """Update URL with /shutdown endpoint if needed"""
@@ -145,15 +171,41 @@ class MobileShutdownController(BoxLayout):
         else:
             self.show_popup("Error", "Please enter a URL first!")
     
+    def on_url_changed(self, instance, value):
+        """Cancel in-flight requests for the previous URL when the user edits it"""
+        new_target = value.strip()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.tasks.cancel(self.current_target)
+            self.current_target = new_target
+    
+    def on_tunnel_moved(self, record):
+        """Switch to the agent's new tunnel URL as soon as it is published"""
+        new_url = registry.follow(self.url_input.text, record)
+        if not new_url:
+            return
+        self.url_input.text = new_url
+        self.update_status(f"🔄 {registry.describe_move(record)}", (0, 0, 1, 1))
+        self.executor.submit("reconnect", new_url, self._reconnect_thread, new_url, record["restarted_at"])
+    
+    def _reconnect_thread(self, url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("❌ New tunnel URL is not answering", (1, 0, 0, 1))
+        else:
+            print(f"Reconnected to {url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"✅ Reconnected {reconnect_ms:.0f} ms after tunnel restart", (0, 1, 0, 1))
+    
     def test_connection(self, instance):
         """Test connection to the target URL"""
         self.update_status("Testing connection...", (1, 0.6, 0, 1))
-        threading.Thread(target=self._test_connection_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.tasks.spawn("test", url, self._test_connection_async, url)
     
-    def _test_connection_thread(self):
-        """Background thread for testing connection"""
+    async def _test_connection_async(self, url):
+        """Test the connection on the app's event loop (cancelled if the URL changes)"""
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", (1, 0, 0, 1))
                 return
@@ -163,7 +215,7 @@ class MobileShutdownController(BoxLayout):
             headers = {"User-Agent": "Mozilla/5.0 (Android) Mobile Controller"}
             
             print(f"Testing connection to: {base_url}")
-            response = requests.get(base_url, headers=headers, verify=False, timeout=10)
+            response = await async_client.get_client().get(base_url, headers=headers)
             
             if response.status_code == 200:
                 self.update_status("✅ Connection successful! Ready to shutdown.", (0, 1, 0, 1))
@@ -179,8 +231,14 @@ class MobileShutdownController(BoxLayout):
             self.update_status(f"❌ Error: {str(e)[:30]}...", (1, 0, 0, 1))
             print(f"Test error: {e}")
     
+    def warm_connection(self, url):
+        """Open a pooled connection to the target while the user is still confirming"""
+        if url and url != TARGET_URL:
+            self.executor.submit("warm", url, transport.warm, url)
+    
     def confirm_shutdown(self, instance):
         """Show confirmation popup before shutdown"""
+        self.warm_connection(self.url_input.text.strip())
         content = BoxLayout(orientation='vertical', spacing=dp(10))
         content.add_widget(Label(
             text='Are you sure you want to shutdown the target machine?',
@@ -205,21 +263,21 @@ class MobileShutdownController(BoxLayout):
             auto_dismiss=False
         )
         
-        yes_btn.bind(on_press=lambda x: self.execute_shutdown(popup))
+        yes_btn.bind(on_press=lambda x: self.execute_shutdown(popup, time.perf_counter()))
         no_btn.bind(on_press=popup.dismiss)
         
         popup.open()
     
-    def execute_shutdown(self, popup):
+    def execute_shutdown(self, popup, pressed_at):
         """Execute the shutdown command"""
         popup.dismiss()
         self.update_status("Sending shutdown command...", (1, 0.6, 0, 1))
-        threading.Thread(target=self._shutdown_thread, daemon=True).start()
+        url = self.url_input.text.strip()
+        self.executor.submit("shutdown", url, self._shutdown_thread, url, pressed_at)
     
-    def _shutdown_thread(self):
+    def _shutdown_thread(self, url, pressed_at):
         """Background thread for shutdown operation"""
         try:
-            url = self.url_input.text.strip()
             if not url or url == TARGET_URL:
                 self.update_status("Please update the URL first!", (1, 0, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Error", "Please update the tunnel URL first!"))
@@ -232,14 +290,20 @@ class MobileShutdownController(BoxLayout):
             }
             
             print(f"Sending shutdown command to: {url}")
-            response = requests.post(url, headers=headers, verify=False, timeout=10)
+            def on_retry(attempt, wait, reason):
+                self.update_status(f"Retrying after {reason} ({attempt + 1}/{retry.MAX_ATTEMPTS})...", (1, 0.6, 0, 1))
+
+            response = retry.request("POST", url, headers=headers, verify=False, on_retry=on_retry)
+            ack_ms = (time.perf_counter() - pressed_at) * 1000
+            print(f"Shutdown acknowledged {ack_ms:.0f} ms after YES")
             
             print(f"Response Status Code: {response.status_code}")
             print(f"Response Text: {response.text}")
             
             if response.status_code == 200:
-                self.update_status("✅ Shutdown command sent successfully!", (0, 1, 0, 1))
+                self.update_status(f"✅ Shutdown command sent successfully! ({ack_ms:.0f} ms) Confirming...", (0, 1, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Success", "Shutdown command accepted!"))
+                shutdown_tracker.get_tracker().track(url, ADMIN_TOKEN, on_done=self._on_offline)
             elif response.status_code == 401:
                 self.update_status("❌ Unauthorized - wrong token", (1, 0, 0, 1))
                 Clock.schedule_once(lambda dt: self.show_popup("Unauthorized", "Invalid token."))
@@ -254,6 +318,12 @@ class MobileShutdownController(BoxLayout):
             self.update_status("❌ Error occurred", (1, 0, 0, 1))
             Clock.schedule_once(lambda dt: self.show_popup("Error", str(e)))
     
+    def _on_offline(self, host):
+        """The shutdown tracker saw the target go offline, or gave up waiting"""
+        print(f"{host.url}: {host.describe()} ({host.checks} checks)")
+        color = (0, 1, 0, 1) if host.state == shutdown_tracker.OFFLINE else (1, 0.6, 0, 1)
+        self.update_status(host.describe(), color)
+    
     def show_popup(self, title, message):
         """Show a popup message"""
         content = Label(
@@ -278,4 +348,4 @@ class MobileShutdownApp(App):
 
 
 if __name__ == '__main__':
-    MobileShutdownApp().run()
\ No newline at end of file
+    kivy_async.run_app(MobileShutdownApp())
\ No newline at end of file
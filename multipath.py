@@ -0,0 +1,186 @@
+# multipath.py - Race a target's LAN and tunnel endpoints and remember the winner
+#
+# A target can be reachable both directly on the LAN (http://192.168.1.20:5000)
+# and through its Cloudflare tunnel. Going through the tunnel from the same LAN
+# hairpins via the edge and adds 100+ ms, so commands race a connection to each
+# endpoint happy-eyeballs style: the preferred endpoint starts first, the next
+# one starts after a short stagger (or as soon as the previous one fails), and
+# the first connection that opens wins. Winners are cached per network with a
+# TTL, and a request that fails on the cached path falls back to the others.
+import queue
+import socket
+import threading
+import time
+
+import requests
+
+import commands
+import transport
+
+# CONFIG - Racing and caching
+RACE_STAGGER = 0.15       # Seconds before starting the next endpoint's attempt
+CONNECT_TIMEOUT = 2.0     # Per-endpoint connect timeout while racing
+WINNER_TTL = 300          # Seconds a winner is reused before racing again
+COMMAND_DEADLINE = 20     # Default overall budget for one request including the fallback
+
+
+def endpoints(*urls):
+    """Normalise URLs (base or /shutdown form, scheme optional) into an ordered endpoint list"""
+    result = []
+    for url in urls:
+        url = (url or "").strip()
+        if not url:
+            continue
+        if "://" not in url:
+            url = "http://" + url
+        url = commands.base_url(url)
+        if url not in result:
+            result.append(url)
+    return result
+
+
+def network_id():
+    """Identify the current network by the local address of the default route (no packets sent)"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("192.0.2.1", 9))
+        return s.getsockname()[0]
+    except OSError:
+        return "offline"
+    finally:
+        s.close()
+
+
+class PathRacer:
+    """Happy-eyeballs endpoint selection with a per-network winner cache"""
+
+    def __init__(self, stagger=RACE_STAGGER, connect_timeout=CONNECT_TIMEOUT, ttl=WINNER_TTL):
+        self.stagger = stagger
+        self.connect_timeout = connect_timeout
+        self.ttl = ttl
+        self._winners = {}          # (network, endpoints) -> (endpoint, expires_at)
+        self._lock = threading.Lock()
+        self.races = 0
+        self.cache_hits = 0
+        self.fallbacks = 0
+
+    def _key(self, endpoint_list):
+        return (network_id(), tuple(endpoint_list))
+
+    def cached(self, endpoint_list):
+        """Return the cached winner for these endpoints on this network, if still fresh"""
+        with self._lock:
+            entry = self._winners.get(self._key(endpoint_list))
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def remember(self, endpoint_list, endpoint):
+        """Cache endpoint as the winner for these endpoints on this network"""
+        with self._lock:
+            self._winners[self._key(endpoint_list)] = (endpoint, time.monotonic() + self.ttl)
+
+    def invalidate(self, endpoint_list):
+        with self._lock:
+            self._winners.pop(self._key(endpoint_list), None)
+
+    def resolve(self, endpoint_list, verify=False, deadline=None):
+        """Return the endpoint to use: the cached winner, or the winner of a fresh race"""
+        if len(endpoint_list) == 1:
+            return endpoint_list[0]
+        winner = self.cached(endpoint_list)
+        if winner:
+            self.cache_hits += 1
+            return winner
+        return self.race(endpoint_list, verify=verify, deadline=deadline)
+
+    def race(self, endpoint_list, candidates=None, verify=False, deadline=None):
+        """Race connections to candidates (default: all endpoints); raises ConnectionError if none open"""
+        candidates = list(candidates or endpoint_list)
+        if not candidates:
+            raise requests.exceptions.ConnectionError("No endpoints to try")
+        if requests.utils.get_environ_proxies(candidates[0]):
+            return candidates[0]        # Behind a proxy the connect race means nothing
+
+        self.races += 1
+        results = queue.Queue()
+        connect_timeout = self.connect_timeout if deadline is None else deadline.clamp(self.connect_timeout)
+
+        def attempt(endpoint):
+            results.put((endpoint, transport.warm(endpoint + "/", verify=verify, timeout=connect_timeout)))
+
+        def start_next():
+            endpoint = candidates[started]
+            threading.Thread(target=attempt, args=(endpoint,), daemon=True).start()
+            return started + 1
+
+        started, failed = 0, 0
+        started = start_next()
+        start = time.perf_counter()
+        while failed < len(candidates):
+            wait = self.stagger if started < len(candidates) else connect_timeout * 2
+            try:
+                endpoint, connect_ms = results.get(timeout=wait)
+            except queue.Empty:
+                if started < len(candidates):
+                    started = start_next()
+                    continue
+                break
+            if connect_ms is not None:
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"Path race: {endpoint} won after {elapsed:.0f} ms")
+                self.remember(endpoint_list, endpoint)
+                return endpoint
+            failed += 1
+            if started < len(candidates):
+                started = start_next()      # Don't wait out the stagger after a failure
+        raise requests.exceptions.ConnectionError(f"No endpoint reachable: {', '.join(candidates)}")
+
+    def request(self, endpoint_list, method, path, verify=False, deadline=None, **kwargs):
+        """Send method path to the best endpoint, falling back to the others if it fails to connect
+
+        The deadline (a transport.Deadline) bounds the race, the first attempt
+        and the fallback together.
+        """
+        if deadline is None:
+            deadline = transport.Deadline(COMMAND_DEADLINE)
+        endpoint = self.resolve(endpoint_list, verify=verify, deadline=deadline)
+        try:
+            return transport.request(method, endpoint + path, verify=verify, deadline=deadline, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            others = [other for other in endpoint_list if other != endpoint]
+            self.invalidate(endpoint_list)
+            if not others:
+                raise
+            print(f"Path {endpoint} failed ({e.__class__.__name__}), falling back")
+            self.fallbacks += 1
+            endpoint = self.race(endpoint_list, candidates=others, verify=verify, deadline=deadline)
+            return transport.request(method, endpoint + path, verify=verify, deadline=deadline, **kwargs)
+
+    def stats(self):
+        return {"races": self.races, "cache_hits": self.cache_hits, "fallbacks": self.fallbacks}
+
+
+_racer = None
+_racer_lock = threading.Lock()
+
+
+def get_racer():
+    """Return the process-wide racer, creating it on first use"""
+    global _racer
+    if _racer is None:
+        with _racer_lock:
+            if _racer is None:
+                _racer = PathRacer()
+    return _racer
+
+
+def request(endpoint_list, method, path, **kwargs):
+    return get_racer().request(endpoint_list, method, path, **kwargs)
+
+
+def warm(endpoint_list, verify=False):
+    """Pick the best endpoint (racing if needed) and make sure a connection to it is pooled"""
+    endpoint = get_racer().resolve(endpoint_list, verify=verify)
+    transport.warm(endpoint + "/", verify=verify)
+    return endpoint
@@ -0,0 +1,335 @@
+# netcache.py - DNS answer cache and TLS session cache for the shared transport
+#
+# Every new connection to a *.trycloudflare.com host used to start with a
+# fresh DNS lookup and a full TLS handshake, even seconds after the previous
+# one. The transport's CachingAdapter now resolves hosts through a TTL cache.
+# When it reconnects (e.g. after the edge dropped an idle keep-alive
+# connection), it offers the host's last TLS session, so the handshake is a
+# 1-RTT resumption. The TLS contexts are built once per verify setting, so
+# verify=True no longer re-reads the CA bundle for every new connection.
+#
+# getaddrinfo doesn't expose record TTLs, so answers are kept for DNS_TTL
+# seconds. Like urllib3, a connection tries every cached address in turn; an
+# address that answered moves to the front, and the answer is dropped only
+# when none of them does (a tunnel that moved).
+import asyncio
+import socket
+import ssl
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.ssl_ import is_ipaddress
+
+if not hasattr(HTTPAdapter, "build_connection_pool_key_attributes"):
+    # Without this hook the adapter can't hand urllib3 the shared TLS contexts
+    raise ImportError(f"netcache needs requests>=2.32.2 (found {requests.__version__})")
+
+# CONFIG - Caches
+DNS_TTL = 60.0              # Seconds a resolved address is reused
+DNS_MAX_ENTRIES = 1024      # Fleet mode: one entry per target host
+TLS_MAX_SESSIONS = 1024     # One resumable session kept per host
+
+
+class DnsCache:
+    """Host -> addresses with an expiry; misses go to getaddrinfo"""
+
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0   # Total time spent in real lookups
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, host):
+        """Addresses for host if a fresh answer is cached, else None (counts as a hit)"""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def store(self, host, infos, seconds):
+        addresses = [info[4][0] for info in infos]
+        with self._lock:
+            self.misses += 1
+            self.lookup_seconds += seconds
+            if len(self._entries) >= DNS_MAX_ENTRIES:
+                self._entries.clear()
+            if addresses:
+                self._entries[host] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def resolve(self, host, port):
+        """Return the addresses for host, from the cache while the answer is fresh"""
+        addresses = self.cached(host)
+        if addresses is None:
+            start = time.perf_counter()
+            infos = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+            addresses = self.store(host, infos, time.perf_counter() - start)
+        return addresses
+
+    async def resolve_async(self, host, port):
+        addresses = self.cached(host)
+        if addresses is None:
+            start = time.perf_counter()
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=allowed_gai_family(),
+                                                                 type=socket.SOCK_STREAM)
+            addresses = self.store(host, infos, time.perf_counter() - start)
+        return addresses
+
+    def prefer(self, host, address):
+        """Move an address that just connected to the front of host's answer"""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and entry[1][0] != address and address in entry[1]:
+                self._entries[host] = (entry[0], [address] + [a for a in entry[1] if a != address])
+
+    def forget(self, host):
+        with self._lock:
+            self._entries.pop(host, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def to_dict(self):
+        with self._lock:
+            average = self.lookup_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "avg_lookup_ms": round(average * 1000, 2),
+                "saved_ms": round(self.hits * average * 1000, 1),
+            }
+
+
+class TlsSessionCache:
+    """The latest resumable TLS session per server name"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, server_name):
+        with self._lock:
+            session = self._sessions.get(server_name)
+        if session is not None and time.time() > session.time + session.timeout:
+            return None
+        return session
+
+    def save(self, server_name, session):
+        # A TLS 1.3 session is only resumable once its ticket arrived (after the first read)
+        if session is None or not (session.has_ticket or session.id):
+            return
+        with self._lock:
+            if len(self._sessions) >= TLS_MAX_SESSIONS and server_name not in self._sessions:
+                self._sessions.clear()
+            self._sessions[server_name] = session
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+class ResumingContext(ssl.SSLContext):
+    """Client context that offers the cached session for the server it connects to
+
+    wrap_socket covers urllib3; wrap_bio covers asyncio's SSL transport
+    (async_client), which hands its SSLObject's session back through save_session.
+    """
+
+    sessions = None
+
+    def _cached(self, server_hostname, session):
+        if session is None and server_hostname and self.sessions is not None:
+            session = self.sessions.get(server_hostname)
+        return session
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                   server_hostname, self._cached(server_hostname, session))
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname,
+                                self._cached(server_hostname, session))
+
+
+class HandshakeStats:
+    """Full vs resumed TLS handshakes and the time they took"""
+
+    def __init__(self):
+        self.full = 0
+        self.resumed = 0
+        self.full_seconds = 0.0
+        self.resumed_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, resumed, seconds):
+        with self._lock:
+            if resumed:
+                self.resumed += 1
+                self.resumed_seconds += seconds
+            else:
+                self.full += 1
+                self.full_seconds += seconds
+
+    def to_dict(self):
+        with self._lock:
+            full_ms = self.full_seconds / self.full * 1000 if self.full else 0.0
+            resumed_ms = self.resumed_seconds / self.resumed * 1000 if self.resumed else 0.0
+            saved = self.resumed * (full_ms - resumed_ms) if self.full and self.resumed else 0.0
+            return {
+                "handshakes": self.full + self.resumed,
+                "full": self.full,
+                "resumed": self.resumed,
+                "avg_full_ms": round(full_ms, 2),
+                "avg_resumed_ms": round(resumed_ms, 2),
+                "saved_ms": round(max(saved, 0.0), 1),
+            }
+
+
+_dns = DnsCache()
+_handshakes = HandshakeStats()
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def get_dns():
+    return _dns
+
+
+def tls_context(verify=True):
+    """Return the process-wide client context; verify=True loads requests' CA bundle once"""
+    verify = bool(verify)
+    with _contexts_lock:
+        context = _contexts.get(verify)
+        if context is None:
+            context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.minimum_version = ssl.TLSVersion.TLSv1_2
+            context.set_alpn_protocols(["http/1.1"])
+            if verify:
+                context.load_verify_locations(requests.certs.where())
+            else:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            context.sessions = TlsSessionCache()
+            _contexts[verify] = context
+        return context
+
+
+def clear():
+    """Forget cached addresses and sessions (e.g. after the network changed)"""
+    _dns.clear()
+    with _contexts_lock:
+        for context in _contexts.values():
+            context.sessions.clear()
+
+
+def save_session(tls, server_hostname=None):
+    """Hand a connection's TLS session (SSLSocket or SSLObject) to its context's cache
+
+    Call it after a response was read: a TLS 1.3 ticket only arrives then.
+    """
+    context = getattr(tls, "context", None)
+    if isinstance(context, ResumingContext):
+        context.sessions.save(server_hostname or tls.server_hostname, getattr(tls, "session", None))
+
+
+def stats():
+    """DNS cache and TLS handshake metrics for the transport"""
+    return {"dns": _dns.to_dict(), "tls": _handshakes.to_dict()}
+
+
+# urllib3 plumbing --------------------------------------------------------------
+
+class _CachedDnsConnection(HTTPConnection):
+    """Resolves its host through the DNS cache and remembers how long the TCP connect took"""
+
+    tcp_seconds = 0.0
+
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        if is_ipaddress(host):
+            sock = super()._new_conn()
+        else:
+            try:
+                addresses = _dns.resolve(host, self.port)
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            try:
+                for index, address in enumerate(addresses):
+                    self._dns_host = address
+                    try:
+                        sock = super()._new_conn()
+                        break
+                    except Exception:
+                        if index == len(addresses) - 1:
+                            _dns.forget(host)       # None of them answered
+                            raise
+            finally:
+                self._dns_host = host
+            _dns.prefer(host, address)
+        self.tcp_seconds = time.perf_counter() - start
+        return sock
+
+
+class _ResumingConnection(_CachedDnsConnection, HTTPSConnection):
+    """HTTPS connection that times its handshake and hands its session back to the cache"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        resumed = getattr(self.sock, "session_reused", None)
+        if resumed is not None:
+            _handshakes.record(resumed, time.perf_counter() - start - self.tcp_seconds)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        self._save_session()
+        return response
+
+    def close(self):
+        self._save_session()
+        super().close()
+
+    def _save_session(self):
+        if self.sock is not None:
+            save_session(self.sock, self.server_hostname or self.host)
+
+
+class _HTTPPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDnsConnection
+
+
+class _HTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _ResumingConnection
+
+
+class CachingAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools use the DNS cache, the shared TLS contexts and session resumption"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPPool, "https": _HTTPSPool}
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if host_params["scheme"] == "https" and isinstance(verify, bool):
+            pool_kwargs["ssl_context"] = tls_context(verify)
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if verify is True and isinstance(conn.conn_kw.get("ssl_context"), ResumingContext):
+            conn.ca_certs = None            # Already loaded into the shared context
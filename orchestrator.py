@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware shutdown orchestrator
+
+Runs a plan of targets with ordering constraints, e.g. VMs and app servers
+before their storage, storage before the hypervisor host. A step starts as soon
+as every step it comes after has been confirmed offline, so independent
+branches run in parallel. Each step sends the command with commands.py (same
+200/401/other handling as the controllers) and then waits for the shutdown
+tracker (shutdown_tracker.py) to see the target stop answering. If a step
+fails or its host never goes offline, everything that depends on it is
+blocked instead of being powered off underneath it. The report shows
+per-step timing and the critical path through the plan.
+
+    python orchestrator.py plan.json --dry-run       # validate and print the order
+    python orchestrator.py plan.json --yes
+    python orchestrator.py --demo --yes              # against local stand-in agents
+
+Plan format (JSON):
+    {
+      "token": "admin-shutdown-2024-token-secure",    # default for every step
+      "command": "shutdown",                          # default for every step
+      "steps": [
+        {"name": "vm-01", "url": "https://aaaa.trycloudflare.com"},
+        {"name": "app-01", "url": "https://bbbb.trycloudflare.com"},
+        {"name": "nas-01", "url": "https://cccc.trycloudflare.com", "after": ["vm-01", "app-01"]},
+        {"name": "hv-01", "url": "https://dddd.trycloudflare.com", "after": ["nas-01"], "confirm": false}
+      ]
+    }
+
+"confirm": false treats the step as done once the command is accepted.
+Exit codes: 0 every step done, 1 a step failed or was blocked, 2 bad plan/usage.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import commands
+import fleet
+import shutdown_tracker
+
+# CONFIG - Orchestration
+DEFAULT_TOKEN = os.environ.get("RSC_AGENT_TOKEN", "admin-shutdown-2024-token-secure")
+DEFAULT_CONCURRENCY = fleet.DEFAULT_CONCURRENCY
+OFFLINE_TIMEOUT = shutdown_tracker.OFFLINE_TIMEOUT
+
+PENDING = "pending"
+RUNNING = "running"
+CONFIRMING = "confirming"
+DONE = "done"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+class PlanError(ValueError):
+    """The plan is malformed: unknown dependency, duplicate name or a cycle"""
+
+
+class Step:
+    """One target in the plan, plus its progress during a run"""
+
+    def __init__(self, name, url, after=(), command="shutdown", token=DEFAULT_TOKEN, confirm=True):
+        self.name = name
+        self.url = commands.base_url(url)
+        self.after = list(after)
+        self.command = command
+        self.token = token
+        self.confirm = confirm
+        self.state = PENDING
+        self.result = None          # CommandResult of the command
+        self.error = ""
+        self.started = None         # Seconds since the run started
+        self.accepted = None        # Command answered 200
+        self.finished = None        # Confirmed offline (or failed)
+
+    def to_dict(self):
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+        return {
+            "name": self.name,
+            "url": self.url,
+            "state": self.state,
+            "status": self.result.status if self.result else None,
+            "error": self.error,
+            "after": self.after,
+            "start_ms": ms(self.started),
+            "command_ms": ms(self.accepted - self.started) if self.accepted is not None else None,
+            "offline_ms": ms(self.finished - self.accepted)
+            if self.state == DONE and self.confirm and self.accepted is not None else None,
+            "finish_ms": ms(self.finished),
+        }
+
+
+class Plan:
+    """Steps and their ordering constraints; validated on creation"""
+
+    def __init__(self, steps):
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise PlanError(f"Duplicate step name: {step.name}")
+            self.steps[step.name] = step
+        for step in self.steps.values():
+            for name in step.after:
+                if name not in self.steps:
+                    raise PlanError(f"{step.name} comes after unknown step {name}")
+        self.dependents = {name: [] for name in self.steps}
+        for step in self.steps.values():
+            for name in step.after:
+                self.dependents[name].append(step.name)
+        self.levels()                       # Raises on cycles
+
+    @classmethod
+    def from_dict(cls, data):
+        token = data.get("token", DEFAULT_TOKEN)
+        command = data.get("command", "shutdown")
+        try:
+            steps = [Step(entry["name"], entry["url"], entry.get("after", ()), entry.get("command", command),
+                          entry.get("token", token), entry.get("confirm", True))
+                     for entry in data["steps"]]
+        except (KeyError, TypeError) as e:
+            raise PlanError(f"Every step needs a name and a url ({e})")
+        return cls(steps)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def levels(self):
+        """Steps grouped by depth (Kahn's algorithm); everything in a level can run together"""
+        waiting = {name: len(step.after) for name, step in self.steps.items()}
+        level = sorted(name for name, count in waiting.items() if count == 0)
+        levels = []
+        while level:
+            levels.append(level)
+            following = []
+            for name in level:
+                for dependent in self.dependents[name]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        following.append(dependent)
+            level = sorted(following)
+        if sum(len(names) for names in levels) != len(self.steps):
+            stuck = sorted(name for name, count in waiting.items() if count > 0)
+            raise PlanError(f"Ordering constraints form a cycle: {', '.join(stuck)}")
+        return levels
+
+    def descendants(self, name):
+        found, stack = set(), list(self.dependents[name])
+        while stack:
+            current = stack.pop()
+            if current not in found:
+                found.add(current)
+                stack.extend(self.dependents[current])
+        return found
+
+
+def wait_offline(url, timeout=OFFLINE_TIMEOUT, cancelled=None, token=None):
+    """Block until the shutdown tracker sees the host stop answering; True if it went offline in time"""
+    tracker = shutdown_tracker.get_tracker()
+    host = tracker.track(url, token, timeout)
+    while not host.wait(0.2):
+        if cancelled is not None and cancelled.is_set():
+            tracker.cancel(host.url)
+            return False
+    return host.state == shutdown_tracker.OFFLINE
+
+
+class PlanReport:
+    """Outcome of a run: per-step timing and the critical path"""
+
+    def __init__(self, plan, elapsed):
+        self.plan = plan
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return all(step.state == DONE for step in self.plan.steps.values())
+
+    def critical_path(self):
+        """The chain of steps that determined the total time: from the last step to finish,
+        repeatedly follow the predecessor that finished last (the one it was waiting for)"""
+        finished = [step for step in self.plan.steps.values() if step.finished is not None]
+        if not finished:
+            return []
+        step = max(finished, key=lambda s: s.finished)
+        path = [step]
+        while step.after:
+            step = max((self.plan.steps[name] for name in step.after), key=lambda s: s.finished or 0)
+            path.append(step)
+        return [s.name for s in reversed(path)]
+
+    def to_dict(self):
+        steps = [step.to_dict() for step in self.plan.steps.values()]
+        busy = sum((step.finished or 0) - (step.started or 0) for step in self.plan.steps.values()
+                   if step.started is not None)
+        return {
+            "ok": self.ok,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "serial_ms": round(busy * 1000, 1),     # Time the steps would take one after another
+            "critical_path": self.critical_path(),
+            "counts": {state: sum(1 for s in steps if s["state"] == state)
+                       for state in (DONE, FAILED, BLOCKED, PENDING)},
+            "steps": steps,
+        }
+
+
+class Orchestrator:
+    """Runs a Plan: every step whose predecessors are offline starts right away"""
+
+    def __init__(self, plan, concurrency=DEFAULT_CONCURRENCY, offline_timeout=OFFLINE_TIMEOUT):
+        self.plan = plan
+        self.concurrency = max(1, min(int(concurrency), fleet.MAX_CONCURRENCY))
+        self.offline_timeout = offline_timeout
+        self._cancel = threading.Event()
+        self._start = None
+
+    def cancel(self):
+        """Start no further steps; steps already confirming stop polling"""
+        self._cancel.set()
+
+    def _now(self):
+        return time.perf_counter() - self._start
+
+    def _run_step(self, step, on_event):
+        step.state = RUNNING
+        step.started = self._now()
+        self._emit(step, on_event)
+        step.result = commands.send_command(step.url, step.token, step.command)
+        if not step.result.ok:
+            step.state, step.error = FAILED, step.result.describe()
+            step.finished = self._now()
+            return step
+        step.accepted = self._now()
+        if step.confirm:
+            step.state = CONFIRMING
+            self._emit(step, on_event)
+            if not wait_offline(step.url, self.offline_timeout, self._cancel, step.token):
+                step.state, step.error = FAILED, "Still online after the command was accepted"
+                step.finished = self._now()
+                return step
+        step.state = DONE
+        step.finished = self._now()
+        return step
+
+    def _emit(self, step, on_event):
+        if on_event:
+            on_event(step)
+
+    def run(self, on_event=None):
+        """Execute the plan (blocking); on_event(step) is called on every state change"""
+        self._start = time.perf_counter()
+        waiting = {name: len(step.after) for name, step in self.plan.steps.items()}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="orchestrator") as pool:
+            def start(names):
+                for name in names:
+                    if not self._cancel.is_set():
+                        step = self.plan.steps[name]
+                        running[pool.submit(self._run_step, step, on_event)] = step
+
+            start(sorted(name for name, count in waiting.items() if count == 0))
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    step = running.pop(future)
+                    self._emit(step, on_event)
+                    if step.state != DONE:
+                        for name in sorted(self.plan.descendants(step.name)):
+                            blocked = self.plan.steps[name]
+                            if blocked.state == PENDING:
+                                blocked.state, blocked.error = BLOCKED, f"{step.name} did not go offline"
+                                self._emit(blocked, on_event)
+                        continue
+                    for name in self.plan.dependents[step.name]:
+                        waiting[name] -= 1
+                        if waiting[name] == 0 and self.plan.steps[name].state == PENDING:
+                            ready.append(name)
+                start(ready)
+        return PlanReport(self.plan, self._now())
+
+
+def demo_plan(offline_after=1.0):
+    """Start stand-in agents that go offline after /shutdown and return (plan, agents):
+    four VMs -> two storage hosts -> one hypervisor"""
+    from stand_in_agent import StandInAgent
+    agents = {}
+    layout = [
+        ("vm-01", []), ("vm-02", []), ("vm-03", []), ("vm-04", []),
+        ("nas-01", ["vm-01", "vm-02"]), ("nas-02", ["vm-03", "vm-04"]),
+        ("hv-01", ["nas-01", "nas-02"]),
+    ]
+    steps = []
+    for index, (name, after) in enumerate(layout):
+        agent = StandInAgent(token=DEFAULT_TOKEN, latency=0.03, offline_after=offline_after * (1 + index % 3) / 2)
+        agents[name] = agent
+        steps.append(Step(name, agent.start(), after, token=DEFAULT_TOKEN))
+    return Plan(steps), agents
+
+
+def _print_event(step):
+    line = f"[{step.state:>10}] {step.name}"
+    if step.error:
+        line += f" - {step.error}"
+    print(line, file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dependency-aware shutdown orchestrator")
+    parser.add_argument("plan", nargs="?", help="Plan JSON file")
+    parser.add_argument("--demo", action="store_true", help="Run a built-in plan against local stand-in agents")
+    parser.add_argument("--dry-run", action="store_true", help="Validate the plan and print the order only")
+    parser.add_argument("--yes", action="store_true", help="Really send the commands (required)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--offline-timeout", type=float, default=OFFLINE_TIMEOUT,
+                        help="Seconds a host gets to go offline after accepting the command")
+    args = parser.parse_args(argv)
+
+    agents = {}
+    try:
+        if args.demo:
+            plan, agents = demo_plan()
+        elif args.plan:
+            plan = Plan.load(args.plan)
+        else:
+            parser.error("give a plan file or --demo")
+    except (OSError, ValueError) as e:
+        print(f"❌ Bad plan: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.dry_run or not args.yes:
+        for depth, names in enumerate(plan.levels(), 1):
+            print(f"{depth}. " + ", ".join(f"{name} ({plan.steps[name].url})" for name in names))
+        for agent in agents.values():
+            agent.stop()
+        if not args.dry_run:
+            print("Add --yes to run the plan", file=sys.stderr)
+        return EXIT_OK if args.dry_run else EXIT_USAGE
+
+    report = Orchestrator(plan, args.concurrency, args.offline_timeout).run(on_event=_print_event)
+    for agent in agents.values():
+        agent.stop()
+    print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
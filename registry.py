@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Rendezvous registry that tracks each agent's current tunnel URL
+
+Every /restart-tunnel (and every command except shutdown) gives the agent a
+new trycloudflare hostname. Agents publish their new URL here, and
+controllers long-poll the registry so they can follow the target to its new
+URL within a second instead of waiting for someone to paste it in.
+
+    python registry.py serve --port 5050
+    python registry.py publish --registry http://127.0.0.1:5050 --id lab-01 --url https://xxxx.trycloudflare.com
+    python registry.py watch --registry http://127.0.0.1:5050
+    python registry.py bench -n 20      # restart -> URL swap -> reconnect latency (stand-in)
+
+Controllers read the registry address from RSC_REGISTRY_URL and its Bearer
+token from RSC_REGISTRY_TOKEN. A registry that isn't on this machine is only
+followed with a token: anyone who can publish to it can point a controller
+(and its admin token) at their own URL.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import stats
+import transport
+import commands
+
+# CONFIG - Registry defaults
+DEFAULT_PORT = 5050
+REGISTRY_URL = os.environ.get("RSC_REGISTRY_URL", "")
+REGISTRY_TOKEN = os.environ.get("RSC_REGISTRY_TOKEN", "")
+LONG_POLL_WAIT = 25         # Seconds a watch request is held open waiting for changes
+URL_HISTORY = 10            # Previous URLs remembered per agent so stale clients can follow
+
+
+class _Registry:
+    """Versioned agent records; waiters are woken on every publish"""
+
+    def __init__(self):
+        self.version = 0
+        self.records = {}
+        self._cond = threading.Condition()
+
+    def publish(self, agent_id, fields):
+        with self._cond:
+            record = self.records.get(agent_id, {"id": agent_id, "previous_urls": []})
+            tunnel_url = commands.base_url(fields.get("tunnel_url") or "")
+            if not tunnel_url:
+                raise ValueError("tunnel_url is required")
+            old_url = record.get("tunnel_url")
+            if old_url and old_url != tunnel_url:
+                history = [url for url in record["previous_urls"] if url != old_url]
+                record["previous_urls"] = ([old_url] + history)[:URL_HISTORY]
+            record.update({
+                "name": fields.get("name") or record.get("name") or agent_id,
+                "tunnel_url": tunnel_url,
+                "restarted_at": fields.get("restarted_at") or time.time(),
+                "published_at": time.time(),
+            })
+            self.version += 1
+            record["version"] = self.version
+            self.records[agent_id] = record
+            self._cond.notify_all()
+            return dict(record)
+
+    def changes(self, since, wait):
+        """Records newer than `since`, waiting up to `wait` seconds for one to appear"""
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while self.version <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            agents = [dict(r) for r in self.records.values() if r["version"] > since]
+            return self.version, agents
+
+
+class _RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    registry = None             # Set on the per-server subclass
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        return not self.token or self.headers.get("Authorization") == f"Bearer {self.token}"
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if not self._authorized():
+            return self._send_json(401, {"error": "Unauthorized"})
+        if parsed.path == "/agents":
+            query = parse_qs(parsed.query)
+            try:
+                since = int(query.get("since", ["0"])[0])
+                wait = min(float(query.get("wait", ["0"])[0]), LONG_POLL_WAIT)
+            except ValueError:
+                return self._send_json(400, {"error": "since/wait must be numbers"})
+            version, agents = self.registry.changes(since, wait)
+            return self._send_json(200, {"version": version, "agents": agents})
+        if parsed.path.startswith("/agents/"):
+            record = self.registry.records.get(parsed.path[len("/agents/"):])
+            if record is None:
+                return self._send_json(404, {"error": "Unknown agent"})
+            return self._send_json(200, record)
+        self._send_json(404, {"error": "Not found"})
+
+    def do_PUT(self):
+        parsed = urlparse(self.path)
+        if not self._authorized():
+            return self._send_json(401, {"error": "Unauthorized"})
+        if not parsed.path.startswith("/agents/") or len(parsed.path) <= len("/agents/"):
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            fields = json.loads(self.rfile.read(length) or b"{}")
+            record = self.registry.publish(parsed.path[len("/agents/"):], fields)
+        except (ValueError, AttributeError) as e:
+            return self._send_json(400, {"error": str(e)})
+        print(f"Registry: {record['name']} -> {record['tunnel_url']}")
+        self._send_json(200, record)
+
+
+class RegistryServer:
+    """Local rendezvous service; start() returns its base URL"""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.registry = _Registry()
+        self._server = None
+
+    @property
+    def url(self):
+        if self._server is None:
+            return None
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def start(self):
+        handler = type("RegistryHandler", (_RegistryHandler,), {"registry": self.registry, "token": self.token})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _headers(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def is_loopback(registry_url):
+    """True if registry_url points at this machine (localhost or a loopback address)"""
+    host = urlparse(registry_url).hostname or ""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def publish(registry_url, agent_id, tunnel_url, name=None, restarted_at=None, token=None, timeout=5):
+    """Publish an agent's current tunnel URL; returns False (never raises) if the registry is unreachable
+
+    token defaults to RSC_REGISTRY_TOKEN.
+    """
+    token = token or REGISTRY_TOKEN
+    payload = {"tunnel_url": tunnel_url, "name": name, "restarted_at": restarted_at or time.time()}
+    try:
+        response = transport.request("PUT", f"{registry_url.rstrip('/')}/agents/{agent_id}",
+                                     json=payload, headers=_headers(token), timeout=timeout)
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Registry publish failed: {e}")
+        return False
+
+
+def follow(url, record):
+    """Return url rewritten to the record's new tunnel (keeping its endpoint), or None if it isn't this agent"""
+    if not url:
+        return None
+    current = commands.base_url(url)
+    if current == record["tunnel_url"] or current not in record["previous_urls"]:
+        return None
+    suffix = url.strip().rstrip("/")[len(current):]
+    return record["tunnel_url"] + suffix
+
+
+def describe_move(record):
+    """Status line for a followed restart, naming the new URL so the switch is never silent"""
+    return f"Tunnel moved to {record['tunnel_url']} ({lag_ms(record):.0f} ms after restart)"
+
+
+def lag_ms(record):
+    """Milliseconds since the agent restarted (agent and controller clocks assumed in sync)"""
+    return (time.time() - record["restarted_at"]) * 1000
+
+
+def measure_reconnect(url, restarted_at, timeout=30, interval=0.25):
+    """Poll url until the new tunnel answers; returns ms since the restart, or None on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if transport.get(commands.base_url(url) + "/", verify=False, timeout=5).status_code == 200:
+                return (time.time() - restarted_at) * 1000
+        except Exception:
+            pass
+        time.sleep(interval)
+    return None
+
+
+class RegistryWatcher:
+    """Long-polls the registry and calls on_change(record) (on its own thread) for each update"""
+
+    def __init__(self, registry_url, on_change, token=None, wait=LONG_POLL_WAIT):
+        self.registry_url = registry_url.rstrip("/")
+        self.on_change = on_change
+        self.token = token
+        self.wait = wait
+        self.version = 0
+        self.records = {}
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                response = transport.get(f"{self.registry_url}/agents",
+                                         params={"since": self.version, "wait": self.wait},
+                                         headers=_headers(self.token), timeout=self.wait + 5)
+                response.raise_for_status()
+                data = response.json()
+                backoff = 1.0
+            except Exception as e:
+                print(f"Registry watch failed: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            self.version = data["version"]
+            for record in data["agents"]:
+                self.records[record["id"]] = record
+                try:
+                    self.on_change(record)
+                except Exception as e:
+                    print(f"Registry callback failed: {e}")
+
+
+def watch(on_change, registry_url=None, token=None):
+    """Start a watcher on registry_url (default RSC_REGISTRY_URL); returns None when none is configured
+
+    token defaults to RSC_REGISTRY_TOKEN. A registry off this machine without a
+    token is refused (None), since its records redirect where commands go.
+    """
+    registry_url = registry_url or REGISTRY_URL
+    token = token or REGISTRY_TOKEN
+    if not registry_url:
+        return None
+    if not token and not is_loopback(registry_url):
+        print(f"Registry {registry_url} not followed: set RSC_REGISTRY_TOKEN for a registry on another host")
+        return None
+    return RegistryWatcher(registry_url, on_change, token=token).start()
+
+
+def bench_reconnect(count, token="admin-shutdown-2024-token-secure"):
+    """Restart a stand-in's tunnel `count` times; measure restart -> swap and restart -> reconnect"""
+    from stand_in_agent import StandInAgent
+
+    server = RegistryServer(port=0)
+    registry_url = server.start()
+    agent = StandInAgent(token=token)
+    url = agent.start()
+    agent.on_url_change = lambda new_url: publish(registry_url, "bench", new_url)
+    publish(registry_url, "bench", url)
+
+    updates = queue.Queue()
+    watcher = RegistryWatcher(registry_url, updates.put).start()
+    updates.get(timeout=10)             # Initial snapshot
+
+    swaps, reconnects = [], []
+    for _ in range(count):
+        restarted_at = time.time()
+        transport.post(f"{url}/restart-tunnel", headers={"Authorization": f"Bearer {token}"}, timeout=10)
+        record = updates.get(timeout=10)
+        swaps.append((time.time() - restarted_at) * 1000)
+        url = follow(url, record) or record["tunnel_url"]
+        reconnects.append(measure_reconnect(url, restarted_at))
+
+    watcher.stop()
+    agent.stop()
+    server.stop()
+
+    def summary(values):
+        ordered = sorted(v for v in values if v is not None)
+        return {
+            "count": len(ordered),
+            "p50_ms": round(stats.percentile(ordered, 0.50), 2),
+            "max_ms": round(ordered[-1], 2),
+            "failed": len(values) - len(ordered),
+        }
+    return {"restarts": count, "swap": summary(swaps), "reconnect": summary(reconnects)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tunnel URL rendezvous registry")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    serve = sub.add_parser("serve", help="Run the registry")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--token", default=REGISTRY_TOKEN or None,
+                       help="Require this Bearer token (default: RSC_REGISTRY_TOKEN)")
+    pub = sub.add_parser("publish", help="Publish an agent's current tunnel URL")
+    pub.add_argument("--registry", default=REGISTRY_URL or f"http://127.0.0.1:{DEFAULT_PORT}")
+    pub.add_argument("--id", required=True)
+    pub.add_argument("--url", required=True)
+    pub.add_argument("--name")
+    pub.add_argument("--token", default=REGISTRY_TOKEN or None)
+    wat = sub.add_parser("watch", help="Print updates as agents publish")
+    wat.add_argument("--registry", default=REGISTRY_URL or f"http://127.0.0.1:{DEFAULT_PORT}")
+    wat.add_argument("--token", default=REGISTRY_TOKEN or None)
+    bench = sub.add_parser("bench", help="Measure restart -> reconnect latency against a local stand-in")
+    bench.add_argument("-n", "--restarts", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.mode == "bench":
+        print(json.dumps(bench_reconnect(args.restarts), indent=2))
+        return
+
+    if args.mode == "publish":
+        raise SystemExit(0 if publish(args.registry, args.id, args.url, args.name, token=args.token) else 1)
+
+    if args.mode == "serve":
+        if not args.token and not is_loopback(f"http://{args.host}"):
+            print(f"Warning: registry on {args.host} without --token; anyone who can reach it can redirect controllers")
+        server = RegistryServer(args.host, args.port, args.token)
+        print(f"Registry running at: {server.start()}")
+        stopper = server
+    else:
+        stopper = RegistryWatcher(args.registry, lambda record: print(json.dumps(record)), token=args.token).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stopper.stop()
+
+
+if __name__ == "__main__":
+    main()
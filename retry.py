@@ -0,0 +1,116 @@
+# retry.py - Retries with capped exponential backoff, jitter and idempotency keys
+#
+# Cloudflare answers 502/524 when the tunnel blips and mobile links drop
+# connections, so commands are retried instead of failing on the first error.
+# Delays grow exponentially up to a cap with full jitter, a Retry-After header
+# on 429/503 is honoured, and everything stays inside the operation's deadline.
+# Every non-GET request carries an Idempotency-Key that stays the same across
+# its retries, so an agent that already ran a /shutdown whose reply got lost
+# answers the retry from its cache instead of running it again.
+import random
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import health
+import multipath
+import transport
+
+# CONFIG - Retry policy
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.25           # Seconds; attempt n waits up to BASE_DELAY * 2**n
+MAX_DELAY = 4.0             # Cap for the exponential part
+MAX_RETRY_AFTER = 30.0      # Ignore Retry-After values longer than this
+OPERATION_DEADLINE = 20     # Default budget for all attempts of one command
+RETRY_STATUSES = frozenset({429, 502, 503, 504, 520, 521, 522, 523, 524})
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class RetryPolicy:
+    """Which failures to retry and how long to wait between attempts"""
+
+    def __init__(self, attempts=MAX_ATTEMPTS, base=BASE_DELAY, cap=MAX_DELAY, statuses=RETRY_STATUSES):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.statuses = statuses
+        self._random = random.Random()
+
+    def retryable(self, response=None, error=None):
+        if response is not None:
+            return response.status_code in self.statuses
+        if isinstance(error, (transport.DeadlineExceeded, health.CircuitOpenError)):
+            return False
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def delay(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        hinted = retry_after(response) if response is not None else None
+        if hinted is not None:
+            return min(hinted, MAX_RETRY_AFTER)
+        return self._random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+def retry_after(response):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def request(method, target, path="", policy=None, deadline=None, idempotency_key=None,
+            on_retry=None, **kwargs):
+    """Send a request, retrying transient failures; target is a URL or a multipath endpoint list
+
+    Returns the last response (which may still be an error status) or raises
+    the last exception. on_retry(attempt, delay, reason) runs before each wait.
+    """
+    policy = policy or RetryPolicy()
+    deadline = deadline or transport.Deadline(OPERATION_DEADLINE)
+    headers = dict(kwargs.pop("headers", None) or {})
+    if method.upper() != "GET":
+        headers.setdefault(IDEMPOTENCY_HEADER, idempotency_key or new_key())
+
+    attempt = 0
+    while True:
+        attempt += 1
+        response, error = None, None
+        try:
+            if isinstance(target, (list, tuple)):
+                response = multipath.request(list(target), method, path, headers=headers,
+                                             deadline=deadline, **kwargs)
+            else:
+                response = transport.request(method, target + path, headers=headers,
+                                             deadline=deadline, **kwargs)
+        except requests.exceptions.RequestException as e:
+            error = e
+
+        if not policy.retryable(response, error) or attempt >= policy.attempts:
+            break
+        wait = policy.delay(attempt, response)
+        if wait >= deadline.remaining():
+            break                       # Another attempt can't finish in time
+        reason = f"HTTP {response.status_code}" if response is not None else error.__class__.__name__
+        print(f"Retrying {method} {path or target} in {wait:.2f}s ({reason}, attempt {attempt}/{policy.attempts})")
+        if on_retry:
+            on_retry(attempt, wait, reason)
+        time.sleep(wait)
+
+    if error is not None:
+        raise error
+    response.attempts = attempt
+    return response
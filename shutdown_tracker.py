@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Confirms that hosts really went offline after accepting a shutdown
+
+A 200 from /shutdown only means the agent accepted the command. The tracker
+then polls the host's /status (and the tunnel root) with backoff until it
+stops answering or its deadline passes. It records how long each host took
+to go offline and lists the stragglers that are still up.
+
+Every tracked host is one timer in a single hashed timer wheel, so following
+thousands of hosts costs one wheel thread plus a small pool of check workers,
+not a sleeping thread per host.
+
+    python shutdown_tracker.py https://a.trycloudflare.com https://b.trycloudflare.com
+    python shutdown_tracker.py -f hosts.txt --timeout 120
+    python shutdown_tracker.py --demo 2000          # local stand-ins that power off at different times
+
+Exit codes: 0 every host went offline, 1 stragglers remain, 2 usage error.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import commands
+import health
+import stats
+import transport
+
+# CONFIG - Offline confirmation
+OFFLINE_TIMEOUT = 180       # Seconds a host gets to stop answering after accepting the command
+POLL_INTERVAL = 0.5         # First check; grows by POLL_BACKOFF up to MAX_POLL_INTERVAL
+POLL_BACKOFF = 1.5
+MAX_POLL_INTERVAL = 5.0
+POLL_JITTER = 0.2           # +/- share of each interval, so hosts tracked together don't poll in lockstep
+CONFIRM_INTERVAL = 0.5      # A failed check is repeated this soon
+OFFLINE_CONFIRMATIONS = 2   # Consecutive failed checks before a host counts as offline
+STRAGGLER_AFTER = 60        # Hosts still answering this long after the command are listed as stragglers
+CHECK_WORKERS = 32          # Checks in flight at once, whatever the number of hosts
+
+# CONFIG - Timer wheel
+WHEEL_TICK = 0.1            # Seconds per tick (timer resolution)
+WHEEL_SLOTS = 512           # One revolution is 51.2s; longer timers wait for their lap
+
+TRACKING = "tracking"
+OFFLINE = "offline"
+STRAGGLER = "straggler"     # Deadline passed and the host still answers
+CANCELLED = "cancelled"
+
+EXIT_OK = 0
+EXIT_STRAGGLERS = 1
+EXIT_USAGE = 2
+
+
+def is_offline(response=None, error=None):
+    """True if a check shows the host down: no connection, a timeout, or a Cloudflare 'origin gone' code"""
+    if error is not None:
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    return response.status_code in health.DOWN_STATUSES
+
+
+def _jitter(seconds):
+    return seconds * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+class TimerWheel:
+    """Hashed timer wheel: O(1) scheduling and one thread for any number of timers
+
+    Time is cut into ticks and each timer goes into the bucket of its due tick
+    modulo the number of buckets. Every tick the thread runs the timers of
+    one bucket that are due on this lap. Callbacks run on the wheel thread, so
+    they should hand the real work to a pool.
+    """
+
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._origin = time.monotonic()
+        self._processed = 0         # Last tick whose bucket has been run
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return self._pending
+
+    def _now_tick(self):
+        return int((time.monotonic() - self._origin) / self.tick)
+
+    def schedule(self, delay, callback):
+        """Call callback after delay seconds (rounded up to a tick); returns a handle for cancel()"""
+        with self._lock:
+            now = self._now_tick()
+            if self._pending == 0:
+                self._processed = max(self._processed, now)     # Idle wheel: nothing to catch up on
+            due = max(now, self._processed) + max(1, math.ceil(delay / self.tick))
+            timer = [due, callback]
+            self._slots[due % len(self._slots)].append(timer)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return timer
+
+    def cancel(self, timer):
+        timer[1] = None             # Dropped when its bucket comes round
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = self._pending == 0
+                next_at = self._origin + (self._processed + 1) * self.tick
+            if idle:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            fire = []
+            with self._lock:
+                now = self._now_tick()
+                while self._processed < now:
+                    self._processed += 1
+                    slot = self._slots[self._processed % len(self._slots)]
+                    due = [timer for timer in slot if timer[0] <= self._processed]
+                    if due:
+                        slot[:] = [timer for timer in slot if timer[0] > self._processed]
+                        self._pending -= len(due)
+                        fire.extend(due)
+            for _, callback in fire:
+                if callback is not None:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"Timer callback failed: {e}")
+
+
+class TrackedHost:
+    """One host between 'command accepted' and 'stopped answering'"""
+
+    def __init__(self, url, token=None, timeout=OFFLINE_TIMEOUT, on_done=None, name=None, sent_at=None):
+        self.url = commands.base_url(url)
+        self.name = name or self.url
+        self.token = token
+        self.timeout = timeout
+        self.on_done = on_done
+        self.sent_at = sent_at or time.time()
+        self.deadline = transport.Deadline(timeout)
+        self.state = TRACKING
+        self.checks = 0
+        self.misses = 0             # Consecutive failed checks
+        self.interval = POLL_INTERVAL
+        self.last_seen = None       # time.time() of the last check the host answered
+        self.offline_at = None      # First failed check of the confirming run
+        self.finished_at = None
+        self.timer = None
+        self.done = threading.Event()
+
+    @property
+    def time_to_offline(self):
+        return self.offline_at - self.sent_at if self.state == OFFLINE else None
+
+    @property
+    def waited(self):
+        return (self.finished_at or time.time()) - self.sent_at
+
+    def wait(self, timeout=None):
+        """Block until the host is offline, a straggler or cancelled; False on timeout"""
+        return self.done.wait(timeout)
+
+    def describe(self):
+        if self.state == OFFLINE:
+            return f"✅ Offline after {self.time_to_offline:.1f}s"
+        if self.state == STRAGGLER:
+            return f"⚠️ Still online {self.waited:.0f}s after the command"
+        if self.state == CANCELLED:
+            return "Offline check cancelled"
+        return f"⏳ Waiting for it to go offline ({self.waited:.0f}s)"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "url": self.url,
+            "state": self.state,
+            "checks": self.checks,
+            "time_to_offline_s": round(self.time_to_offline, 2) if self.state == OFFLINE else None,
+            "waited_s": round(self.waited, 1),
+            "last_seen": round(self.last_seen, 1) if self.last_seen else None,
+        }
+
+
+class ShutdownTracker:
+    """Follows accepted shutdowns until the hosts stop answering, on one timer wheel and a few check workers"""
+
+    def __init__(self, timeout=OFFLINE_TIMEOUT, workers=CHECK_WORKERS, wheel=None):
+        self.timeout = timeout
+        self.wheel = wheel or TimerWheel()
+        self.checks = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="offline-check")
+        self._hosts = {}            # url -> latest TrackedHost for it
+        self._lock = threading.Lock()
+
+    def track(self, url, token=None, timeout=None, on_done=None, name=None, sent_at=None):
+        """Start confirming that url goes offline
+
+        on_done(host) runs on a check worker once the host is offline or its
+        deadline passed (not when it is cancelled).
+        """
+        host = TrackedHost(url, token, timeout or self.timeout, on_done, name, sent_at)
+        with self._lock:
+            previous = self._hosts.get(host.url)
+            self._hosts[host.url] = host
+        if previous is not None:
+            self._finish(previous, CANCELLED)   # A newer command to the same host replaces it
+        host.timer = self.wheel.schedule(_jitter(POLL_INTERVAL), lambda: self._due(host))
+        return host
+
+    def get(self, url):
+        with self._lock:
+            return self._hosts.get(commands.base_url(url))
+
+    def cancel(self, url):
+        host = self.get(url)
+        if host is not None:
+            self._finish(host, CANCELLED)
+
+    def hosts(self):
+        with self._lock:
+            return list(self._hosts.values())
+
+    def clear(self):
+        """Forget hosts that are no longer being tracked"""
+        with self._lock:
+            self._hosts = {url: host for url, host in self._hosts.items() if host.state == TRACKING}
+
+    def stragglers(self, after=STRAGGLER_AFTER):
+        """Hosts past their deadline, plus hosts still answering after `after` seconds; longest first"""
+        late = [host for host in self.hosts()
+                if host.state == STRAGGLER or (host.state == TRACKING and host.waited >= after)]
+        return sorted(late, key=lambda host: host.waited, reverse=True)
+
+    def summary(self, hosts=None):
+        hosts = self.hosts() if hosts is None else hosts
+        counts = {state: 0 for state in (TRACKING, OFFLINE, STRAGGLER, CANCELLED)}
+        for host in hosts:
+            counts[host.state] += 1
+        times = [host.time_to_offline for host in hosts if host.state == OFFLINE]
+        return dict(counts, **{
+            "hosts": len(hosts),
+            "checks": self.checks,
+            "p50_time_to_offline_s": round(stats.percentile(times, 0.50), 2) if times else None,
+            "p95_time_to_offline_s": round(stats.percentile(times, 0.95), 2) if times else None,
+            "max_time_to_offline_s": round(max(times), 2) if times else None,
+        })
+
+    # Checks ----------------------------------------------------------------------
+
+    def _due(self, host):
+        if host.state == TRACKING:
+            self._pool.submit(self._check, host)
+
+    def _probe(self, host):
+        """True if the host still answers, False if it looks offline, None if the deadline cut the check off"""
+        paths = ("/status", "/") if host.token else ("/",)
+        for path in paths:
+            headers = {"Authorization": f"Bearer {host.token}"} if path == "/status" else None
+            try:
+                response = transport.get(host.url + path, headers=headers, verify=False, deadline=host.deadline)
+            except transport.DeadlineExceeded:
+                return None
+            except requests.exceptions.RequestException as e:
+                if not is_offline(error=e):
+                    return True
+            else:
+                if not is_offline(response):
+                    return True
+        return False
+
+    def _check(self, host):
+        if host.state != TRACKING:
+            return
+        answering = self._probe(host)
+        host.checks += 1
+        self.checks += 1
+        if answering is False:
+            if not host.misses:
+                host.offline_at = time.time()
+            host.misses += 1
+            if host.misses >= OFFLINE_CONFIRMATIONS:
+                return self._finish(host, OFFLINE)
+            delay = CONFIRM_INTERVAL
+        else:
+            if answering:
+                host.last_seen = time.time()
+            host.misses = 0
+            delay = _jitter(host.interval)
+            host.interval = min(host.interval * POLL_BACKOFF, MAX_POLL_INTERVAL)
+        if host.deadline.expired:
+            return self._finish(host, STRAGGLER)
+        host.timer = self.wheel.schedule(min(delay, host.deadline.remaining()), lambda: self._due(host))
+
+    def _finish(self, host, state):
+        with self._lock:
+            if host.state != TRACKING:
+                return
+            host.state = state
+            host.finished_at = time.time()
+        if host.timer is not None:
+            self.wheel.cancel(host.timer)
+        if state == OFFLINE:
+            health.get_monitor().reset(host.url)    # Nothing to probe back to health; it was switched off
+        host.done.set()
+        if state != CANCELLED and host.on_done:
+            try:
+                host.on_done(host)
+            except Exception as e:
+                print(f"Offline callback for {host.name} failed: {e}")
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = ShutdownTracker()
+    return _tracker
+
+
+def _demo_targets(count, token):
+    """Stand-ins that power off 1-8s after /shutdown (one never does), each behind many loopback addresses"""
+    from stand_in_agent import StandInAgent
+    agents = [StandInAgent(host="0.0.0.0", token=token, offline_after=random.uniform(1.0, 8.0))
+              for _ in range(9)]
+    agents.append(StandInAgent(host="0.0.0.0", token=token))
+    targets = []
+    for agent in agents:
+        port = agent.start().rsplit(":", 1)[1]
+        commands.send_command(f"http://127.0.0.1:{port}", token, "shutdown")
+    for i in range(count):
+        port = agents[i % len(agents)].url.rsplit(":", 1)[1]
+        # Distinct loopback addresses, so every "target" gets its own pool and circuit breaker
+        targets.append(f"http://127.{i // 62500}.{i // 250 % 250}.{i % 250 + 1}:{port}")
+    return agents, targets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wait until hosts that accepted a shutdown stop answering")
+    parser.add_argument("targets", nargs="*", help="Target URLs")
+    parser.add_argument("-f", "--file", action="append", default=[], dest="files",
+                        help="File with one target per line ('-' for stdin)")
+    parser.add_argument("--token", default="admin-shutdown-2024-token-secure", help="Also check /status with it")
+    parser.add_argument("--timeout", type=float, default=OFFLINE_TIMEOUT, help="Seconds before a host is a straggler")
+    parser.add_argument("--demo", type=int, metavar="N", help="Track N addresses of local stand-ins")
+    args = parser.parse_args(argv)
+
+    agents = []
+    if args.demo:
+        agents, targets = _demo_targets(args.demo, args.token)
+        args.timeout = min(args.timeout, 30)
+    else:
+        text = "\n".join(args.targets)
+        for path in args.files:
+            with (sys.stdin if path == "-" else open(path, "r", encoding="utf-8")) as f:
+                text += "\n" + f.read()
+        targets = commands.parse_targets(text)
+    if not targets:
+        print("No targets given", file=sys.stderr)
+        return EXIT_USAGE
+
+    tracker = get_tracker()
+    start = time.perf_counter()
+    hosts = [tracker.track(url, args.token, args.timeout) for url in targets]
+    peak_threads = threading.active_count()
+    while not all(host.done.is_set() for host in hosts):
+        time.sleep(1)
+        peak_threads = max(peak_threads, threading.active_count())
+        summary = tracker.summary(hosts)
+        print(f"{summary[OFFLINE]}/{len(hosts)} offline, {summary[TRACKING]} waiting, "
+              f"{len(tracker.wheel)} timers", file=sys.stderr, flush=True)
+    threads = sum(1 for t in threading.enumerate()
+                  if t.name.startswith(("timer-wheel", "offline-check", "health-monitor", "health-probe")))
+    stragglers = [host.url for host in hosts if host.state == STRAGGLER]
+    # peak_threads counts every thread in the process, the demo's stand-in servers included
+    summary = dict(tracker.summary(hosts), elapsed_s=round(time.perf_counter() - start, 2),
+                   tracker_threads=threads, peak_threads=peak_threads, stragglers=stragglers[:20])
+    if len(stragglers) > 20:
+        summary["stragglers"].append(f"... and {len(stragglers) - 20} more")
+    for agent in agents:
+        agent.stop()
+    print(json.dumps(summary, indent=2))
+    return EXIT_OK if summary[OFFLINE] == len(hosts) else EXIT_STRAGGLERS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
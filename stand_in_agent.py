@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the remote shutdown agent, for offline testing and benchmarks
+
+Implements the endpoints the controllers talk to (/, /status, /shutdown,
+/restart-tunnel, /reboot and custom commands, plus the /events status stream)
+with the same Bearer token check,
+but NEVER powers anything off. Latency, jitter, error rates, forced status codes,
+lost replies and tunnel-restart URL changes can be injected. Commands sent
+with an Idempotency-Key are executed once; repeats get the stored reply.
+With --offline-after the agent stops answering that long after a /shutdown,
+like a PC powering off (for testing offline confirmation).
+
+    python stand_in_agent.py --port 5000 --latency 80 --jitter 20 --error-rate 0.05
+    python stand_in_agent.py --port 5000 --lost-reply-rate 0.2    # command runs, reply becomes a 524
+    python stand_in_agent.py --port 5000 --offline-after 3000     # "powers off" 3s after /shutdown
+    python stand_in_agent.py --port 0 --announce --announce-address 127.0.0.1
+    python stand_in_agent.py --port 0 --registry http://127.0.0.1:5050 --agent-id lab-01
+
+Point any controller at the printed URL (add /shutdown where the UI expects it).
+"""
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import discovery
+import registry
+
+DEFAULT_TOKEN = "admin-shutdown-2024-token-secure"
+DEFAULT_FAULT_CODES = (500, 502, 503, 524, 429)
+EVENT_BUFFER = 256              # Events kept for clients resuming with Last-Event-ID
+HEARTBEAT_INTERVAL = 2.0        # Seconds between keep-alive comments on /events
+RECONNECT_HINT_MS = 1000        # SSE "retry:" sent to clients
+IDEMPOTENCY_TTL = 600           # Seconds a command's reply is kept for retries with the same key
+
+
+class AgentStats:
+    """Thread-safe counters exposed to benchmarks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.by_endpoint = {}
+        self.by_status = {}
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self, endpoint, status):
+        with self._lock:
+            self.requests += 1
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+            self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+            self.by_endpoint = {}
+            self.by_status = {}
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "by_endpoint": dict(self.by_endpoint),
+                "by_status": dict(self.by_status),
+            }
+
+
+class EventLog:
+    """Numbered agent events for the /events stream; survives tunnel restarts so clients can resume"""
+
+    def __init__(self, size=EVENT_BUFFER):
+        self.last_id = 0
+        self.closed = False
+        self._events = deque(maxlen=size)
+        self._cond = threading.Condition()
+
+    def publish(self, event, data):
+        with self._cond:
+            self.last_id += 1
+            self._events.append((self.last_id, event, data))
+            self._cond.notify_all()
+            return self.last_id
+
+    def since(self, last_id):
+        """Events after last_id, or None if some of them were already dropped from the buffer"""
+        with self._cond:
+            if last_id > self.last_id:
+                return None
+            if self._events and last_id < self._events[0][0] - 1:
+                return None
+            return [e for e in self._events if e[0] > last_id]
+
+    def wait(self, last_id, timeout):
+        with self._cond:
+            if self.last_id <= last_id and not self.closed:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e[0] > last_id]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class _AgentServer(ThreadingHTTPServer):
+    """Threading server that can drop its open keep-alive connections, like a dead tunnel"""
+    daemon_threads = True
+    request_queue_size = 1024       # Concurrency benchmarks open hundreds of connections at once
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._open = set()
+        self._open_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._open_lock:
+            self._open.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._open_lock:
+            self._open.discard(request)
+        super().shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        # A client that hung up, or close_all() pulling the socket from under a
+        # handler (power-off, tunnel restart), is expected here, not a bug
+        if isinstance(sys.exc_info()[1], OSError):
+            return
+        super().handle_error(request, client_address)
+
+    def close_all(self):
+        self.shutdown()
+        self.server_close()
+        with self._open_lock:
+            open_sockets, self._open = list(self._open), set()
+        for sock in open_sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _AgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, like cloudflared
+    disable_nagle_algorithm = True
+    agent = None                    # Set per agent by StandInAgent
+
+    def setup(self):
+        super().setup()
+        self.agent.stats.count_connection()
+        if self.agent.handshake_delay:
+            time.sleep(self.agent.handshake_delay)
+
+    def log_message(self, format, *args):
+        if self.agent.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, code, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.agent.stats.count_request(self.path.split("?", 1)[0], code)
+
+    def _authorized(self):
+        return self.headers.get("Authorization") == f"Bearer {self.agent.token}"
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _inject_fault(self):
+        """Apply latency and fault knobs; returns True if a fault response was sent"""
+        self.agent.delay()
+        code = self.agent.pick_fault()
+        if code is None:
+            return False
+        headers = {}
+        if code in (429, 503):
+            headers["Retry-After"] = str(self.agent.retry_after)
+        self._reply(code, {"error": f"Injected fault {code}"}, headers)
+        return True
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _stream_events(self):
+        """Server-Sent Events: a status snapshot (or the missed events), then live events"""
+        if not self._authorized():
+            self._reply(401, {"error": "Unauthorized"})
+            return
+        log = self.agent.events
+        try:
+            resume_from = int(self.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            resume_from = None
+        missed = log.since(resume_from) if resume_from is not None else None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        self.agent.stats.count_request("/events", 200)
+
+        def frame(event_id, event, data):
+            return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+        try:
+            self._write_chunk(f"retry: {RECONNECT_HINT_MS}\n\n")
+            if missed is None:
+                cursor = log.last_id
+                self._write_chunk(frame(cursor, "status", self.agent.status()))
+            else:
+                cursor = resume_from
+            while not log.closed:
+                events = missed if missed else log.wait(cursor, HEARTBEAT_INTERVAL)
+                missed = None
+                if not events:
+                    self._write_chunk(": ping\n\n")
+                for event_id, event, data in events:
+                    self._write_chunk(frame(event_id, event, data))
+                    cursor = event_id
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass                    # Client went away or the tunnel was torn down
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/_agent/stats":
+            self._reply(200, self.agent.stats.to_dict())
+            return
+        if self._inject_fault():
+            return
+        if path == "/events":
+            self._stream_events()
+        elif path == "/":
+            self._reply(200, {"message": "Remote shutdown agent running (stand-in)", "status": "online"})
+        elif path == "/status":
+            if not self._authorized():
+                self._reply(401, {"error": "Unauthorized"})
+                return
+            self._reply(200, self.agent.status())
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        self._read_body()
+        command = self.path.split("?", 1)[0].strip("/")
+        if self._inject_fault():
+            return
+        if not self._authorized():
+            self._reply(401, {"error": "Unauthorized"})
+            return
+        key = self.headers.get("Idempotency-Key")
+        replay = self.agent.replay(key, command)
+        if replay:
+            self._reply(*replay, headers={"Idempotent-Replayed": "true"})
+            return
+        code, payload = self._execute(command)
+        self.agent.remember(key, command, code, payload)
+        if self.agent.lose_reply():
+            # The command ran, but the edge gave up waiting (Cloudflare 524)
+            self._reply(524, {"error": "A timeout occurred (injected lost reply)"})
+            return
+        self._reply(code, payload)
+
+    def _execute(self, command):
+        if not command:
+            return 404, {"error": "Not found"}
+        if command == "status":
+            return 200, dict(self.agent.status(), message="Status OK")
+        if command == "shutdown":
+            self.agent.shutdown_requests += 1
+            self.agent.events.publish("shutdown", {"message": "Shutdown initiated", "at": time.time()})
+            self.agent.schedule_power_off()
+            return 200, {"message": "Shutdown initiated (stand-in agent, nothing powered off)"}
+        # Like the real agent, every command except shutdown restarts the tunnel
+        new_url = self.agent.schedule_tunnel_restart()
+        return 200, {"message": f"Command '{command}' received, restarting tunnel", "tunnel_url": new_url}
+
+
+class StandInAgent:
+    """A local agent that can be started/stopped and reconfigured from benchmarks"""
+
+    def __init__(self, host="127.0.0.1", port=0, token=DEFAULT_TOKEN, latency=0.0, jitter=0.0,
+                 error_rate=0.0, fault_codes=DEFAULT_FAULT_CODES, force_status=None,
+                 retry_after=1, handshake_delay=0.0, rotate_url=True, lost_reply_rate=0.0,
+                 idempotency=True, offline_after=None, verbose=False):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.latency = latency              # Seconds added to every request
+        self.jitter = jitter                # +/- seconds of random variation
+        self.error_rate = error_rate        # Probability of answering with a fault code
+        self.fault_codes = tuple(fault_codes)
+        self.force_status = force_status    # Always answer with this code (401/404/5xx...)
+        self.retry_after = retry_after
+        self.handshake_delay = handshake_delay
+        self.rotate_url = rotate_url        # /restart-tunnel moves the agent to a new port
+        self.lost_reply_rate = lost_reply_rate  # Probability a command runs but its reply is a 524
+        self.idempotency = idempotency      # Honour Idempotency-Key (off = run every retry again)
+        self.offline_after = offline_after  # Seconds after /shutdown until the agent stops answering (None = never)
+        self.offline_at = None              # time.time() when it went offline
+        self.verbose = verbose
+        self.stats = AgentStats()
+        self.events = EventLog()
+        self.shutdown_requests = 0
+        self.tunnel_restarts = 0
+        self.replays = 0
+        self._replies = {}                  # (key, command) -> (code, payload, expires_at)
+        self.started_at = time.time()
+        self.on_url_change = None           # Callback(new_url) after a tunnel restart
+        self._server = None
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @property
+    def url(self):
+        if self._server is None:
+            return None
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def _serve(self, port):
+        handler = type("StandInHandler", (_AgentHandler,), {"agent": self})
+        server = _AgentServer((self.host, port), handler)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        return server
+
+    def start(self):
+        self.events.closed = False
+        self._server = self._serve(self.port)
+        return self.url
+
+    def stop(self):
+        with self._lock:
+            server, self._server = self._server, None
+        self.events.close()
+        if server:
+            server.close_all()
+
+    def delay(self):
+        seconds = self.latency
+        if self.jitter:
+            seconds += self._random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def pick_fault(self):
+        if self.force_status:
+            return self.force_status
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._random.choice(self.fault_codes)
+        return None
+
+    def lose_reply(self):
+        return bool(self.lost_reply_rate) and self._random.random() < self.lost_reply_rate
+
+    def replay(self, key, command):
+        """Stored (code, payload) for a command already run with this key, else None"""
+        if not key or not self.idempotency:
+            return None
+        with self._lock:
+            entry = self._replies.get((key, command))
+            if entry is None or entry[2] <= time.time():
+                return None
+            self.replays += 1
+            return entry[0], entry[1]
+
+    def remember(self, key, command, code, payload):
+        if not key or not self.idempotency:
+            return
+        now = time.time()
+        with self._lock:
+            self._replies = {k: v for k, v in self._replies.items() if v[2] > now}
+            self._replies[(key, command)] = (code, payload, now + IDEMPOTENCY_TTL)
+
+    def status(self):
+        return {
+            "status": "online",
+            "hostname": socket.gethostname(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "tunnel_url": self.url,
+        }
+
+    def schedule_power_off(self):
+        """After a shutdown, stop answering offline_after seconds later (if configured)"""
+        if self.offline_after is None:
+            return
+        def power_off():
+            self.offline_at = time.time()
+            self.stop()
+        timer = threading.Timer(self.offline_after, power_off)
+        timer.daemon = True
+        timer.start()
+
+    def schedule_tunnel_restart(self):
+        """Start serving on a new URL and close the old one shortly after replying"""
+        self.tunnel_restarts += 1
+        if not self.rotate_url:
+            return self.url
+        with self._lock:
+            old_server = self._server
+            self._server = self._serve(0)
+            new_url = self.url
+
+        self.events.publish("tunnel", {"tunnel_url": new_url})
+        threading.Timer(0.2, old_server.close_all).start()
+        print(f"Tunnel restarted, new URL: {new_url}")
+        if self.on_url_change:
+            self.on_url_change(new_url)
+        return new_url
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in shutdown agent (never powers off)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--token", default=DEFAULT_TOKEN)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- latency (ms)")
+    parser.add_argument("--handshake-delay", type=float, default=0.0,
+                        help="Added delay per new connection (ms), mimics TLS through the edge")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (0-1)")
+    parser.add_argument("--fault-codes", default=",".join(str(c) for c in DEFAULT_FAULT_CODES),
+                        help="Comma separated status codes used for injected faults")
+    parser.add_argument("--force-status", type=int, help="Answer every request with this status code")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--lost-reply-rate", type=float, default=0.0,
+                        help="Fraction of commands that run but answer 524, as if the reply was lost")
+    parser.add_argument("--no-idempotency", action="store_true",
+                        help="Ignore Idempotency-Key and run every retried command again")
+    parser.add_argument("--offline-after", type=float,
+                        help="Stop answering this many ms after a /shutdown, like a PC powering off")
+    parser.add_argument("--no-rotate", action="store_true", help="Keep the same URL after /restart-tunnel")
+    parser.add_argument("--announce", action="store_true", help="Announce this agent for LAN discovery")
+    parser.add_argument("--announce-address", default=discovery.BROADCAST_ADDRESS,
+                        help="Where to send announcements (127.0.0.1 when testing on loopback)")
+    parser.add_argument("--name", help="Name to announce/publish (default: hostname)")
+    parser.add_argument("--registry", help="Publish the current URL to this registry on start and restart")
+    parser.add_argument("--agent-id", default=socket.gethostname(), help="Id used in the registry")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    agent = StandInAgent(
+        host=args.host,
+        port=args.port,
+        token=args.token,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        fault_codes=[int(c) for c in args.fault_codes.split(",") if c.strip()],
+        force_status=args.force_status,
+        retry_after=args.retry_after,
+        handshake_delay=args.handshake_delay / 1000,
+        rotate_url=not args.no_rotate,
+        lost_reply_rate=args.lost_reply_rate,
+        idempotency=not args.no_idempotency,
+        offline_after=args.offline_after / 1000 if args.offline_after is not None else None,
+        verbose=args.verbose
+    )
+    url = agent.start()
+    print(f"Stand-in agent running at: {url}")
+    announcer = None
+    if args.announce:
+        announcer = discovery.Announcer(agent._server.server_port, name=args.name, tunnel_url=url,
+                                        address=args.announce_address).start()
+        print(f"Announcing as {announcer.name} on UDP {discovery.DISCOVERY_PORT}")
+    if args.registry:
+        registry.publish(args.registry, args.agent_id, url, name=args.name)
+        print(f"Publishing to registry {args.registry} as {args.agent_id}")
+
+    def url_changed(new_url):
+        restarted_at = time.time()
+        if announcer:
+            announcer.update(port=agent._server.server_port, tunnel_url=new_url)
+        if args.registry:
+            threading.Thread(target=registry.publish, args=(args.registry, args.agent_id, new_url),
+                             kwargs={"name": args.name, "restarted_at": restarted_at}, daemon=True).start()
+
+    agent.on_url_change = url_changed
+    print("Nothing will actually be shut down. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        if announcer:
+            announcer.stop()
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
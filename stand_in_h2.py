@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+HTTPS stand-in agent that speaks HTTP/2 (and HTTP/1.1), for multiplexing tests
+
+Like stand_in_agent.py it answers /, /status and /shutdown with the Bearer
+token check and never powers anything off, but it serves over TLS and offers
+h2 via ALPN, as the Cloudflare edge does. Clients that don't negotiate h2 get
+HTTP/1.1 keep-alive on the same port. A self-signed certificate for
+127.0.0.1 / localhost is generated with the openssl CLI on start.
+
+    python stand_in_h2.py --port 5443 --latency 50
+
+Needs the h2 package (pip install "httpx[http2]" brings it along).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+from stand_in_agent import DEFAULT_TOKEN, AgentStats
+
+
+def make_certificate(directory):
+    """Create a throwaway self-signed cert/key pair for localhost; returns (cert_path, key_path)"""
+    cert_path = os.path.join(directory, "stand_in.crt")
+    key_path = os.path.join(directory, "stand_in.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+         "-keyout", key_path, "-out", cert_path, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_path, key_path
+
+
+class H2StandInAgent:
+    """TLS stand-in serving h2 and http/1.1 from one asyncio loop on a background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, token=DEFAULT_TOKEN, latency=0.0, http2=True):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.latency = latency
+        self.http2 = http2                  # Offer h2 in ALPN (off = HTTP/1.1 only)
+        self.stats = AgentStats()
+        self.protocols = {}                 # Negotiated protocol -> connections
+        self.shutdown_requests = 0
+        self.started_at = time.time()
+        self._loop = None
+        self._server = None
+        self._tmp = None
+
+    @property
+    def url(self):
+        if self._server is None:
+            return None
+        return f"https://{self.host}:{self._server.sockets[0].getsockname()[1]}"
+
+    def start(self):
+        if h2 is None:
+            raise RuntimeError("stand_in_h2 needs the h2 package (pip install \"httpx[http2]\")")
+        self._tmp = tempfile.TemporaryDirectory()
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(*make_certificate(self._tmp.name))
+        context.set_alpn_protocols(["h2", "http/1.1"] if self.http2 else ["http/1.1"])
+
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def serve():
+            self._server = await asyncio.start_server(self._handle, self.host, self.port, ssl=context,
+                                                      backlog=1024)
+            ready.set()
+
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(serve(), self._loop)
+        ready.wait(10)
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            async def close():
+                self._server.close()
+                tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                for task in tasks:
+                    task.cancel()           # Keep-alive connections still waiting for a request
+                await asyncio.gather(*tasks, return_exceptions=True)
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._server = None
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    # Request handling (shared by both protocols) -------------------------------
+
+    def respond(self, method, path, headers):
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+        authorized = headers.get("authorization") == f"Bearer {self.token}"
+        if method == "GET" and path == "/":
+            return 200, {"message": "Remote shutdown agent running (stand-in, h2)", "status": "online"}
+        if not authorized and path in ("/status", "/shutdown"):
+            return 401, {"error": "Unauthorized"}
+        if path == "/status":
+            return 200, {"status": "online", "hostname": socket.gethostname(),
+                         "uptime": round(time.time() - self.started_at, 1), "tunnel_url": self.url}
+        if method == "POST" and path == "/shutdown":
+            self.shutdown_requests += 1
+            return 200, {"message": "Shutdown initiated (stand-in agent, nothing powered off)"}
+        return 404, {"error": "Not found"}
+
+    async def _answer(self, method, path, headers):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        code, payload = self.respond(method, path, headers)
+        self.stats.count_request(path.split("?", 1)[0], code)
+        return code, json.dumps(payload).encode()
+
+    async def _handle(self, reader, writer):
+        self.stats.count_connection()
+        ssl_object = writer.get_extra_info("ssl_object")
+        protocol = ssl_object.selected_alpn_protocol() if ssl_object else None
+        self.protocols[protocol or "http/1.1"] = self.protocols.get(protocol or "http/1.1", 0) + 1
+        try:
+            if protocol == "h2":
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_h1(reader, writer)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.CancelledError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_h1(self, reader, writer):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length:
+                await reader.readexactly(length)
+            code, body = await self._answer(method, path, headers)
+            writer.write((f"HTTP/1.1 {code} {'OK' if code == 200 else 'Error'}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                return
+
+    async def _serve_h2(self, reader, writer):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        streams = {}
+
+        async def reply(stream_id, headers):
+            code, body = await self._answer(headers[":method"], headers[":path"], headers)
+            try:
+                conn.send_headers(stream_id, [(":status", str(code)), ("content-type", "application/json"),
+                                              ("content-length", str(len(body)))])
+                conn.send_data(stream_id, body, end_stream=True)
+                writer.write(conn.data_to_send())
+            except h2.exceptions.ProtocolError:
+                pass                        # Stream was reset by the client
+
+        while True:
+            data = await reader.read(65535)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    streams[event.stream_id] = dict(event.headers)
+                elif isinstance(event, h2.events.DataReceived):
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    asyncio.ensure_future(reply(event.stream_id, streams.pop(event.stream_id)))
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    writer.write(conn.data_to_send())
+                    return
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTPS stand-in agent with HTTP/2")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5443)
+    parser.add_argument("--token", default=DEFAULT_TOKEN)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added latency per request (ms)")
+    parser.add_argument("--http1-only", action="store_true", help="Don't offer h2 (to test the fallback)")
+    args = parser.parse_args()
+
+    agent = H2StandInAgent(args.host, args.port, args.token, args.latency / 1000, http2=not args.http1_only)
+    print(f"Stand-in agent (h2) running at: {agent.start()}")
+    print("Self-signed certificate: use verify=False. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# stats.py - Shared latency statistics
+#
+# Every p50/p95/p99 the tools print (waves, the benches, debug_controller's
+# bench, frame stats, time-to-offline) uses this one nearest-rank definition,
+# so the numbers are comparable across reports.
+import math
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (fraction 0-1): the smallest value with at least that share at or below it
+
+    Returns None for an empty sequence; values need not be sorted.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
@@ -0,0 +1,138 @@
+# status_stream.py - Live agent status over Server-Sent Events
+#
+# Instead of one-shot GET probes that go stale immediately, StatusStream keeps
+# a GET /events subscription open. The agent sends a status snapshot, then an
+# event whenever something changes (shutdown accepted, tunnel moved) and a
+# keep-alive comment every couple of seconds. If nothing arrives for a few
+# heartbeats, or the connection drops, the stream reconnects with backoff and
+# resumes from the last event id so nothing in between is lost.
+import json
+import threading
+import time
+
+import commands
+import transport
+
+# CONFIG - Stream timing
+CONNECT_TIMEOUT = 5
+HEARTBEAT_TIMEOUT = 7.0     # No bytes (events or pings) for this long = dead connection
+RECONNECT_DELAY = 1.0       # First retry delay; doubles up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 30.0
+
+
+class StatusStream:
+    """Background SSE subscription to an agent's /events endpoint
+
+    on_event(event, data) and on_state(state, detail) run on the stream thread;
+    UI code must hand them over to its own thread. States are "connecting",
+    "live", "reconnecting" and "stopped".
+    """
+
+    def __init__(self, url, token, on_event=None, on_state=None, verify=False):
+        self.url = commands.base_url(url)
+        self.token = token
+        self.on_event = on_event
+        self.on_state = on_state
+        self.verify = verify
+        self.state = "stopped"
+        self.last_event_id = None
+        self.last_seen = None
+        self.reconnects = 0
+        self._retry = RECONNECT_DELAY
+        self._moved = False
+        self._stop = threading.Event()
+        self._response = None
+
+    def start(self):
+        self._stop.clear()
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()            # Unblocks the read in the stream thread
+
+    def _set_state(self, state, detail=""):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_state:
+            self.on_state(state, detail)
+
+    def _run(self):
+        delay = self._retry
+        self._set_state("connecting")
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                detail = "stream ended"
+            except Exception as e:
+                detail = f"{e.__class__.__name__}: {str(e)[:60]}"
+            if self._stop.is_set():
+                break
+            # A stream that went live resets the backoff
+            delay = self._retry if self.state == "live" else min(delay * 2, MAX_RECONNECT_DELAY)
+            self.reconnects += 1
+            self._set_state("reconnecting", detail)
+            if self._moved:
+                self._moved = False         # The agent said where it went; go there right away
+                continue
+            self._stop.wait(delay)
+        self._set_state("stopped")
+
+    def _listen(self):
+        headers = {"Authorization": f"Bearer {self.token}", "Accept": "text/event-stream"}
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = str(self.last_event_id)
+        response = transport.get(f"{self.url}/events", headers=headers, stream=True,
+                                 verify=self.verify, timeout=(CONNECT_TIMEOUT, HEARTBEAT_TIMEOUT))
+        self._response = response
+        try:
+            if response.status_code != 200:
+                raise ConnectionError(f"HTTP {response.status_code}")
+            self._set_state("live")
+            response.encoding = "utf-8"     # SSE is always UTF-8
+            buffer = ""
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                self.last_seen = time.monotonic()
+                buffer += chunk.replace("\r\n", "\n")
+                while "\n\n" in buffer:
+                    block, buffer = buffer.split("\n\n", 1)
+                    self._dispatch(block)
+                if self._stop.is_set():
+                    return
+        finally:
+            self._response = None
+            response.close()
+
+    def _dispatch(self, block):
+        event, data, event_id = "message", [], None
+        for line in block.split("\n"):
+            if not line or line.startswith(":"):
+                continue                    # Heartbeat comment
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+            elif field == "id":
+                event_id = value
+            elif field == "retry" and value.isdigit():
+                self._retry = int(value) / 1000
+        if event_id is not None and event_id.isdigit():
+            self.last_event_id = int(event_id)
+        if not data:
+            return
+        try:
+            payload = json.loads("\n".join(data))
+        except ValueError:
+            payload = "\n".join(data)
+        if event == "tunnel" and isinstance(payload, dict) and payload.get("tunnel_url"):
+            # Follow the agent; the next reconnect resumes on the new URL
+            self.url = commands.base_url(payload["tunnel_url"])
+            self._moved = True
+        if self.on_event:
+            self.on_event(event, payload)
@@ -6,7 +6,10 @@ import tkinter as tk
 from tkinter import messagebox, simpledialog
 import requests
 import urllib3
-import threading
+import transport
+import executor
+from tk_dispatch import TkDispatcher
+import registry
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -16,6 +19,8 @@ TOKEN = "admin-shutdown-2024-token-secure"
 class TunnelTestController:
     def __init__(self):
         self.root = tk.Tk()
+        # Worker threads post UI changes here; drained once per frame on the Tk thread
+        self.dispatcher = TkDispatcher(self.root)
         self.root.title("Tunnel Restart Test Controller")
         self.root.geometry("500x400")
         
@@ -29,6 +34,14 @@ class TunnelTestController:
         self.url_entry = tk.Entry(url_frame, textvariable=self.url_var, width=60)
         self.url_entry.pack(pady=5)
         
+        # Cancel in-flight work for the old target whenever the URL changes
+        self.executor = executor.get_executor()
+        self.current_target = self.base_url()
+        self.url_var.trace_add("write", self.on_url_changed)
+        
+        # Follow the agent to its new URL when it publishes one after a restart (RSC_REGISTRY_URL)
+        self.registry_watcher = registry.watch(lambda record: self.dispatcher.call(self.on_tunnel_moved, record))
+        
         # Status frame
         status_frame = tk.Frame(self.root)
         status_frame.pack(pady=10)
@@ -87,12 +100,44 @@ class TunnelTestController:
         instructions.config(state=tk.DISABLED)
     
     def update_status(self, message, color="black"):
-        self.status_label.config(text=message, fg=color)
-        self.root.update()
+        if executor.current_job_cancelled():
+            return
+        self.dispatcher.post("status", self.status_label.config, text=message, fg=color)
+    
+    def base_url(self):
+        return self.url_var.get().rstrip('/')
+    
+    def on_url_changed(self, *args):
+        new_target = self.base_url()
+        if new_target != self.current_target:
+            self.executor.cancel(self.current_target)
+            self.current_target = new_target
+    
+    def on_tunnel_moved(self, record):
+        new_url = registry.follow(self.url_var.get(), record)
+        if not new_url:
+            return
+        self.url_var.set(new_url)
+        self.update_status(f"🔄 {registry.describe_move(record)}", "blue")
+        base_url = self.base_url()
+        self.executor.submit("reconnect", base_url, self.measure_reconnect, base_url, record["restarted_at"])
+    
+    def measure_reconnect(self, base_url, restarted_at):
+        """Report how long after the restart the new tunnel started answering"""
+        reconnect_ms = registry.measure_reconnect(base_url, restarted_at)
+        if reconnect_ms is None:
+            self.update_status("❌ New tunnel URL is not answering", "red")
+        else:
+            print(f"Reconnected to {base_url} {reconnect_ms:.0f} ms after restart")
+            self.update_status(f"✅ Reconnected {reconnect_ms:.0f} ms after tunnel restart", "green")
+    
+    def submit_request(self, endpoint, description):
+        """Queue a request on the shared executor; repeated clicks join the one in flight"""
+        base_url = self.base_url()
+        self.executor.submit(endpoint or "root", base_url, self.make_request, base_url, endpoint, description)
     
-    def make_request(self, endpoint, description):
+    def make_request(self, base_url, endpoint, description):
         """Make a request to the specified endpoint"""
-        base_url = self.url_var.get().rstrip('/')
         url = f"{base_url}/{endpoint}" if endpoint else base_url
         
         headers = {
@@ -104,37 +149,37 @@ class TunnelTestController:
         
         try:
             if endpoint == "":
-                response = requests.get(url, headers=headers, verify=False, timeout=10)
+                response = transport.get(url, headers=headers, verify=False)
             else:
-                response = requests.post(url, headers=headers, verify=False, timeout=10)
+                response = transport.post(url, headers=headers, verify=False)
             
             if response.status_code == 200:
                 self.update_status(f"✅ {description} successful!", "green")
-                messagebox.showinfo("Success", f"{description} successful!\n\nResponse: {response.json().get('message', 'No message')}")
+                self.dispatcher.dialog(messagebox.showinfo, "Success", f"{description} successful!\n\nResponse: {response.json().get('message', 'No message')}")
             else:
                 self.update_status(f"❌ {description} failed: {response.status_code}", "red")
-                messagebox.showerror("Error", f"{description} failed!\n\nStatus: {response.status_code}\nResponse: {response.text[:200]}")
+                self.dispatcher.dialog(messagebox.showerror, "Error", f"{description} failed!\n\nStatus: {response.status_code}\nResponse: {response.text[:200]}")
                 
         except requests.exceptions.ConnectionError:
             self.update_status("❌ Connection failed", "red")
-            messagebox.showerror("Connection Error", "Could not connect to tunnel. Check the URL.")
+            self.dispatcher.dialog(messagebox.showerror, "Connection Error", "Could not connect to tunnel. Check the URL.")
         except Exception as e:
             self.update_status("❌ Error occurred", "red")
-            messagebox.showerror("Error", str(e))
+            self.dispatcher.dialog(messagebox.showerror, "Error", str(e))
     
     def test_connection(self):
-        threading.Thread(target=lambda: self.make_request("", "Connection test"), daemon=True).start()
+        self.submit_request("", "Connection test")
     
     def restart_tunnel(self):
-        threading.Thread(target=lambda: self.make_request("restart-tunnel", "Tunnel restart"), daemon=True).start()
+        self.submit_request("restart-tunnel", "Tunnel restart")
     
     def test_command(self, command):
-        threading.Thread(target=lambda: self.make_request(command, f"Command '{command}' (should restart tunnel)"), daemon=True).start()
+        self.submit_request(command, f"Command '{command}' (should restart tunnel)")
     
     def custom_command(self):
         command = simpledialog.askstring("Custom Command", "Enter command to test:")
         if command:
-            threading.Thread(target=lambda: self.make_request(command, f"Custom command '{command}'"), daemon=True).start()
+            self.submit_request(command, f"Custom command '{command}'")
     
     def test_shutdown(self):
         result = messagebox.askyesno("⚠️ DANGER ⚠️", 
@@ -148,10 +193,12 @@ class TunnelTestController:
                                          "Click YES only if you're sure!",
                                          icon="warning")
             if result2:
-                threading.Thread(target=lambda: self.make_request("shutdown", "SHUTDOWN"), daemon=True).start()
+                self.submit_request("shutdown", "SHUTDOWN")
     
     def run(self):
         self.root.mainloop()
+        if self.registry_watcher:
+            self.registry_watcher.stop()
 
 if __name__ == "__main__":
     app = TunnelTestController()
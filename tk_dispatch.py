@@ -0,0 +1,98 @@
+# tk_dispatch.py - Thread-safe, coalesced UI updates for the Tkinter controllers
+#
+# Tkinter widgets must only be touched from the main thread. Worker threads
+# post updates here instead; a root.after() loop drains them once per frame.
+# Keyed updates (e.g. the status label) are merged so a burst of status
+# changes costs one redraw showing the latest state. They are applied before
+# ordered calls, so a status posted just before a call is already on screen.
+# Modal dialogs go through dialog(): they are started from their own after()
+# callback once the frame is drawn, so an open dialog never holds up a drain.
+# Ordered calls are never dropped; a frame runs at most MAX_CALLS_PER_FRAME of
+# them and leaves the rest, still in order, for the next one. Per-item bursts
+# (fleet results) should be batched behind a post() instead.
+import threading
+from collections import OrderedDict, deque
+
+# CONFIG - ~60 frames per second
+FRAME_INTERVAL_MS = 16
+MAX_CALLS_PER_FRAME = 500
+
+
+class TkDispatcher:
+    """Queue-drained dispatcher driven by root.after()"""
+
+    def __init__(self, root, interval_ms=FRAME_INTERVAL_MS, max_calls_per_frame=MAX_CALLS_PER_FRAME):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_calls_per_frame = max_calls_per_frame
+        self._lock = threading.Lock()
+        self._keyed = OrderedDict()         # key -> (fn, args, kwargs), latest wins
+        self._calls = deque()
+        self._dialogs = deque()
+        self.posted = 0                     # Updates received from any thread
+        self.merged = 0                     # Keyed updates replaced before being drawn
+        self.deferred = 0                   # Drain passes that left ordered calls for the next frame
+        self.applied = 0                    # Updates actually run on the Tk thread
+        self.frames = 0                     # Drain passes that redrew something
+        self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def post(self, key, fn, *args, **kwargs):
+        """Schedule fn on the Tk thread; a newer post with the same key replaces this one"""
+        with self._lock:
+            self.posted += 1
+            if key in self._keyed:
+                self.merged += 1
+                del self._keyed[key]
+            self._keyed[key] = (fn, args, kwargs)
+
+    def call(self, fn, *args, **kwargs):
+        """Schedule fn on the Tk thread; every call runs, in order"""
+        with self._lock:
+            self.posted += 1
+            self._calls.append((fn, args, kwargs))
+
+    def dialog(self, fn, *args, **kwargs):
+        """Show a blocking dialog (e.g. messagebox.showinfo) on the Tk thread without stalling updates"""
+        with self._lock:
+            self.posted += 1
+            self._dialogs.append((fn, args, kwargs))
+
+    def _drain(self):
+        # Schedule the next pass first, so updates keep flowing if anything below blocks
+        self._after_id = self.root.after(self.interval_ms, self._drain)
+        with self._lock:
+            keyed, self._keyed = list(self._keyed.values()), OrderedDict()
+            count = min(len(self._calls), self.max_calls_per_frame)
+            calls = [self._calls.popleft() for _ in range(count)]
+            if self._calls:
+                self.deferred += 1
+            dialogs = list(self._dialogs)
+            self._dialogs.clear()
+
+        for fn, args, kwargs in keyed + calls:
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"UI update failed: {e}")
+        if calls or keyed:
+            self.applied += len(calls) + len(keyed)
+            self.frames += 1
+            self.root.update_idletasks()
+        for fn, args, kwargs in dialogs:
+            self.applied += 1
+            self.root.after(0, lambda fn=fn, args=args, kwargs=kwargs: fn(*args, **kwargs))
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "posted": self.posted,
+                "applied": self.applied,
+                "merged": self.merged,
+                "deferred": self.deferred,
+                "frames": self.frames,
+            }
@@ -0,0 +1,404 @@
+# transport.py - Shared HTTP transport for every controller front-end
+#
+# All controllers (Tk, Kivy, test tools) send their commands through the
+# pooled session below instead of calling requests.get/post directly, so
+# Test Connection and Shutdown reuse the same keep-alive connection to the
+# Cloudflare edge instead of paying a new TCP+TLS handshake per click.
+#
+# Timeouts adapt to each target: every response feeds a per-origin and
+# per-endpoint RTT estimator (TCP-style SRTT/RTTVAR), and requests that don't
+# pass an explicit timeout get connect/read timeouts derived from it. A
+# Deadline can be passed to bound a whole operation, retries included.
+# Every outcome also feeds the target's circuit breaker (health.py), so a
+# target that keeps failing is refused immediately instead of timing out.
+#
+# Optional HTTP/2 mode (RSC_HTTP2=1, needs `pip install "httpx[http2]"`):
+# https requests go through one httpx client that negotiates h2 via ALPN, so
+# concurrent requests to the same tunnel host share a single TLS connection.
+# Hosts that only speak HTTP/1.1 are served by httpx's own 1.1 fallback, and
+# without httpx everything stays on the requests session.
+#
+# New connections resolve through netcache's DNS cache and resume the host's
+# last TLS session, so reconnecting after an idle drop skips the lookup and
+# the full handshake (see netcache.stats()).
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+
+import health
+import netcache
+
+try:
+    import h2  # noqa: F401 - httpx needs it for http2=True
+    import httpx
+except ImportError:
+    httpx = None
+
+# Disable SSL warnings when using verify=False
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# CONFIG - Pool tuning
+POOL_CONNECTIONS = 64     # Number of distinct hosts kept in the pool (fleet mode)
+POOL_MAXSIZE = 16         # Max idle keep-alive sockets per host
+DEFAULT_TIMEOUT = 10
+
+# CONFIG - Adaptive timeouts (seconds)
+DEFAULT_CONNECT_TIMEOUT = 3.0   # Connect timeout for a target we have no samples for yet
+MIN_CONNECT_TIMEOUT = 1.0
+MIN_READ_TIMEOUT = 1.5
+MAX_TIMEOUT = 30.0
+RTO_MULTIPLIER = 2.0            # Timeout = RTO x this, so one slow response isn't fatal
+
+# CONFIG - HTTP/2
+HTTP2_ENABLED = os.environ.get("RSC_HTTP2") == "1"
+HTTP2_MAX_CONNECTIONS = 4       # Per host; one is normally enough since streams multiplex
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """Create a requests session with keep-alive pooling tuned for the controllers"""
+    session = requests.Session()
+    adapter = netcache.CachingAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=False,
+        max_retries=0
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session():
+    """Close all pooled connections (e.g. after the network changed)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        netcache.clear()
+        for client in _h2_clients.values():
+            client.close()
+        _h2_clients.clear()
+
+
+# HTTP/2 ----------------------------------------------------------------------
+
+_h2_clients = {}            # verify -> httpx.Client
+_h2_stats = {"http2": 0, "http1": 0, "fallbacks": 0}
+_h2_fallback_hosts = set()  # Origins where the h2 client failed at the protocol level
+
+
+def http2_available():
+    return httpx is not None
+
+
+def set_http2(enabled):
+    """Turn HTTP/2 mode on or off; returns whether it is actually active"""
+    global HTTP2_ENABLED
+    HTTP2_ENABLED = bool(enabled)
+    if HTTP2_ENABLED and httpx is None:
+        print("HTTP/2 requested but httpx[http2] is not installed; staying on HTTP/1.1")
+    return HTTP2_ENABLED and httpx is not None
+
+
+def http2_stats():
+    """Requests sent per negotiated protocol by the HTTP/2 client, plus fallbacks to the requests session"""
+    with _session_lock:
+        return dict(_h2_stats, fallback_hosts=sorted(_h2_fallback_hosts))
+
+
+def _get_h2_client(verify):
+    with _session_lock:
+        client = _h2_clients.get(verify)
+        if client is None:
+            client = _h2_clients[verify] = httpx.Client(
+                http2=True, verify=verify, follow_redirects=True,
+                limits=httpx.Limits(max_connections=HTTP2_MAX_CONNECTIONS * POOL_CONNECTIONS,
+                                    max_keepalive_connections=POOL_MAXSIZE * 4),
+                headers={"Connection": "keep-alive"})
+        return client
+
+
+def _use_h2(url, kwargs):
+    if not HTTP2_ENABLED or httpx is None or not url.startswith("https://"):
+        return False
+    if kwargs.get("stream") or set(kwargs) - {"headers", "params", "json", "data", "timeout", "verify"}:
+        return False
+    return health.target_key(url) not in _h2_fallback_hosts and not requests.utils.get_environ_proxies(url)
+
+
+def _h2_fallback_error(method, error):
+    """True for h2 failures that happened before the request was written, so HTTP/1.1 may send it"""
+    if isinstance(error, (httpx.UnsupportedProtocol, httpx.LocalProtocolError)):
+        return True
+    # A protocol error on an idempotent request is safe to repeat even if it did go out
+    return method.upper() in ("GET", "HEAD", "OPTIONS") and isinstance(error, httpx.RemoteProtocolError)
+
+
+def _h2_request(method, url, timeout, verify=True, headers=None, params=None, json=None, data=None):
+    """Send through the httpx client and hand back a requests.Response so callers don't change"""
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    try:
+        reply = _get_h2_client(verify).request(
+            method, url, headers=headers, params=params, json=json, data=data,
+            timeout=httpx.Timeout(read, connect=connect, pool=connect))
+    except httpx.ConnectTimeout as e:
+        raise requests.exceptions.ConnectTimeout(str(e)) from e
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.ReadTimeout(str(e)) from e
+    except httpx.ConnectError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except httpx.TransportError as e:
+        if _h2_fallback_error(method, e):
+            raise                   # request() sends it again over HTTP/1.1
+        # Possibly after the request went out: a reset on POST /shutdown must not be re-sent silently
+        raise requests.exceptions.ConnectionError(str(e)) from e
+
+    response = requests.Response()
+    response.status_code = reply.status_code
+    response.reason = reply.reason_phrase
+    response.headers = CaseInsensitiveDict(reply.headers)
+    response._content = reply.content
+    response.encoding = reply.encoding
+    response.url = str(reply.url)
+    response.elapsed = reply.elapsed
+    with _session_lock:
+        _h2_stats["http2" if reply.http_version == "HTTP/2" else "http1"] += 1
+    return response
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The operation's overall deadline passed before (or while) sending a request"""
+
+
+class Deadline:
+    """Overall time budget for an operation, shared by all of its requests and retries"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def clamp(self, timeout):
+        """Shrink a (connect, read) timeout to what's left; raises DeadlineExceeded if nothing is"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.1f}s exceeded")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+
+class RttEstimator:
+    """Smoothed RTT and variance (RFC 6298) with exponential backoff after timeouts"""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.backoff = 1
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+        self.backoff = 1
+
+    def timed_out(self):
+        # Karn: no sample from a timed-out request, just back off until the next answer
+        self.backoff = min(self.backoff * 2, 8)
+
+    def rto(self):
+        return (self.srtt + self.K * self.rttvar) * self.backoff
+
+    def to_dict(self):
+        return {
+            "srtt_ms": round(self.srtt * 1000, 1),
+            "rttvar_ms": round(self.rttvar * 1000, 1),
+            "rto_ms": round(self.rto() * 1000, 1),
+            "samples": self.samples,
+        }
+
+
+_rtt = {}
+_rtt_lock = threading.Lock()
+
+
+def _rtt_keys(url):
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    return origin, (origin, parts.path.rstrip("/") or "/")
+
+
+def _estimators(url):
+    origin, endpoint = _rtt_keys(url)
+    with _rtt_lock:
+        return _rtt.setdefault(origin, RttEstimator()), _rtt.setdefault(endpoint, RttEstimator())
+
+
+def adaptive_timeout(url):
+    """(connect, read) timeout for url from measured RTTs; defaults until the target has answered"""
+    origin_est, endpoint_est = _estimators(url)
+    if not origin_est.samples:
+        return (DEFAULT_CONNECT_TIMEOUT, DEFAULT_TIMEOUT)
+    connect = min(max(origin_est.rto() * RTO_MULTIPLIER, MIN_CONNECT_TIMEOUT), MAX_TIMEOUT)
+    # An endpoint we haven't timed yet (e.g. a slow /restart-tunnel) gets the default read budget
+    if not endpoint_est.samples:
+        return (connect, max(DEFAULT_TIMEOUT, connect))
+    read = min(max(endpoint_est.rto() * RTO_MULTIPLIER, MIN_READ_TIMEOUT), MAX_TIMEOUT)
+    return (connect, read)
+
+
+def record_rtt(url, seconds):
+    """Feed a measured round trip into url's estimators"""
+    origin_est, endpoint_est = _estimators(url)
+    with _rtt_lock:
+        origin_est.update(seconds)
+        endpoint_est.update(seconds)
+
+
+def record_timeout(url):
+    origin_est, endpoint_est = _estimators(url)
+    with _rtt_lock:
+        origin_est.timed_out()
+        endpoint_est.timed_out()
+
+
+def rtt_stats():
+    """Current estimators, keyed by origin and by origin + path"""
+    with _rtt_lock:
+        return {key if isinstance(key, str) else "".join(key): est.to_dict()
+                for key, est in _rtt.items() if est.samples}
+
+
+def request(method, url, deadline=None, **kwargs):
+    """Send a request through the shared pool
+
+    Without an explicit timeout the connect/read timeouts come from the
+    target's measured RTT. A Deadline caps them to the operation's remaining time.
+    Raises health.CircuitOpenError, without sending, while the target's circuit is open.
+    """
+    if kwargs.get("timeout") is None:
+        kwargs["timeout"] = adaptive_timeout(url)
+    if deadline is not None:
+        kwargs["timeout"] = deadline.clamp(kwargs["timeout"])
+    monitor = health.get_monitor()
+    monitor.check(url)
+    try:
+        response = None
+        if _use_h2(url, kwargs):
+            try:
+                response = _h2_request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                # Protocol trouble before anything was sent: use the requests session for this host from now on
+                print(f"HTTP/2 failed for {health.target_key(url)} ({e.__class__.__name__}), falling back to HTTP/1.1")
+                with _session_lock:
+                    _h2_stats["fallbacks"] += 1
+                    _h2_fallback_hosts.add(health.target_key(url))
+        if response is None:
+            response = get_session().request(method, url, **kwargs)
+    except requests.exceptions.Timeout:
+        record_timeout(url)
+        monitor.record(url, False)
+        raise
+    except requests.exceptions.ConnectionError:
+        monitor.record(url, False)
+        raise
+    except Exception:
+        monitor.record(url, None)
+        raise
+    monitor.record_response(url, response)
+    if not kwargs.get("stream"):
+        record_rtt(url, response.elapsed.total_seconds())
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def warm(url, verify=False, timeout=None):
+    """Pre-resolve and open a pooled connection to url's host ahead of a request
+
+    Called while a confirmation dialog is showing, so the request sent when the
+    user taps YES goes out on an already-connected keep-alive socket instead of
+    paying DNS + TCP + TLS after the tap. Returns the time spent connecting in
+    ms, 0.0 if an idle connection was already pooled, or None if warming was
+    skipped (proxied URL) or failed. timeout bounds the connect attempt.
+    """
+    if requests.utils.get_environ_proxies(url):
+        return None
+    monitor = health.get_monitor()
+    try:
+        monitor.check(url)
+    except health.CircuitOpenError:
+        return None
+    adapter = get_session().get_adapter(url)
+    try:
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            prepared = requests.Request("HEAD", url).prepare()
+            pool = adapter.get_connection_with_tls_context(prepared, verify)
+        else:
+            pool = adapter.get_connection(url)
+            adapter.cert_verify(pool, url, verify, None)
+        conn = pool._get_conn()
+        if timeout is not None:
+            conn.timeout = timeout
+    except Exception as e:
+        print(f"Warm-up skipped for {url}: {e}")
+        monitor.record(url, None)
+        return None
+
+    start = time.perf_counter()
+    try:
+        if getattr(conn, "sock", None) is not None:
+            monitor.record(url, True)
+            return 0.0
+        conn.connect()
+        monitor.record(url, True)
+        return (time.perf_counter() - start) * 1000
+    except Exception as e:
+        print(f"Warm-up failed for {url}: {e}")
+        monitor.record(url, False)
+        conn.close()
+        return None
+    finally:
+        # Hand the (possibly still unconnected) connection back so the pool
+        # keeps its size; the next request on this host picks it up
+        pool._put_conn(conn)
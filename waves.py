@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Wave-based rollout of mass commands with automatic abort
+
+Sending /reboot or /restart-tunnel to a whole fleet at once is risky and
+saturates the tunnel edge. A rollout sends the command in waves, e.g. 5% of the
+targets, then up to 25%, then the rest. Each wave runs through a FleetRunner
+with bounded concurrency. Between waves the error rate and p95 latency of the
+last wave are checked, and the rollout halts when either crosses its threshold.
+A wave is also cut short as soon as its failures alone exceed the error
+budget. Targets that were never sent anything are listed in the report.
+
+    python waves.py reboot -f hosts.txt --waves 5,25,100 --yes
+    python waves.py restart-tunnel -f hosts.txt --concurrency 8 --max-error-rate 0.05 --max-p95 3000 --yes
+    python waves.py reboot --demo 200 --demo-error-rate 0.3 --yes    # local stand-in, watch it halt
+
+Exit codes: 0 every target ok, 1 halted or some targets failed, 2 usage error.
+"""
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+
+import commands
+import fleet
+from stats import percentile
+
+# CONFIG - Rollout defaults
+DEFAULT_WAVES = (0.05, 0.25, 1.0)   # Cumulative share of the targets done after each wave
+DEFAULT_CONCURRENCY = 16            # Per wave
+MAX_ERROR_RATE = 0.10               # Halt when a wave fails more often than this
+MAX_P95_MS = 5000                   # Halt when a wave's p95 latency is above this
+WAVE_PAUSE = 2.0                    # Seconds between waves, so a problem can show up in /status
+MIN_ERRORS_TO_HALT = 2              # A single failure in a tiny first wave isn't enough to stop
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def plan_waves(targets, fractions=DEFAULT_WAVES):
+    """Split targets into waves by cumulative fractions; every wave gets at least one target"""
+    waves, done = [], 0
+    for fraction in fractions:
+        end = len(targets) if fraction >= 1 else min(len(targets), max(done + 1, math.ceil(len(targets) * fraction)))
+        if end > done:
+            waves.append(targets[done:end])
+            done = end
+    if done < len(targets):
+        waves.append(targets[done:])
+    return waves
+
+
+class WaveStats:
+    """Success and latency figures for one wave"""
+
+    def __init__(self, index, size, summary):
+        self.index = index
+        self.size = size                    # Targets planned for the wave
+        self.results = summary.results
+        self.elapsed = summary.elapsed
+        self.cut_short = summary.cancelled
+
+    @property
+    def sent(self):
+        return len(self.results)
+
+    @property
+    def failed(self):
+        return sum(1 for r in self.results if not r.ok)
+
+    @property
+    def error_rate(self):
+        return self.failed / self.sent if self.sent else 0.0
+
+    def p95_ms(self):
+        value = percentile([r.elapsed for r in self.results], 0.95)
+        return None if value is None else value * 1000
+
+    def to_dict(self):
+        latencies = [r.elapsed * 1000 for r in self.results]
+        return {
+            "wave": self.index + 1,
+            "planned": self.size,
+            "sent": self.sent,
+            "failed": self.failed,
+            "error_rate": round(self.error_rate, 4),
+            "p50_ms": round(percentile(latencies, 0.50), 1) if latencies else None,
+            "p95_ms": round(self.p95_ms(), 1) if latencies else None,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "throughput_per_s": round(self.sent / self.elapsed, 1) if self.elapsed else None,
+            "cut_short": self.cut_short,
+        }
+
+    def describe(self):
+        p95 = self.p95_ms()
+        return (f"Wave {self.index + 1}: {self.sent - self.failed}/{self.sent} ok, "
+                f"p95 {p95:.0f} ms" if p95 is not None else f"Wave {self.index + 1}: nothing sent")
+
+
+class RolloutReport:
+    """All waves of a rollout, why it halted (if it did) and what was never sent"""
+
+    def __init__(self, waves, not_sent, elapsed, halted=None, cancelled=False):
+        self.waves = waves
+        self.not_sent = not_sent
+        self.elapsed = elapsed
+        self.halted = halted                # Reason text, None if it ran to the end
+        self.cancelled = cancelled
+
+    @property
+    def sent(self):
+        return sum(wave.sent for wave in self.waves)
+
+    @property
+    def succeeded(self):
+        return sum(wave.sent - wave.failed for wave in self.waves)
+
+    @property
+    def ok(self):
+        return not self.halted and not self.cancelled and not self.not_sent and self.succeeded == self.sent
+
+    def describe(self):
+        text = f"{self.succeeded}/{self.sent} succeeded in {len(self.waves)} wave(s), {self.elapsed:.1f}s"
+        if self.halted:
+            text += f" - halted: {self.halted} ({len(self.not_sent)} not sent)"
+        elif self.cancelled:
+            text += " (cancelled)"
+        return text
+
+    def to_dict(self):
+        return {
+            "ok": self.ok,
+            "sent": self.sent,
+            "succeeded": self.succeeded,
+            "halted": self.halted,
+            "cancelled": self.cancelled,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "throughput_per_s": round(self.sent / self.elapsed, 1) if self.elapsed else None,
+            "waves": [wave.to_dict() for wave in self.waves],
+            "not_sent": self.not_sent,
+        }
+
+
+class WaveRollout:
+    """Send one command to many targets in growing waves, halting on errors or slow responses"""
+
+    def __init__(self, token, command="reboot", fractions=DEFAULT_WAVES, concurrency=DEFAULT_CONCURRENCY,
+                 max_error_rate=MAX_ERROR_RATE, max_p95_ms=MAX_P95_MS, pause=WAVE_PAUSE,
+                 user_agent=commands.USER_AGENT):
+        self.token = token
+        self.command = command
+        self.fractions = fractions
+        self.concurrency = concurrency
+        self.max_error_rate = max_error_rate
+        self.max_p95_ms = max_p95_ms
+        self.pause = pause
+        self.user_agent = user_agent
+        self._cancel = threading.Event()
+        self._runner = None
+
+    def cancel(self):
+        """Stop after the targets already in flight; no further waves start"""
+        self._cancel.set()
+        if self._runner:
+            self._runner.cancel()
+
+    def check(self, stats):
+        """Reason to halt after this wave, or None"""
+        if stats.failed >= MIN_ERRORS_TO_HALT and stats.error_rate > self.max_error_rate:
+            return f"wave {stats.index + 1} error rate {stats.error_rate:.0%} > {self.max_error_rate:.0%}"
+        p95 = stats.p95_ms()
+        if self.max_p95_ms and p95 is not None and p95 > self.max_p95_ms:
+            return f"wave {stats.index + 1} p95 {p95:.0f} ms > {self.max_p95_ms:.0f} ms"
+        return None
+
+    def _run_wave(self, wave, on_result):
+        runner = fleet.FleetRunner(self.token, self.concurrency, self.command, self.user_agent)
+        self._runner = runner
+        budget = max(MIN_ERRORS_TO_HALT, math.floor(len(wave) * self.max_error_rate) + 1)
+        failures = [0]
+        lock = threading.Lock()
+
+        def result(r):
+            if not r.ok:
+                with lock:
+                    failures[0] += 1
+                    if failures[0] >= budget:
+                        runner.cancel()     # Already over the error budget whatever the rest does
+            if on_result:
+                on_result(r)
+        return runner.run(wave, result)
+
+    def run(self, targets, on_result=None, on_wave=None):
+        """Run every wave (blocking) and return a RolloutReport; on_wave(stats) follows each wave"""
+        start = time.perf_counter()
+        waves = plan_waves(list(targets), self.fractions)
+        done, halted = [], None
+        for index, wave in enumerate(waves):
+            if self._cancel.is_set():
+                break
+            summary = self._run_wave(wave, on_result)
+            stats = WaveStats(index, len(wave), summary)
+            done.append(stats)
+            halted = self.check(stats)
+            if on_wave:
+                on_wave(stats)
+            if halted or index == len(waves) - 1:
+                break
+            self._cancel.wait(self.pause)
+        sent = {r.target for stats in done for r in stats.results}
+        not_sent = [target for target in targets if commands.base_url(target) not in sent]
+        return RolloutReport(done, not_sent, time.perf_counter() - start, halted, self._cancel.is_set())
+
+    def run_in_background(self, targets, on_result=None, on_wave=None, on_done=None):
+        """Run on a daemon thread; on_done receives the RolloutReport"""
+        def worker():
+            report = self.run(targets, on_result, on_wave)
+            if on_done:
+                on_done(report)
+        threading.Thread(target=worker, daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roll a command out to many targets in waves")
+    parser.add_argument("command", help="reboot, restart-tunnel, shutdown, ...")
+    parser.add_argument("targets", nargs="*", help="Target URLs")
+    parser.add_argument("-f", "--file", action="append", default=[], dest="files",
+                        help="File with one target per line ('-' for stdin)")
+    parser.add_argument("--token", default="admin-shutdown-2024-token-secure")
+    parser.add_argument("--waves", default="5,25,100", help="Cumulative percentages per wave")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requests in flight per wave")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE)
+    parser.add_argument("--max-p95", type=float, default=MAX_P95_MS, help="Halt above this p95 latency (ms)")
+    parser.add_argument("--pause", type=float, default=WAVE_PAUSE, help="Seconds between waves")
+    parser.add_argument("--demo", type=int, metavar="N", help="Roll out to N addresses of a local stand-in")
+    parser.add_argument("--demo-error-rate", type=float, default=0.0)
+    parser.add_argument("--yes", action="store_true", help="Really send the command (required)")
+    args = parser.parse_args(argv)
+
+    try:
+        fractions = [float(value) / 100 for value in args.waves.split(",")]
+    except ValueError:
+        parser.error("--waves takes comma separated percentages, e.g. 5,25,100")
+
+    agent = None
+    if args.demo:
+        from stand_in_agent import StandInAgent
+        agent = StandInAgent(host="0.0.0.0", token=args.token, latency=0.05, jitter=0.02,
+                             error_rate=args.demo_error_rate, fault_codes=(500,), rotate_url=False)
+        port = agent.start().rsplit(":", 1)[1]
+        # Distinct loopback addresses, so every "target" gets its own pool and circuit breaker
+        targets = [f"http://127.0.{i // 250}.{i % 250 + 1}:{port}" for i in range(args.demo)]
+    else:
+        text = "\n".join(args.targets)
+        for path in args.files:
+            with (sys.stdin if path == "-" else open(path, "r", encoding="utf-8")) as f:
+                text += "\n" + f.read()
+        targets = commands.parse_targets(text)
+    if not targets:
+        print("No targets given", file=sys.stderr)
+        return EXIT_USAGE
+    waves = plan_waves(targets, fractions)
+    print(f"{len(targets)} targets in {len(waves)} waves: {', '.join(str(len(w)) for w in waves)}", file=sys.stderr)
+    if not args.yes:
+        print(f"Add --yes to send {args.command}", file=sys.stderr)
+        return EXIT_USAGE
+
+    rollout = WaveRollout(args.token, args.command, fractions, args.concurrency, args.max_error_rate,
+                          args.max_p95, args.pause)
+    report = rollout.run(targets, on_wave=lambda stats: print(stats.describe(), file=sys.stderr, flush=True))
+    if agent:
+        agent.stop()
+    print(report.describe(), file=sys.stderr)
+    print(json.dumps(report.to_dict(), indent=2))
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())